@@ -0,0 +1,46 @@
+"""
+Database configuration
+DATABASE_ENGINE=postgresql selects PostgreSQL with persistent, health-checked connections
+(POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_PORT, CONN_MAX_AGE),
+anything else SQLite at SQLITE_PATH, tuned for concurrent access by configure_sqlite().
+"""
+
+import os
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # readers no longer block the writer and vice versa
+    'synchronous': 'NORMAL',  # safe with WAL, fsync only at checkpoints
+    'busy_timeout': 5000,  # wait for a lock up to 5 s instead of failing with "database is locked"
+    'mmap_size': 128 * 1024 * 1024,
+}
+
+
+def get_database_config(base_dir, environ=os.environ):
+    if environ.get('DATABASE_ENGINE') == 'postgresql':
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': environ.get('POSTGRES_DB', 'mygamediary'),
+            'USER': environ.get('POSTGRES_USER', 'mygamediary'),
+            'PASSWORD': environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(environ.get('CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': environ.get('SQLITE_PATH', base_dir / 'db.sqlite3'),
+        'CONN_MAX_AGE': int(environ.get('CONN_MAX_AGE', 0)),
+        'OPTIONS': {'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000},
+    }
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    connection_created receiver applying SQLITE_PRAGMAS to every new SQLite connection
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
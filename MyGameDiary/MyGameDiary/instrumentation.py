@@ -0,0 +1,183 @@
+"""
+Request instrumentation
+QueryInstrumentationMiddleware records the SQL queries, repeated queries, DB time and total time of a sampled
+share of requests (INSTRUMENTATION_SAMPLE_RATE) and tags them with the URL name. Every sampled request gets
+Server-Timing and X-Query-Count headers and a structured log record; per-view totals are kept in the cache
+for the admin summary page. Queries are counted with an execute wrapper, so DEBUG is not needed.
+Every total is its own cache key updated with cache.incr(), so concurrent requests do not overwrite each
+other's samples (maxima are plain get/set and may miss a concurrent peak). The summary lives in the default
+cache: with locmem it is per process and covers only the worker serving the summary page; incr() is atomic
+across processes with memcached or redis, the file and db backends may still lose a concurrent sample.
+"""
+
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = 'instrumentation'
+VIEW_COUNT_KEY = f'{SUMMARY_PREFIX}:views'
+SUMMARY_FIELDS = ['requests', 'queries', 'duplicates', 'db_us', 'total_us']  # integers, so incr() can add them
+MAXIMUM_FIELDS = ['max_queries', 'max_total_ms']
+
+
+class QueryRecorder:
+    """
+    Execute wrapper counting queries and their time; statements differing only in parameters are repeats
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+    def most_repeated(self):
+        if not self.statements:
+            return None
+        sql, count = self.statements.most_common(1)[0]
+        return {'sql': sql, 'count': count} if count > 1 else None
+
+
+def get_view_name(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    return resolver_match.view_name if resolver_match else '<unresolved>'
+
+
+def get_key(view_name, field):
+    return f'{SUMMARY_PREFIX}:{view_name}:{field}'
+
+
+def get_slot_key(slot):
+    return f'{SUMMARY_PREFIX}:view:{slot}'
+
+
+def add(key, delta):
+    if not cache.add(key, delta, timeout=None):
+        try:
+            cache.incr(key, delta)
+        except ValueError:  # evicted since add()
+            cache.add(key, delta, timeout=None)
+
+
+def register(view_name):
+    """
+    Give a view seen for the first time a numbered slot, so get_summary() can list the views without a shared list
+    """
+    if cache.add(get_key(view_name, 'registered'), True, timeout=None):
+        cache.add(VIEW_COUNT_KEY, 0, timeout=None)
+        cache.set(get_slot_key(cache.incr(VIEW_COUNT_KEY)), view_name, timeout=None)
+
+
+def record(view_name, measurement):
+    """
+    Add a request to the per-view totals
+    """
+    register(view_name)
+    values = {'requests': 1, 'queries': measurement['queries'], 'duplicates': measurement['duplicates'],
+              'db_us': round(measurement['db_ms'] * 1000), 'total_us': round(measurement['total_ms'] * 1000)}
+    for field, value in values.items():
+        add(get_key(view_name, field), value)
+    for field, value in (('max_queries', measurement['queries']), ('max_total_ms', measurement['total_ms'])):
+        if value > cache.get(get_key(view_name, field), 0):
+            cache.set(get_key(view_name, field), value, timeout=None)
+
+
+def get_view_names():
+    slot_keys = [get_slot_key(slot) for slot in range(1, (cache.get(VIEW_COUNT_KEY) or 0) + 1)]
+    return list(dict.fromkeys(cache.get_many(slot_keys).values()))
+
+
+def get_summary():
+    """
+    Return per-view averages and maxima as a list of dicts
+    """
+    view_names = get_view_names()
+    values = cache.get_many([get_key(view_name, field) for view_name in view_names
+                             for field in SUMMARY_FIELDS + MAXIMUM_FIELDS])
+    rows = []
+    for view_name in view_names:
+        totals = {field: values.get(get_key(view_name, field), 0) for field in SUMMARY_FIELDS + MAXIMUM_FIELDS}
+        requests = totals['requests']
+        if not requests:
+            continue
+        rows.append({
+            'view_name': view_name,
+            'requests': requests,
+            'avg_queries': totals['queries'] / requests,
+            'avg_duplicates': totals['duplicates'] / requests,
+            'avg_db_ms': totals['db_us'] / requests / 1000,
+            'avg_total_ms': totals['total_us'] / requests / 1000,
+            'max_queries': totals['max_queries'],
+            'max_total_ms': totals['max_total_ms'],
+        })
+    return rows
+
+
+def reset_summary():
+    count = cache.get(VIEW_COUNT_KEY) or 0
+    keys = [get_key(view_name, field) for view_name in get_view_names()
+            for field in SUMMARY_FIELDS + MAXIMUM_FIELDS + ['registered']]
+    cache.delete_many(keys + [get_slot_key(slot) for slot in range(1, count + 1)] + [VIEW_COUNT_KEY])
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Opt-in with INSTRUMENTATION_ENABLED. Put it first in MIDDLEWARE, so the total time covers the whole stack.
+    """
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.INSTRUMENTATION_SAMPLE_RATE
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        measurement = {
+            'view_name': get_view_name(request),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'duplicates': recorder.duplicates,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+        }
+        response['Server-Timing'] = f"db;dur={measurement['db_ms']}, total;dur={measurement['total_ms']}"
+        response['X-Query-Count'] = recorder.count
+        response['X-Duplicate-Queries'] = recorder.duplicates
+
+        level = logging.WARNING if measurement['total_ms'] >= settings.INSTRUMENTATION_SLOW_MS else logging.INFO
+        logger.log(level, json.dumps({**measurement, 'most_repeated': recorder.most_repeated()}))
+        record(measurement['view_name'], measurement)
+        return response
@@ -0,0 +1,158 @@
+"""
+Keyset (cursor) pagination for list views
+Pages are selected by comparing the sort key with the key of the last/first row of the previous page
+instead of OFFSET, so every page costs the same however deep it is. Tokens are signed key values.
+"""
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import F, Q
+
+TOKEN_SALT = 'keyset-pagination'
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_token=None, previous_token=None):
+        self.object_list = object_list
+        self.next_token = next_token
+        self.previous_token = previous_token
+        self.next_querystring = None
+        self.previous_querystring = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_token is not None
+
+    def has_previous(self):
+        return self.previous_token is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset ordered by `ordering` (ascending field names, may be nullable; NULLs sort first).
+    The primary key is appended as the final tie-breaker, so the sort key is unique.
+    """
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.fields = [field for field in ordering if field != 'pk'] + ['pk']
+        self.per_page = per_page
+
+    def get_key(self, obj):
+        key = []
+        for field in self.fields:
+            value = obj
+            for attribute in field.split('__'):
+                value = getattr(value, attribute) if value is not None else None
+            key.append(value)
+        return key
+
+    @staticmethod
+    def encode(key):
+        return signing.dumps(key, salt=TOKEN_SALT, compress=True)
+
+    @staticmethod
+    def decode(token):
+        try:
+            return signing.loads(token, salt=TOKEN_SALT)
+        except signing.BadSignature:
+            return None
+
+    def order(self, reverse=False):
+        if reverse:
+            return [F(field).desc(nulls_last=True) for field in self.fields]
+        return [F(field).asc(nulls_first=True) for field in self.fields]
+
+    @staticmethod
+    def equal(field, value):
+        return Q(**{f'{field}__isnull': True}) if value is None else Q(**{field: value})
+
+    @staticmethod
+    def greater(field, value):
+        return Q(**{f'{field}__isnull': False}) if value is None else Q(**{f'{field}__gt': value})
+
+    @staticmethod
+    def less(field, value):
+        if value is None:
+            return Q(pk__in=[])
+        return Q(**{f'{field}__lt': value}) | Q(**{f'{field}__isnull': True})
+
+    def seek(self, key, compare):
+        """
+        Rows whose sort key compares to key, e.g. (a > x) | (a = x & b > y) | (a = x & b = y & pk > z)
+        """
+        condition = Q(pk__in=[])
+        for position, (field, value) in enumerate(zip(self.fields, key)):
+            branch = compare(field, value)
+            for previous_field, previous_value in zip(self.fields[:position], key[:position]):
+                branch &= self.equal(previous_field, previous_value)
+            condition |= branch
+        return condition
+
+    def page(self, after=None, before=None):
+        """
+        The page following the `after` token, preceding the `before` token, or the first page.
+        Invalid tokens select the first page.
+        """
+        key = self.decode(before or after) if (before or after) else None
+        if key is not None and len(key) != len(self.fields):
+            key = None
+        backwards = key is not None and bool(before)
+
+        queryset = self.queryset.order_by(*self.order(reverse=backwards))
+        if key is not None:
+            queryset = queryset.filter(self.seek(key, self.less if backwards else self.greater))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage(rows)
+        first_token, last_token = self.encode(self.get_key(rows[0])), self.encode(self.get_key(rows[-1]))
+        if backwards:
+            return KeysetPage(rows, next_token=last_token, previous_token=first_token if has_more else None)
+        return KeysetPage(rows, next_token=last_token if has_more else None,
+                          previous_token=first_token if key is not None else None)
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin: ?after=<token> / ?before=<token> select the page, ?size=<number> its size
+    (PAGE_SIZE by default, at most MAX_PAGE_SIZE). `keyset_ordering` defaults to the model ordering.
+    """
+    keyset_ordering = None
+
+    def get_paginate_by(self, queryset):
+        try:
+            size = int(self.request.GET.get('size', settings.PAGE_SIZE))
+        except ValueError:
+            size = settings.PAGE_SIZE
+        return max(1, min(size, settings.MAX_PAGE_SIZE))
+
+    def get_keyset_ordering(self, queryset):
+        return self.keyset_ordering or queryset.model._meta.ordering
+
+    def get_querystring(self, **params):
+        query = self.request.GET.copy()
+        for name in ('after', 'before'):
+            query.pop(name, None)
+        query.update(params)
+        return query.urlencode()
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.get_keyset_ordering(queryset), page_size)
+        page = paginator.page(after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        if page.has_next():
+            page.next_querystring = self.get_querystring(after=page.next_token)
+        if page.has_previous():
+            page.previous_querystring = self.get_querystring(before=page.previous_token)
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 import os
 
+from MyGameDiary.db import get_database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -54,11 +56,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'MyGameDiary.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'MyGameDiary.compression.CompressionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'players_app.roles.RoleCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -87,13 +93,50 @@ WSGI_APPLICATION = 'MyGameDiary.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# DATABASE_ENGINE=postgresql selects PostgreSQL, see MyGameDiary/db.py for the other variables
+
 DATABASES = {
+    'default': get_database_config(BASE_DIR),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# CACHE_BACKEND=locmem (default, per process), file (shared by processes on one machine)
+# or db (shared, run `python manage.py createcachetable` first)
+# With locmem the user's groups are not kept in the session (see players_app.roles), as their invalidation
+# would not reach the other processes
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mygamediary',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', BASE_DIR / 'cache'),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', 'cache_table'),
+    },
+}
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        **CACHE_BACKENDS[os.getenv('CACHE_BACKEND', 'locmem')],
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
 
+CATALOGUE_CACHE_TIMEOUT = 15 * 60
+
+DATA_VERSION_TIMEOUT = 5  # seconds a process reuses the catalogue and statistics versions read from the database
+
+SITE_STATS_CACHE_TIMEOUT = 5 * 60  # invalidated on every change, the timeout only bounds drift
+
+PUBLIC_PAGE_MAX_AGE = 60  # browsers and proxies may reuse anonymous catalogue pages without revalidating
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -142,6 +185,82 @@ STATICFILES_FINDERS = [
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',
 ]
 
+# Uploaded and mirrored files (cover variants in MEDIA_ROOT/covers)
+
+MEDIA_URL = '/media/'
+
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
+
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60  # mirrored file names are content-hashed, so they can be cached for good
+
+# Cover mirror (python manage.py mirror_covers, COVER_MIRROR_ON_IMPORT=1 mirrors new games while importing them)
+
+COVER_MIRROR_ON_IMPORT = os.getenv('COVER_MIRROR_ON_IMPORT') == '1'
+
+COVER_DOWNLOAD_TIMEOUT = 10
+
+COVER_MAX_BYTES = 5 * 1024 * 1024
+
+# Background jobs (python manage.py run_jobs)
+
+JOB_MAX_ATTEMPTS = 3
+
+JOB_RETRY_BACKOFF = 30  # seconds before the first retry, doubled with every further attempt
+
+JOB_POLL_INTERVAL = 2  # seconds the worker sleeps when no job is due
+
+JOB_TIMEOUT = 15 * 60  # running jobs older than this are considered abandoned and queued again
+
+# IGDB API response cache (set IGDB_CACHE_PATH to None to disable)
+# IGDB_CACHE_OFFLINE=1 serves responses from the cache only, without any network traffic
+# Searches, rating refreshes and catalogue syncs always ask IGDB, they only store their responses
+
+IGDB_CACHE_PATH = BASE_DIR / 'igdb_cache.sqlite3'
+
+IGDB_CACHE_TTLS = {}  # per-endpoint overrides in seconds, e.g. {'games': 3600}
+
+IGDB_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+IGDB_CACHE_OFFLINE = os.getenv('IGDB_CACHE_OFFLINE') == '1'
+
+# IGDB API transport: 429 and 5xx responses, timeouts and connection errors are retried with jittered backoff,
+# after IGDB_CIRCUIT_THRESHOLD failed calls in a row IGDB is not called for IGDB_CIRCUIT_RESET_TIMEOUT seconds
+
+IGDB_TIMEOUT = (3.05, 20)  # connect and read timeout in seconds
+
+IGDB_MAX_RETRIES = 3
+
+IGDB_CIRCUIT_THRESHOLD = 5
+
+IGDB_CIRCUIT_RESET_TIMEOUT = 30
+
+# List pagination (?size= may change the page size up to MAX_PAGE_SIZE)
+
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 50))
+
+MAX_PAGE_SIZE = 200
+
+# Request instrumentation (opt-in with INSTRUMENTATION=1)
+# Records queries, repeated queries, DB time and total time of a sampled share of requests,
+# summarised per view on the admin instrumentation page (per process with CACHE_BACKEND=locmem)
+
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION') == '1'
+
+INSTRUMENTATION_SAMPLE_RATE = float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', 1.0))
+
+INSTRUMENTATION_SLOW_MS = 500  # slower requests are logged as warnings
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'MyGameDiary.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
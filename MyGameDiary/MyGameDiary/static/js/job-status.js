@@ -0,0 +1,25 @@
+const jobElement = document.querySelector("[data-job-status-url]");
+const jobListElement = document.querySelector("[data-job-list-refresh]");
+const jobPollDelay = 2000;
+
+function pollJobStatus() {
+    fetch(jobElement.dataset.jobStatusUrl, {headers: {"Accept": "application/json"}})
+        .then(response => response.json())
+        .then(job => {
+            if (job.finished) {
+                window.location.reload();
+                return;
+            }
+            jobElement.querySelector(".job-status").innerText = job.status;
+            jobElement.querySelector(".job-progress").innerText = job.progress;
+            setTimeout(pollJobStatus, jobPollDelay);
+        })
+        .catch(() => setTimeout(pollJobStatus, jobPollDelay * 5));
+}
+
+if (jobElement) {
+    setTimeout(pollJobStatus, jobPollDelay);
+}
+if (jobListElement) {
+    setTimeout(() => window.location.reload(), Number(jobListElement.dataset.jobListRefresh));
+}
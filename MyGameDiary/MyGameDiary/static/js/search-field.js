@@ -1,38 +1,96 @@
 const searchElement = document.querySelector("#search");
+const searchUrl = searchElement.dataset.searchUrl;
+const searchDelay = 250;
 
-searchElement.addEventListener("input", function() {
-    const gameElements = document.querySelectorAll(".game");
-    let show;
-
-    gameElements.forEach(game => {
-        show = false;
-        const highlightElements = game.querySelectorAll(".highlight")
-
-        highlightElements.forEach(highlightElement => {
-            const index = highlightElement.innerText.toLowerCase().indexOf(searchElement.value.toLowerCase());
-            if(searchElement.value.length > 0) {
-                if (index >= 0) {
-                    show = true;
-                    highlightElement.classList.remove('text-white');
-                    highlightElement.classList.add('text-warning');
-                } else {
-                    highlightElement.classList.remove('text-warning');
-                    highlightElement.classList.add('text-white');
-                }
-            } else {
-                show = true;
-                highlightElement.classList.remove('text-warning');
-                highlightElement.classList.add('text-white');
+// Server-side search: the rendered games are replaced by the results of the search endpoint
+const resultsElement = document.querySelector("#search-results");
+const moreElement = document.querySelector("#search-more");
+let searchTimer = null;
+let searchController = null;
+let nextPage = null;
+
+function setRenderedGamesVisible(visible) {
+    document.querySelectorAll(".game").forEach(game => {
+        game.classList.toggle('d-none', !visible);
+        game.classList.toggle('d-flex', visible);
+    });
+}
+
+function renderResult(result) {
+    const row = document.createElement("div");
+    row.className = "d-flex w-100 justify-content-start align-items-center bg-dark p-2 mt-1 rounded";
+
+    const coverLink = document.createElement("a");
+    coverLink.href = result.url;
+    coverLink.style.width = "8%";
+    const cover = document.createElement("img");
+    cover.src = result.cover_url;
+    cover.alt = `${result.name} cover`;
+    cover.width = 60;
+    cover.className = "border rounded";
+    coverLink.appendChild(cover);
+
+    const title = document.createElement("div");
+    title.className = "text-white";
+    const nameLink = document.createElement("a");
+    nameLink.href = result.url;
+    nameLink.className = "text-warning text-uppercase fs-5";
+    nameLink.textContent = `${result.name} (${result.year})`;
+    title.appendChild(nameLink);
+    if (result.franchise) {
+        const franchise = document.createElement("div");
+        franchise.style.fontSize = "16px";
+        franchise.textContent = `Franchise: ${result.franchise}`;
+        title.appendChild(franchise);
+    }
+
+    row.append(coverLink, title);
+    resultsElement.appendChild(row);
+}
+
+function fetchResults(page) {
+    if (searchController) {
+        searchController.abort();
+    }
+    searchController = new AbortController();
+    const params = new URLSearchParams({q: searchElement.value, page: page});
+    fetch(`${searchUrl}?${params}`, {signal: searchController.signal})
+        .then(response => response.json())
+        .then(data => {
+            if (data.page === 1) {
+                resultsElement.replaceChildren();
+            }
+            data.results.forEach(renderResult);
+            nextPage = data.next;
+            moreElement.classList.toggle('d-none', nextPage === null);
+        })
+        .catch(error => {
+            if (error.name !== 'AbortError') {
+                console.error(error);
             }
         });
+}
 
-        if (show) {
-           game.classList.remove('d-none');
-           game.classList.add('d-flex');
-        } else {
-           game.classList.remove('d-flex');
-           game.classList.add('d-none');
+function searchGames() {
+    clearTimeout(searchTimer);
+    if (searchElement.value.trim().length === 0) {
+        if (searchController) {
+            searchController.abort();
         }
-    });
+        resultsElement.replaceChildren();
+        moreElement.classList.add('d-none');
+        setRenderedGamesVisible(true);
+        return;
+    }
+    setRenderedGamesVisible(false);
+    searchTimer = setTimeout(() => fetchResults(1), searchDelay);
+}
 
-});
\ No newline at end of file
+if (searchUrl) {
+    searchElement.addEventListener("input", searchGames);
+    moreElement.querySelector("button").addEventListener("click", () => {
+        if (nextPage !== null) {
+            fetchResults(nextPage);
+        }
+    });
+}
@@ -15,8 +15,9 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
-from MyGameDiary.views import HomePageView, HistoryPageView
+from django.conf import settings
+from django.urls import path, include, re_path
+from MyGameDiary.views import HomePageView, HistoryPageView, InstrumentationView, MediaFileView
 
 
 urlpatterns = [
@@ -24,8 +25,12 @@ urlpatterns = [
     path('', HomePageView.as_view(), name='homepage'),
     path('admin/', admin.site.urls, name='admin'),
     path('history/', HistoryPageView.as_view(), name='history'),
+    path('instrumentation/', InstrumentationView.as_view(), name='instrumentation'),
 
     # apps views
     path('games/', include('games_app.urls', namespace='games_app')),
     path('players/', include('players_app.urls', namespace='players_app')),
+
+    # mirrored covers
+    re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.+)$", MediaFileView.as_view()),
 ]
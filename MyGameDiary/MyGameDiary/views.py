@@ -1,8 +1,16 @@
-from django.contrib.auth.models import User
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.shortcuts import redirect
+from django.urls import reverse_lazy
+from django.utils.cache import patch_cache_control
+from django.views import View
 from django.views.generic import TemplateView, ListView
+from django.views.static import serve
 
-from games_app.models import Game
-from players_app.models import GameCard, Version
+from games_app.models import SiteStats
+from MyGameDiary.instrumentation import get_summary, reset_summary
+from players_app.mixins import UserRightsMixin
+from players_app.models import Version
 
 
 class HomePageView(TemplateView):
@@ -10,9 +18,10 @@ class HomePageView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_games'] = Game.objects.count()
-        context['total_players'] = User.objects.count()
-        context['total_gamecards'] = GameCard.objects.count()
+        site_stats = SiteStats.objects.cached()
+        context['total_games'] = site_stats.total_games
+        context['total_players'] = site_stats.total_profiles
+        context['total_gamecards'] = site_stats.total_gamecards
         return context
 
 
@@ -20,3 +29,39 @@ class HistoryPageView(ListView):
     model = Version
     template_name = 'history.html'
     context_object_name = 'versions'
+
+
+class InstrumentationView(LoginRequiredMixin, UserRightsMixin, TemplateView):
+    template_name = 'instrumentation.html'
+    login_url = reverse_lazy('players_app:user_login')
+    allowed_groups = ['Admin']
+    views_shown = 20
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_context_rights())
+        if context['user_has_rights']:
+            summary = get_summary()
+            context['slowest_views'] = sorted(summary, key=lambda row: row['avg_total_ms'],
+                                              reverse=True)[:self.views_shown]
+            context['chattiest_views'] = sorted(summary, key=lambda row: row['avg_queries'],
+                                                reverse=True)[:self.views_shown]
+        context['instrumentation_enabled'] = settings.INSTRUMENTATION_ENABLED
+        context['sample_rate'] = settings.INSTRUMENTATION_SAMPLE_RATE
+        return context
+
+    def post(self, *args, **kwargs):
+        if self.is_member_of(self.request.user, self.allowed_groups):
+            reset_summary()
+        return redirect(reverse_lazy('instrumentation'))
+
+
+class MediaFileView(View):
+    """
+    Serve MEDIA_ROOT files (mirrored covers) with far-future cache headers, their names are content-hashed.
+    In production the web server should serve MEDIA_URL directly with the same headers.
+    """
+    def get(self, request, path):
+        response = serve(request, path, document_root=settings.MEDIA_ROOT)
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_MAX_AGE, immutable=True)
+        return response
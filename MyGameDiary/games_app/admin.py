@@ -1,5 +1,5 @@
 from django.contrib import admin
-from games_app.models import Genre, Perspective, Franchise, Game
+from games_app.models import Genre, Perspective, Franchise, Game, GameStats, SiteStats, Job
 
 
 @admin.register(Genre)
@@ -32,3 +32,21 @@ class GameAdmin(admin.ModelAdmin):
     @admin.display(description='Perspectives')
     def get_perspectives(self, obj):
         return obj.get_perspectives_names()
+
+
+@admin.register(GameStats)
+class GameStatsAdmin(admin.ModelAdmin):
+    list_display = ('game', 'total_gamecards', 'public_gamecards', 'total_finished', 'total_hours')
+    list_select_related = ('game', )
+
+
+@admin.register(SiteStats)
+class SiteStatsAdmin(admin.ModelAdmin):
+    list_display = ('total_games', 'total_profiles', 'total_private', 'total_gamecards', 'total_finished',
+                    'total_hours')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'status', 'attempts', 'max_attempts', 'run_after', 'created_at', 'finished_at', 'error')
+    list_filter = ('status', 'kind')
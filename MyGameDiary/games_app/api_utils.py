@@ -2,10 +2,16 @@
 A library of utilities for communicating with IGDB game database.
 """
 
-import requests
 from dotenv import load_dotenv
 from os import getenv
-from games_app.models import Genre, Perspective, Franchise, Game
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from games_app.cache import invalidate_catalogue
+from games_app.covers import mirror_covers
+from games_app.igdb_cache import ResponseCache
+from games_app.igdb_client import IGDBClient, API_URL, CircuitBreaker, batches
+from games_app.models import Genre, Perspective, Franchise, Game, GameStats, SiteStats, SyncWatermark
+from django.db import transaction
 import time
 
 
@@ -20,34 +26,46 @@ access_token = getenv('ACCESS_TOKEN')
 Getting games_app info from IGDB API (using Twitch authentication)
 """
 
-api_url = 'https://api.igdb.com/v4/'
+api_url = API_URL
+igdb_client = None
+BULK_BATCH_SIZE = 500
+
+
+def get_client():
+    """
+    Shared IGDB client, so all calls reuse one keep-alive session and one rate limiter
+    """
+    global igdb_client
+    if igdb_client is None:
+        cache = None
+        if settings.IGDB_CACHE_PATH:
+            cache = ResponseCache(settings.IGDB_CACHE_PATH,
+                                  ttls=settings.IGDB_CACHE_TTLS,
+                                  max_bytes=settings.IGDB_CACHE_MAX_BYTES,
+                                  offline=settings.IGDB_CACHE_OFFLINE)
+        breaker = CircuitBreaker(threshold=settings.IGDB_CIRCUIT_THRESHOLD,
+                                 reset_timeout=settings.IGDB_CIRCUIT_RESET_TIMEOUT)
+        igdb_client = IGDBClient(client_id=client_id, access_token=access_token, base_url=api_url, cache=cache,
+                                 client_secret=client_secret, token_store=django_cache, timeout=settings.IGDB_TIMEOUT,
+                                 max_retries=settings.IGDB_MAX_RETRIES, breaker=breaker)
+    return igdb_client
 
 
 def get_api_token():
     """
     Get new api_token from IGDB API (using Twitch authentication)
+    The token is cached until it expires, so the client does not need ACCESS_TOKEN when CLIENT_SECRET is set.
     """
-    url = 'https://id.twitch.tv/oauth2/token'
-    data = {'client_id': client_id,
-            'client_secret': client_secret,
-            'grant_type': 'client_credentials'}
+    token = get_client().tokens.refresh()
+    print(f'New access token: {token}')
+    return token
 
-    response = requests.post(url, data=data)
-    print(response.json())
 
-
-def get_genres(url=api_url):
+def get_genres():
     """
     Get list of all game genres
     """
-    endpoint = 'genres'
-    headers = {'Client-ID': client_id,
-               'Authorization': 'Bearer ' + access_token}
-    data = 'fields id, name; limit 50;'
-
-    response = requests.post(url + endpoint, headers=headers, data=data)
-    genres = response.json()
-    return genres
+    return get_client().get_genres()
 
 
 def save_genres():
@@ -55,26 +73,16 @@ def save_genres():
     Save genres to the database
     """
     genres = get_genres()
-    for genre in genres:
-        id = genre['id']
-        name = genre['name']
-        new_genre = Genre(id=id, name=name)
-        new_genre.save()
+    Genre.objects.bulk_create([Genre(id=genre['id'], name=genre['name']) for genre in genres],
+                              update_conflicts=True, unique_fields=['id'], update_fields=['name'])
     print(f'Successfully saved {len(genres)} genres.')
 
 
-def get_perspectives(url=api_url):
+def get_perspectives():
     """
     Get list of all game perspectives
     """
-    endpoint = 'player_perspectives'
-    headers = {'Client-ID': client_id,
-               'Authorization': 'Bearer ' + access_token}
-    data = f"fields name;"
-
-    response = requests.post(url + endpoint, headers=headers, data=data)
-    perspectives = response.json()
-    return perspectives
+    return get_client().get_perspectives()
 
 
 def save_perspectives():
@@ -82,24 +90,17 @@ def save_perspectives():
     Save perspectives to the database
     """
     perspectives = get_perspectives()
-    for perspective in perspectives:
-        id = perspective['id']
-        name = perspective['name']
-        new_perspective = Perspective(id=id, name=name)
-        new_perspective.save()
+    Perspective.objects.bulk_create([Perspective(id=perspective['id'], name=perspective['name'])
+                                     for perspective in perspectives],
+                                    update_conflicts=True, unique_fields=['id'], update_fields=['name'])
     print(f'Successfully saved {len(perspectives)} perspectives.')
 
 
-def find_game_id(name, url=api_url):
+def find_game_id(name):
     """
     Find a game_id by name
     """
-    endpoint = 'games'
-    headers = {'Client-ID': client_id,
-               'Authorization': 'Bearer ' + access_token}
-    data = f'fields id, name, first_release_date; search "{name}"; limit 100;'
-    response = requests.post(url + endpoint, headers=headers, data=data)
-    data = response.json()
+    data = get_client().search_games(name)
 
     games = []
     for game in data:
@@ -116,18 +117,11 @@ def find_game_id(name, url=api_url):
     return games
 
 
-def get_game_data(game_id, url=api_url):
+def parse_game_data(lookup):
     """
-    Get relevant game data from IGDB API using game id
+    Convert a game lookup of IGDBClient (game, cover_url, ...) to the game data used by save_game
     """
-    endpoint = 'games'
-    headers = {'Client-ID': client_id,
-               'Authorization': 'Bearer ' + access_token}
-    data = (f'fields id, name, cover, first_release_date, total_rating, summary, franchises, '
-            f'genres, player_perspectives; where id = {game_id};')
-
-    response = requests.post(url + endpoint, headers=headers, data=data)
-    data = response.json()[0]
+    data = lookup['game']
     if 'franchises' not in data:
         data['franchises'] = []
     if 'player_perspectives' not in data:
@@ -136,16 +130,64 @@ def get_game_data(game_id, url=api_url):
         data['total_rating'] = None
     game_data = {'id': data['id'],
                  'name': data['name'],
-                 'cover_url': get_game_cover_url(game_id),
+                 'cover_url': lookup['cover_url'],
                  'year': convert_to_year(data['first_release_date']),
                  'rating': round(data['total_rating']) if data['total_rating'] is not None else None,
-                 'summary': data['summary'],
+                 'summary': data.get('summary'),
                  'franchise_id': data['franchises'][0] if data['franchises'] else None,
-                 'genres': data['genres'],
+                 'genres': data.get('genres', []),
                  'perspectives': data['player_perspectives']}
     return game_data
 
 
+def get_game_data(game_id):
+    """
+    Get relevant game data from IGDB API using game id
+    The game and cover lookups run concurrently, franchises are resolved by FranchiseResolver
+    """
+    return parse_game_data(get_client().get_game_data(game_id, with_franchise=False))
+
+
+def get_games_data(game_ids):
+    """
+    Get relevant data of many games from IGDB API
+    Games and covers of up to 500 games are fetched by a single multiquery request,
+    franchises are resolved by FranchiseResolver
+    """
+    return [parse_game_data(lookup) for lookup in get_client().get_games_lookups(game_ids, with_franchise=False)]
+
+
+franchise_names = {}  # in-process memo of franchise names fetched from IGDB
+
+
+class FranchiseResolver:
+    """
+    Resolve IGDB franchise ids to Franchise objects
+    Ids are looked up in the local Franchise table and in the in-process memo first,
+    the ids still unknown are fetched from IGDB with a single batch request
+    """
+    def __init__(self):
+        self.franchises = {}
+
+    def resolve(self, franchise_ids):
+        """
+        Return {franchise_id: Franchise}, franchises missing in the database are created
+        """
+        requested_ids = set(franchise_ids) - {None}
+        lookup_ids = requested_ids - set(self.franchises)
+        if lookup_ids:
+            self.franchises.update(Franchise.objects.in_bulk(lookup_ids))
+            missing_ids = lookup_ids - set(self.franchises)
+            for franchise_data in get_client().get_franchises(missing_ids - set(franchise_names)):
+                franchise_names[franchise_data['id']] = franchise_data['name']
+            new_franchises = [Franchise(id=franchise_id, name=franchise_names[franchise_id])
+                              for franchise_id in missing_ids if franchise_id in franchise_names]
+            Franchise.objects.bulk_create(new_franchises, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+            self.franchises.update({franchise.id: franchise for franchise in new_franchises})
+        return {franchise_id: self.franchises[franchise_id]
+                for franchise_id in requested_ids if franchise_id in self.franchises}
+
+
 def get_clear_name(name):
     if name.startswith('A '):
         clear_name = name[2:]
@@ -159,12 +201,12 @@ def get_clear_name(name):
 
 
 def save_ordering_names():
-    games = Game.objects.all()
-    count = 0
+    games = list(Game.objects.select_related('franchise'))
     for game in games:
-        count += 1
         game.set_ordering_name()
-        game.save()
+    Game.objects.bulk_update(games, ['ordering_name'], batch_size=BULK_BATCH_SIZE)
+    invalidate_catalogue()
+    count = len(games)
     print(f"Successfully saved {count} ordering_name{'s' if count != 1 else ''}.")
 
 
@@ -177,83 +219,122 @@ def save_game(game_id, rewrite=False):
     if game_check and not rewrite:
         print(f'{game_check} already exists in the database.')
         return False
-    game_data = get_game_data(game_id)
-    game = Game()
-    game.id = game_data['id']
-    game.name = game_data['name']
-    game.cover_url = game_data['cover_url']
-    game.year = game_data['year']
-    game.rating = game_data['rating']
-    game.summary = game_data['summary']
-    franchise = None
-    if game_data['franchise_id']:
-        franchise, created = Franchise.objects.get_or_create(
-            id=game_data['franchise_id'],
-            name=get_franchise_name(game_data['franchise_id'])
-        )
-    game.franchise = franchise
-    game.save()
-    for genre in game_data['genres']:
-        new_genre = Genre.objects.get(pk=genre)
-        game.genres.add(new_genre)
-    for perspective in game_data['perspectives']:
-        new_perspective = Perspective.objects.get(pk=perspective)
-        game.perspectives.add(new_perspective)
-    game.set_ordering_name()
-    game.save()
-    print(f'Successfully saved data for {game}.')
+    import_games([get_game_data(game_id)])
     return True
 
 
+def import_games(games_data):
+    """
+    Bulk save game data fetched from IGDB API to the database in a single transaction
+    Games are upserted, genres and perspectives are written to the through-tables with one insert each,
+    franchises are resolved by FranchiseResolver. Returns the number of new games.
+    """
+    genre_ids = set(Genre.objects.values_list('pk', flat=True))
+    perspective_ids = set(Perspective.objects.values_list('pk', flat=True))
+    with transaction.atomic():
+        franchises = FranchiseResolver().resolve(game_data['franchise_id'] for game_data in games_data)
+        games = []
+        for game_data in games_data:
+            game = Game(id=game_data['id'],
+                        name=game_data['name'],
+                        cover_url=game_data['cover_url'],
+                        year=game_data['year'],
+                        rating=game_data['rating'],
+                        summary=game_data['summary'],
+                        franchise=franchises.get(game_data['franchise_id']))
+            game.set_ordering_name()
+            games.append(game)
+        game_ids = [game.id for game in games]
+
+        existing_ids = set(Game.objects.filter(pk__in=game_ids).values_list('pk', flat=True))
+        Game.objects.bulk_create(games, batch_size=BULK_BATCH_SIZE, update_conflicts=True, unique_fields=['id'],
+                                 update_fields=['name', 'ordering_name', 'cover_url', 'year', 'rating', 'summary',
+                                                'franchise', 'updated_at'])
+        for field_name, related_ids, data_key in (('genres', genre_ids, 'genres'),
+                                                  ('perspectives', perspective_ids, 'perspectives')):
+            through = getattr(Game, field_name).through
+            related_field = through._meta.get_field(Game._meta.get_field(field_name).m2m_reverse_field_name())
+            through.objects.filter(game_id__in=existing_ids).delete()
+            through.objects.bulk_create([
+                through(game_id=game_data['id'], **{related_field.attname: related_id})
+                for game_data in games_data for related_id in game_data[data_key] if related_id in related_ids
+            ], batch_size=BULK_BATCH_SIZE)
+        # bulk_create does not send post_save, so the statistics of new games are created here
+        new_ids = [game_id for game_id in game_ids if game_id not in existing_ids]
+        GameStats.objects.bulk_create([GameStats(game_id=game_id) for game_id in new_ids],
+                                      batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+        SiteStats.objects.apply(total_games=len(new_ids))
+        invalidate_catalogue()
+
+    for game in games:
+        print(f'Successfully saved data for {game}.')
+    if settings.COVER_MIRROR_ON_IMPORT:
+        # after the commit of an enclosing transaction, so no write lock is held while covers download
+        transaction.on_commit(lambda: mirror_imported_covers(game_ids))
+    return len(new_ids)
+
+
+def mirror_imported_covers(game_ids):
+    mirrored, failed = mirror_covers(Game.objects.filter(pk__in=game_ids))
+    print(f"Mirrored {mirrored} cover{'s' if mirrored != 1 else ''}, {failed} failed.")
+
+
 def save_games(rewrite=False):
     """
     Save all games listed in games_id.txt
+    Data of all new games are fetched from IGDB API in batches and saved in bulk
     """
-    count = 0
     with open('games_app/games_id.txt', 'r') as file:
-        for game in file.readlines():
-            game_id, game_name = game.split(',')
-            if save_game(int(game_id), rewrite=rewrite):
-                count += 1
+        game_ids = [int(game.split(',')[0]) for game in file.readlines() if game.strip()]
+    if not rewrite:
+        existing_ids = set(Game.objects.filter(pk__in=game_ids).values_list('pk', flat=True))
+        game_ids = [game_id for game_id in game_ids if game_id not in existing_ids]
+    count = import_games(get_games_data(game_ids))
     print(f"Successfully saved data of {count} NEW game{'s' if count != 1 else ''}.")
 
 
-def save_to_file(game_string):
+def import_selected_games(game_ids, report=print):
+    """
+    Import games selected from IGDB search results
+    Games not in the database yet are fetched in batches (one multiquery request each), saved in bulk
+    and added to games_id.txt with one write in the same transaction, so a failed write rolls the games back
+    and a retry imports them again. Returns the ids of the imported games.
+    """
+    existing_ids = set(Game.objects.filter(pk__in=game_ids).values_list('pk', flat=True))
+    new_ids = [game_id for game_id in dict.fromkeys(game_ids) if game_id not in existing_ids]
+    games_data = []
+    for batch in batches(new_ids):
+        report(f'Fetching {len(games_data) + len(batch)} of {len(new_ids)} games from IGDB...')
+        games_data += get_games_data(batch)
+    if games_data:
+        report(f"Saving {len(games_data)} game{'s' if len(games_data) != 1 else ''}...")
+        with transaction.atomic():
+            import_games(games_data)
+            save_to_file(*(f"{game_data['id']},{game_data['name']}" for game_data in games_data))
+    return [game_data['id'] for game_data in games_data]
+
+
+def save_to_file(*game_strings):
     with open('games_app/games_id.txt', 'a') as file:
-        file.write(f"\n{game_string}")
+        file.write(''.join(f"\n{game_string}" for game_string in game_strings))
     print('Game credentials saved to file.')
 
 
-def get_game_cover_url(game_id, url=api_url):
-    endpoint = 'covers'
-    headers = {'Client-ID': client_id,
-               'Authorization': 'Bearer ' + access_token}
-    data = f'fields url; where game = {game_id};'
-
-    response = requests.post(url + endpoint, headers=headers, data=data)
-    cover_url = response.json()[0].get('url')
-    return cover_url
+def get_game_cover_url(game_id):
+    return get_client().get_cover_url(game_id)
 
 
-def get_game_franchise_id(game_id, url=api_url):
-    endpoint = 'games'
-    headers = {'Client-ID': client_id,
-               'Authorization': 'Bearer ' + access_token}
-    data = f'fields franchises; where id = {game_id};'
-    response = requests.post(url + endpoint, headers=headers, data=data)
-    franchise_id = response.json()[0].get('franchises')
+def get_game_franchise_id(game_id):
+    game = get_client().get_game_fields(game_id, 'franchises')
+    franchise_id = game.get('franchises') if game else None
     return franchise_id[0] if franchise_id else None
 
 
-def get_franchise_name(franchise_id, url=api_url):
-    endpoint = 'franchises'
-    headers = {'Client-ID': client_id,
-               'Authorization': 'Bearer ' + access_token}
-    data = f"fields name; where id = {franchise_id};"
-
-    response = requests.post(url + endpoint, headers=headers, data=data)
-    franchise_name = response.json()[0].get('name')
-    return franchise_name
+def get_franchise_name(franchise_id):
+    if franchise_id not in franchise_names:
+        franchise = Franchise.objects.filter(pk=franchise_id).first()
+        franchise_names[franchise_id] = franchise.name if franchise else get_client().get_franchise_name(franchise_id)
+    return franchise_names[franchise_id]
 
 
 def get_game_franchise_name(game_id):
@@ -282,60 +363,115 @@ def convert_to_year(timestamp):
 
 
 def find_and_save_games_franchises(update=False):
-    games = Game.objects.all()
+    games = Game.objects.select_related('franchise')
+    if not update:
+        games = games.filter(franchise__isnull=True)
+    games = {game.id: game for game in games}
+    franchise_ids = {}
+    for game_data in get_client().get_games(games.keys(), fields='id, franchises'):
+        franchises = game_data.get('franchises')
+        franchise_ids[game_data['id']] = franchises[0] if franchises else None
+
     count = 0
-    for game in games:
-        print(f'Checking {game} franchise...')
-        if game.franchise is not None and not update:
-            print(f"Franchise '{game.franchise_text}' already set for {game}. Skipping...")
-            continue
-        franchise_id = get_game_franchise_id(game.id)
-        if not franchise_id:
-            game.franchise = None
-        else:
-            count += 1
-            game.franchise, created = Franchise.objects.get_or_create(
-                id=franchise_id,
-                name=get_franchise_name(franchise_id)
-            )
-        game.save()
-        print(f"Found '{game.franchise_text}' franchise for {game}.")
-        game.set_ordering_name()
-        game.save()
-        print(f"Ordering_name '{game.ordering_name}' set for {game}.")
+    with transaction.atomic():
+        franchises = FranchiseResolver().resolve(franchise_ids.values())
+        for game_id, game in games.items():
+            print(f'Checking {game} franchise...')
+            game.franchise = franchises.get(franchise_ids.get(game_id))
+            if game.franchise is not None:
+                count += 1
+            print(f"Found '{game.franchise_text}' franchise for {game}.")
+            game.set_ordering_name()
+            print(f"Ordering_name '{game.ordering_name}' set for {game}.")
+        Game.objects.bulk_update(games.values(), ['franchise', 'ordering_name'], batch_size=BULK_BATCH_SIZE)
+        invalidate_catalogue()
     print(f"Successfully saved {count} franchise{'s' if count != 1 else ''}.")
+    return count
 
 
-def check_franchise_exists(franchise_name, url=api_url):
-    endpoint = 'franchises'
-    headers = {'Client-ID': client_id,
-               'Authorization': 'Bearer ' + access_token}
-    data = f'fields id, name; where name = "{franchise_name}";'
-    response = requests.post(url + endpoint, headers=headers, data=data)
-    exists = f"{response.json()[0].get('id')}: {franchise_name}" if response.json() \
+def check_franchise_exists(franchise_name):
+    franchise = get_client().find_franchise(franchise_name)
+    exists = f"{franchise.get('id')}: {franchise_name}" if franchise \
              else f"{franchise_name} franchise not found."
     return exists
 
 
-def get_game_total_rating(game_id, url=api_url):
-    endpoint = 'games'
-    headers = {'Client-ID': client_id,
-               'Authorization': 'Bearer ' + access_token}
-    data = f'fields total_rating; where id = {game_id};'
-    response = requests.post(url + endpoint, headers=headers, data=data)
-    total_rating = response.json()[0].get('total_rating')
+def get_game_total_rating(game_id):
+    game = get_client().get_game_fields(game_id, 'total_rating', fresh=True)
+    total_rating = game.get('total_rating') if game else None
     return round(total_rating) if total_rating else None
 
 
 def update_ratings():
-    games = Game.objects.all()
-    count = 0
-    for game in games:
+    games = Game.objects.in_bulk()
+    changed_games = []
+    for game_data in get_client().get_games(games.keys(), fields='id, total_rating', fresh=True):
+        game = games[game_data['id']]
         old_rating = game.rating
-        new_rating = get_game_total_rating(game.id)
+        total_rating = game_data.get('total_rating')
+        new_rating = round(total_rating) if total_rating else None
         if new_rating != old_rating:
-            count += 1
             game.rating = new_rating
-            game.save()
+            changed_games.append(game)
             print(f"Rating for {game} has been updated. {old_rating} -> {new_rating}")
+    Game.objects.bulk_update(changed_games, ['rating'], batch_size=BULK_BATCH_SIZE)
+    invalidate_catalogue()
+    count = len(changed_games)
     print(f"Successfully updated {count} rating{'s' if count != 1 else ''}.")
+    return count
+
+
+def sync_catalogue(full=False, dry_run=False):
+    """
+    Update the games that changed on IGDB since the last sync
+    Only games with updated_at after the stored watermark are fetched and only changed fields are written.
+    Returns a list of changes: (game, field, old value, new value)
+    """
+    watermark, created = SyncWatermark.objects.get_or_create(name='catalogue')
+    since = 0 if full else watermark.value
+    games = Game.objects.select_related('franchise').in_bulk()
+    updated_games = get_client().get_updated_games(
+        games.keys(), since, fields='id, name, first_release_date, total_rating, summary, franchises')
+
+    changes = []
+    changed_games = []
+    changed_fields = set()
+    with transaction.atomic():
+        franchises = FranchiseResolver().resolve(game_data['franchises'][0] for game_data in updated_games
+                                                 if game_data.get('franchises'))
+        for game_data in updated_games:
+            game = games[game_data['id']]
+            total_rating = game_data.get('total_rating')
+            game_franchises = game_data.get('franchises')
+            new_values = {
+                'name': game_data['name'],
+                'year': convert_to_year(game_data['first_release_date']) if 'first_release_date' in game_data
+                else game.year,
+                'rating': round(total_rating) if total_rating else None,
+                'summary': game_data.get('summary'),
+            }
+            game_changes = [(field, getattr(game, field), value) for field, value in new_values.items()
+                            if getattr(game, field) != value]
+            for field, old_value, new_value in game_changes:
+                setattr(game, field, new_value)
+            franchise = franchises.get(game_franchises[0]) if game_franchises else None
+            if game.franchise_id != (franchise.id if franchise else None):
+                game_changes.append(('franchise', game.franchise_text, franchise.name if franchise else '---'))
+                game.franchise = franchise
+            old_ordering_name = game.ordering_name
+            game.set_ordering_name()
+            if game.ordering_name != old_ordering_name:
+                game_changes.append(('ordering_name', old_ordering_name, game.ordering_name))
+            if game_changes:
+                changed_games.append(game)
+                changed_fields.update(field for field, old_value, new_value in game_changes)
+                changes += [(game, field, old_value, new_value) for field, old_value, new_value in game_changes]
+
+        if changed_games:
+            Game.objects.bulk_update(changed_games, sorted(changed_fields), batch_size=BULK_BATCH_SIZE)
+            invalidate_catalogue()
+        watermark.value = max([since, watermark.value] + [game_data['updated_at'] for game_data in updated_games])
+        watermark.save()
+        if dry_run:
+            transaction.set_rollback(True)
+    return changes
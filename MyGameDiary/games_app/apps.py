@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class GamesAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'games_app'
+
+    def ready(self):
+        import games_app.signals  # noqa: F401
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+        from games_app.search import ensure_fts_index
+        from MyGameDiary.db import configure_sqlite
+        post_migrate.connect(ensure_fts_index, sender=self)
+        connection_created.connect(configure_sqlite)
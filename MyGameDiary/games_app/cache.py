@@ -0,0 +1,119 @@
+"""
+Catalogue cache
+Cached catalogue pages, page contents and rendered game rows are keyed on a catalogue version.
+Signals replace the version after every committed change of games, franchises or game cards,
+which invalidates all catalogue entries at once; stale entries simply expire.
+The version is a DataVersion row, so changes made by other processes (run_jobs, other web workers)
+reach this one within DATA_VERSION_TIMEOUT seconds even with a per-process cache.
+Conditional GET requests (ConditionalGetMixin) are validated by the rows each page shows
+(get_stamps), pages rendered from catalogue caches fall back to the catalogue version.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db.models import Count
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+
+from games_app.models import DataVersion
+from players_app import roles
+
+VERSION_NAME = 'catalogue'
+
+
+def get_catalogue_version():
+    return DataVersion.objects.current(VERSION_NAME)
+
+
+def invalidate_catalogue():
+    """
+    Replace the catalogue version now and again once the current transaction commits,
+    so pages cached by other requests before the commit from the old data do not survive it
+    """
+    DataVersion.objects.replace(VERSION_NAME)
+
+
+def get_stamps(queryset, **aggregates):
+    """
+    Count and the given aggregates (e.g. updated=Max('updated_at')) of the rows a page shows, in one query.
+    Every insert, update and delete of those rows changes them.
+    """
+    return queryset.order_by().aggregate(count=Count('pk', distinct=True), **aggregates)
+
+
+def get_catalogue_key(*parts):
+    return ':'.join(['catalogue', get_catalogue_version(), *map(str, parts)])
+
+
+class AnonymousPageCacheMixin:
+    """
+    Serve whole pages to anonymous visitors from the catalogue cache.
+    Requests carrying flash messages and responses setting cookies are never cached.
+    Behind ConditionalGetMixin pages are keyed on their ETag, so a cached page always matches its validator.
+    """
+    def get_page_cache_key(self):
+        etag = getattr(self, 'etag', None)
+        if etag is not None:
+            return f'page:{etag}'
+        return get_catalogue_key('page', self.request.get_full_path())
+
+    def is_page_cacheable(self):
+        return (self.request.method == 'GET' and not self.request.user.is_authenticated
+                and not len(get_messages(self.request)))
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_page_cacheable():
+            return super().dispatch(request, *args, **kwargs)
+        key = self.get_page_cache_key()
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        if response.status_code == 200 and not response.cookies:
+            cache.set(key, (response.content, response['Content-Type']), settings.CATALOGUE_CACHE_TIMEOUT)
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer If-None-Match requests with 304 Not Modified before the view renders anything.
+    The ETag is derived from get_etag_parts(), the viewer's roles and the URL. Views override get_etag_parts()
+    with get_stamps() of the rows they show; the default catalogue version changes with every catalogue
+    or game card change. Anonymous responses are public for PUBLIC_PAGE_MAX_AGE seconds,
+    the others private and revalidated on every use. Place it after the permission mixins.
+    """
+    etag = None
+
+    def get_etag_parts(self):
+        return [get_catalogue_version()]
+
+    def get_etag(self):
+        user = self.request.user
+        viewer = f'{user.pk}:{roles.get_version(user.pk)}' if user.is_authenticated else 'anonymous'
+        parts = [*self.get_etag_parts(), viewer, self.request.get_full_path()]
+        return quote_etag(hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest())
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+            return super().dispatch(request, *args, **kwargs)
+        etag = self.etag = self.get_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or response.cookies:
+                return response
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Cookie'])
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.PUBLIC_PAGE_MAX_AGE)
+        return response
@@ -0,0 +1,156 @@
+"""
+Cover mirror
+Covers are downloaded once and stored in MEDIA_ROOT/covers as WebP and JPEG variants of the widths
+the templates draw them at (1x and 2x). File names contain a hash of the downloaded image, so a file never
+changes and is served with far-future cache headers. Without Pillow (optional, pip install Pillow)
+the downloaded image is stored unchanged as the only variant.
+"""
+
+import hashlib
+import re
+from io import BytesIO
+from pathlib import PurePosixPath
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from games_app.cache import invalidate_catalogue
+from games_app.models import Game
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+COVER_DIR = 'covers'
+COVER_WIDTHS = (100, 200, 400)
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 6}),
+           'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True})}
+IGDB_HOST = 'images.igdb.com'
+IGDB_SIZE = re.compile(r'/t_[a-z0-9_]+/')
+IGDB_SOURCE_SIZE = '/t_cover_big_2x/'  # 528 px wide, enough for the largest variant
+
+
+class CoverError(Exception):
+    pass
+
+
+def get_source_url(cover_url):
+    """
+    Absolute url of the image to download, the largest needed IGDB size for IGDB covers
+    """
+    url = f'https:{cover_url}' if cover_url.startswith('//') else cover_url
+    if urlparse(url).hostname == IGDB_HOST:
+        url = IGDB_SIZE.sub(IGDB_SOURCE_SIZE, url)
+    return url
+
+
+def is_mirrored(game):
+    return bool(game.cover_variants) and game.cover_variants.get('source') == get_source_url(game.cover_url)
+
+
+def download(url, session=None):
+    content = b''
+    try:
+        with (session or requests).get(url, timeout=settings.COVER_DOWNLOAD_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(64 * 1024):
+                content += chunk
+                if len(content) > settings.COVER_MAX_BYTES:
+                    raise CoverError(f"{url} is larger than {settings.COVER_MAX_BYTES} bytes.")
+    except requests.RequestException as error:
+        raise CoverError(f"Download of {url} failed: {error}")
+    if not content:
+        raise CoverError(f"{url} is empty.")
+    return content
+
+
+def render_variants(content, url):
+    """
+    Return a list of (format, width, bytes), largest width first
+    """
+    if Image is None:
+        extension = PurePosixPath(urlparse(url).path).suffix.lstrip('.').lower() or 'jpg'
+        return [(extension, None, content)]
+    try:
+        image = Image.open(BytesIO(content))
+        image.load()
+    except (OSError, Image.DecompressionBombError) as error:
+        raise CoverError(f"{url} is not a valid image: {error}")
+    image = image.convert('RGB')
+    variants = []
+    for width in sorted(COVER_WIDTHS, reverse=True):
+        if width > image.width and width != COVER_WIDTHS[0]:
+            continue  # never upscale, the smallest variant is always made
+        resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for extension, (image_format, options) in FORMATS.items():
+            output = BytesIO()
+            resized.save(output, image_format, **options)
+            variants.append((extension, width, output.getvalue()))
+    return variants
+
+
+def store(name, content):
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+    return name
+
+
+def mirror_cover(game, session=None):
+    """
+    Download and store the cover of game and save its variants to game.cover_variants.
+    Raises CoverError when the cover cannot be mirrored.
+    """
+    source = get_source_url(game.cover_url)
+    content = download(source, session)
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    files = []
+    for extension, width, data in render_variants(content, source):
+        name = f"{COVER_DIR}/{digest}{f'-{width}' if width else ''}.{extension}"
+        files.append({'format': extension, 'width': width, 'name': store(name, data)})
+    game.cover_variants = {'source': source, 'digest': digest, 'files': files}
+    Game.objects.filter(pk=game.pk).update(cover_variants=game.cover_variants)
+    return game.cover_variants
+
+
+def mirror_covers(games, force=False):
+    """
+    Mirror covers of games not mirrored yet (all of them with force) over one keep-alive session.
+    Returns (mirrored, failed) counts.
+    """
+    mirrored, failed = 0, 0
+    with requests.Session() as session:
+        for game in games:
+            if not force and is_mirrored(game):
+                continue
+            try:
+                mirror_cover(game, session)
+                mirrored += 1
+            except CoverError as error:
+                print(f'{game}: {error}')
+                failed += 1
+    if mirrored:
+        invalidate_catalogue()
+    return mirrored, failed
+
+
+def get_cover_sources(game, width=None):
+    """
+    Return (src, {format: srcset}) of the mirrored cover, src being the smallest JPEG at least `width` wide,
+    or (cover_url, {}) when the cover is not mirrored
+    """
+    if not is_mirrored(game):
+        return game.cover_url, {}
+    files = sorted(game.cover_variants['files'], key=lambda variant: variant['width'] or 0)
+    srcsets = {}
+    for variant in files:
+        if variant['width']:
+            srcsets.setdefault(variant['format'], []).append(
+                f"{default_storage.url(variant['name'])} {variant['width']}w")
+    fallback = [variant for variant in files if variant['format'] != 'webp'] or files
+    large_enough = [variant for variant in fallback if not width or (variant['width'] or width) >= width]
+    src = default_storage.url((large_enough or fallback)[0 if large_enough else -1]['name'])
+    return src, {image_format: ', '.join(srcset) for image_format, srcset in srcsets.items()}
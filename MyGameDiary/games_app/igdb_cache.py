@@ -0,0 +1,130 @@
+"""
+Persistent IGDB response cache stored in a local SQLite file.
+Responses are keyed on endpoint and query body, compressed with zlib, expire after a per-endpoint TTL
+and are evicted least-recently-used once the cache grows over its size limit.
+Lookups that must see current data (searches, rating refreshes, catalogue sync) go through refresh().
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+DAY = 24 * 60 * 60
+
+# Genres, perspectives, franchise names and cover urls rarely change, game data (ratings) does
+DEFAULT_TTLS = {
+    'genres': 30 * DAY,
+    'player_perspectives': 30 * DAY,
+    'franchises': 7 * DAY,
+    'covers': 7 * DAY,
+    'games': DAY,
+    'multiquery': DAY,
+}
+DEFAULT_TTL = DAY
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class CacheMiss(LookupError):
+    """
+    Raised in offline mode when a response is not cached
+    """
+
+
+class ResponseCache:
+    def __init__(self, path, ttls=None, max_bytes=DEFAULT_MAX_BYTES, offline=False, clock=time.time):
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                'key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, data BLOB NOT NULL, '
+                                'size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def get_key(endpoint, query):
+        return hashlib.sha256(f'{endpoint}\n{query}'.encode()).hexdigest()
+
+    def get_ttl(self, endpoint):
+        return self.ttls.get(endpoint, DEFAULT_TTL)
+
+    def get(self, endpoint, query, allow_stale=False):
+        """
+        Return (found, data). Expired responses are returned only with allow_stale=True or in offline mode.
+        """
+        key = self.get_key(endpoint, query)
+        with self.lock:
+            row = self.connection.execute('SELECT data, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return False, None
+            data, created = row
+            if not (allow_stale or self.offline) and self.clock() - created > self.get_ttl(endpoint):
+                return False, None
+            self.connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (self.clock(), key))
+        return True, json.loads(zlib.decompress(data))
+
+    def set(self, endpoint, query, response):
+        data = zlib.compress(json.dumps(response).encode())
+        now = self.clock()
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO responses (key, endpoint, data, size, created, accessed) '
+                                    'VALUES (?, ?, ?, ?, ?, ?)',
+                                    (self.get_key(endpoint, query), endpoint, data, len(data), now, now))
+            self.evict()
+
+    def evict(self):
+        """
+        Drop least recently used responses until the cache fits into max_bytes
+        """
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.connection.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def fetch(self, endpoint, query, request):
+        """
+        Return a cached response or call request() and cache its result.
+        When the refresh of an expired response fails, the stale response is served instead.
+        """
+        found, data = self.get(endpoint, query)
+        if found:
+            return data
+        if self.offline:
+            raise CacheMiss(f"{endpoint}: response is not cached ({query})")
+        try:
+            data = request()
+        except Exception:
+            found, data = self.get(endpoint, query, allow_stale=True)
+            if found:
+                return data
+            raise
+        self.set(endpoint, query, data)
+        return data
+
+    def refresh(self, endpoint, query, request):
+        """
+        Call request() and cache its result without reading the cache first, for data that must be current.
+        Offline mode still serves the cached response.
+        """
+        if self.offline:
+            return self.fetch(endpoint, query, request)
+        data = request()
+        self.set(endpoint, query, data)
+        return data
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM responses')
@@ -0,0 +1,482 @@
+"""
+IGDB API client with a pooled keep-alive session, a token-bucket rate limiter
+and an asyncio code path for running independent lookups concurrently.
+Every request has connect/read timeouts, 429 and 5xx responses are retried with jittered backoff
+honouring Retry-After, a circuit breaker fails fast while IGDB is down and the Twitch access token
+is refreshed when it expires or is rejected.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = 'https://api.igdb.com/v4/'
+TOKEN_URL = 'https://id.twitch.tv/oauth2/token'
+RATE_LIMIT = 4  # IGDB allows 4 requests per second
+TIMEOUT = (3.05, 20)  # connect and read timeout in seconds
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5  # seconds before the first retry, doubled with every further one
+MAX_RETRY_AFTER = 30  # a longer Retry-After fails the request instead of blocking the caller
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BATCH_SIZE = 500  # maximum limit of a single IGDB query
+MULTIQUERY_SIZE = 10  # maximum number of queries in a single multiquery request
+GAME_FIELDS = 'id, name, cover, first_release_date, total_rating, summary, franchises, genres, player_perspectives'
+
+
+def batches(ids, size=BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def id_list(ids):
+    return f"({','.join(str(id) for id in ids)})"
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens are added per second, up to `capacity`.
+    reserve() takes a token and returns how long the caller has to wait before using it.
+    """
+    def __init__(self, rate=RATE_LIMIT, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class IGDBError(Exception):
+    pass
+
+
+class IGDBUnavailable(IGDBError):
+    """
+    IGDB could not be reached, or the circuit breaker refuses calls while it is down
+    """
+
+
+class IGDBAuthError(IGDBError):
+    pass
+
+
+class IGDBResponseError(IGDBError):
+    def __init__(self, endpoint, response):
+        self.status_code = response.status_code
+        super().__init__(f"{endpoint}: IGDB answered {response.status_code} {response.text[:200]}")
+
+
+def get_retry_after(response, now=time.time):
+    """
+    Seconds to wait according to the Retry-After header (delay-seconds or HTTP date), None without one
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - now())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    After `threshold` consecutive failed calls the circuit opens and calls fail fast for `reset_timeout` seconds,
+    then a single trial call is let through: its success closes the circuit, its failure opens it again.
+    """
+    def __init__(self, threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_timeout - (self.clock() - self.opened_at)
+            if remaining > 0 or self.trial:
+                raise IGDBUnavailable(f"IGDB is unavailable, next attempt in {max(0, round(remaining))} s.")
+            self.trial = True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self.trial = False
+
+    def release(self):
+        """
+        End a call that neither proved IGDB healthy nor failing (rate limited), the next call is a new trial
+        """
+        with self.lock:
+            self.trial = False
+
+
+class AccessTokens:
+    """
+    Twitch app access token of IGDB, fetched with the client credentials and reused until shortly before it expires.
+    With a `store` (get(key) and set(key, value, timeout), e.g. Django's cache) the token is shared between
+    processes. Without a client secret the given access token is used as it is.
+    """
+    STORE_KEY = 'igdb-access-token'
+    EXPIRY_MARGIN = 60
+
+    def __init__(self, client_id, client_secret=None, access_token=None, token_url=TOKEN_URL, session=None,
+                 timeout=TIMEOUT, store=None, clock=time.time):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token = access_token
+        self.expires_at = None  # unknown for a given token, it is used until rejected
+        self.token_url = token_url
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.store = store
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    @property
+    def can_refresh(self):
+        return bool(self.client_secret)
+
+    def is_valid(self):
+        return bool(self.token) and (self.expires_at is None or self.clock() < self.expires_at)
+
+    def get(self):
+        with self.lock:
+            if self.is_valid():
+                return self.token
+            if self.store is not None and self.can_refresh:
+                stored = self.store.get(self.STORE_KEY)
+                if stored:
+                    self.token, self.expires_at = stored
+                    if self.is_valid():
+                        return self.token
+            return self.fetch()
+
+    def refresh(self, rejected_token=None):
+        """
+        Fetch a new token, unless the rejected token has been replaced by another thread already
+        """
+        with self.lock:
+            if rejected_token is not None and self.token != rejected_token and self.is_valid():
+                return self.token
+            return self.fetch()
+
+    def fetch(self):
+        if not self.can_refresh:
+            raise IGDBAuthError("IGDB access token is missing or expired and there is no client secret to renew it.")
+        try:
+            response = self.session.post(self.token_url, timeout=self.timeout, data={
+                'client_id': self.client_id, 'client_secret': self.client_secret, 'grant_type': 'client_credentials'})
+        except requests.RequestException as error:
+            raise IGDBUnavailable(f"Token request failed: {error}") from error
+        if not response.ok:
+            raise IGDBAuthError(f"Token request failed with {response.status_code}: {response.text[:200]}")
+        data = response.json()
+        lifetime = max(0, data.get('expires_in', 3600) - self.EXPIRY_MARGIN)
+        self.token, self.expires_at = data['access_token'], self.clock() + lifetime
+        if self.store is not None:
+            self.store.set(self.STORE_KEY, (self.token, self.expires_at), lifetime)
+        return self.token
+
+
+class IGDBClient:
+    """
+    Every call goes through one requests.Session, so TCP/TLS connections are kept alive and reused.
+    Coroutine variants (prefixed with 'a') run the blocking requests in worker threads, which lets
+    the game, cover and franchise lookups of one or many games overlap while the shared token bucket
+    keeps the request rate within the IGDB limit.
+    With a ResponseCache, cached responses are served without touching the network or the rate limiter;
+    fresh=True lookups always ask IGDB and only store the response.
+    """
+    def __init__(self, client_id, access_token, base_url=API_URL, rate=RATE_LIMIT, pool_size=8, cache=None,
+                 client_secret=None, token_url=TOKEN_URL, token_store=None, timeout=TIMEOUT, max_retries=MAX_RETRIES,
+                 retry_backoff=RETRY_BACKOFF, breaker=None, sleep=time.sleep):
+        self.base_url = base_url
+        self.cache = cache
+        self.limiter = TokenBucket(rate=rate)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Client-ID': client_id or ''})
+        self.tokens = AccessTokens(client_id, client_secret, access_token, token_url=token_url, session=self.session,
+                                   timeout=timeout, store=token_store)
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    # ************************************* transport *************************************
+
+    def get_retry_delay(self, attempt, retry_after=None):
+        """
+        Jittered exponential backoff, or the server's Retry-After; None when that is too long to wait
+        """
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.retry_backoff) if retry_after <= MAX_RETRY_AFTER else None
+        return self.retry_backoff * 2 ** attempt * random.uniform(0.5, 1)
+
+    def send(self, endpoint, query):
+        """
+        POST a query, retrying timeouts, connection errors, 429 and 5xx responses up to max_retries times.
+        Raises IGDBError subclasses; only failures of IGDB itself count towards the circuit breaker.
+        Every call ends with success(), failure() or release() of the breaker, so a trial call is never left open.
+        """
+        self.breaker.before()
+        settled = False
+        try:
+            attempt, token_refreshed = 0, False
+            while True:
+                token = self.tokens.get()
+                try:
+                    response = self.session.post(self.base_url + endpoint, data=query, timeout=self.timeout,
+                                                 headers={'Authorization': f'Bearer {token}'})
+                except (requests.ConnectionError, requests.Timeout) as error:
+                    failure, retry_after, rate_limited = IGDBUnavailable(f"{endpoint}: {error}"), None, False
+                else:
+                    if response.status_code == 401 and self.tokens.can_refresh and not token_refreshed:
+                        self.tokens.refresh(rejected_token=token)
+                        token_refreshed = True
+                        continue
+                    if response.status_code not in RETRY_STATUSES:
+                        settled = True
+                        self.breaker.success()
+                        if not response.ok:
+                            raise IGDBResponseError(endpoint, response)
+                        try:
+                            return response.json()
+                        except ValueError as error:
+                            raise IGDBResponseError(endpoint, response) from error
+                    failure, retry_after = IGDBResponseError(endpoint, response), get_retry_after(response)
+                    rate_limited = response.status_code == 429
+
+                delay = self.get_retry_delay(attempt, retry_after) if attempt < self.max_retries else None
+                if delay is None:
+                    settled = True
+                    if rate_limited:
+                        self.breaker.release()
+                    else:
+                        self.breaker.failure()
+                    raise failure
+                attempt += 1
+                self.sleep(delay)
+                self.limiter.acquire()
+        finally:
+            if not settled:  # token errors, other request exceptions, interrupted retries
+                self.breaker.failure()
+
+    def request(self, endpoint, query):
+        self.limiter.acquire()
+        return self.send(endpoint, query)
+
+    def post(self, endpoint, query, fresh=False):
+        if self.cache is not None:
+            read = self.cache.refresh if fresh else self.cache.fetch
+            return read(endpoint, query, lambda: self.request(endpoint, query))
+        return self.request(endpoint, query)
+
+    async def apost(self, endpoint, query):
+        if self.cache is not None:
+            return await asyncio.to_thread(self.post, endpoint, query)
+        await self.limiter.acquire_async()
+        return await asyncio.to_thread(self.send, endpoint, query)
+
+    # ************************************* lookups *************************************
+
+    def get_genres(self):
+        return self.post('genres', 'fields id, name; limit 50;')
+
+    def get_perspectives(self):
+        return self.post('player_perspectives', 'fields name;')
+
+    def search_games(self, name):
+        return self.post('games', f'fields id, name, first_release_date; search "{name}"; limit 100;', fresh=True)
+
+    @staticmethod
+    def game_query(game_id):
+        return f'fields {GAME_FIELDS}; where id = {game_id};'
+
+    @staticmethod
+    def first(data, key=None):
+        if not data:
+            return None
+        return data[0].get(key) if key else data[0]
+
+    async def aget_game(self, game_id):
+        return self.first(await self.apost('games', self.game_query(game_id)))
+
+    async def aget_cover_url(self, game_id):
+        return self.first(await self.apost('covers', f'fields url; where game = {game_id};'), 'url')
+
+    async def aget_franchise_name(self, franchise_id):
+        return self.first(await self.apost('franchises', f'fields name; where id = {franchise_id};'), 'name')
+
+    async def aget_game_data(self, game_id, with_franchise=True):
+        """
+        Fetch a game together with its cover url and franchise name.
+        The cover lookup runs concurrently with the game lookup, the franchise lookup
+        starts as soon as the franchise id is known (skipped with with_franchise=False).
+        """
+        cover_task = asyncio.create_task(self.aget_cover_url(game_id))
+        try:
+            game = await self.aget_game(game_id)
+        except BaseException:
+            cover_task.cancel()
+            raise
+        franchises = game.get('franchises') if game and with_franchise else None
+        franchise_name = await self.aget_franchise_name(franchises[0]) if franchises else None
+        cover_url = await cover_task
+        if game is None:
+            return None
+        return {'game': game, 'cover_url': cover_url, 'franchise_name': franchise_name}
+
+    async def aget_games_data(self, game_ids, with_franchise=True):
+        return await asyncio.gather(*(self.aget_game_data(game_id, with_franchise) for game_id in game_ids))
+
+    def get_game_data(self, game_id, with_franchise=True):
+        return asyncio.run(self.aget_game_data(game_id, with_franchise))
+
+    def get_games_data(self, game_ids, with_franchise=True):
+        return asyncio.run(self.aget_games_data(game_ids, with_franchise))
+
+    def get_cover_url(self, game_id):
+        return self.first(self.post('covers', f'fields url; where game = {game_id};'), 'url')
+
+    def get_franchise_name(self, franchise_id):
+        return self.first(self.post('franchises', f'fields name; where id = {franchise_id};'), 'name')
+
+    def get_game_fields(self, game_id, fields, fresh=False):
+        return self.first(self.post('games', f'fields {fields}; where id = {game_id};', fresh=fresh))
+
+    def find_franchise(self, franchise_name):
+        return self.first(self.post('franchises', f'fields id, name; where name = "{franchise_name}";'))
+
+    # ************************************* batch lookups *************************************
+
+    def get_games(self, game_ids, fields=GAME_FIELDS, batch_size=BATCH_SIZE, fresh=False):
+        """
+        Fetch many games, up to batch_size ids per request
+        """
+        games = []
+        for batch in batches(game_ids, batch_size):
+            games += self.post('games', f'fields {fields}; where id = {id_list(batch)}; limit {len(batch)};',
+                               fresh=fresh)
+        return games
+
+    def get_updated_games(self, game_ids, since, fields=GAME_FIELDS, batch_size=BATCH_SIZE):
+        """
+        Fetch only those of game_ids updated after the `since` unix timestamp, in pages of batch_size ids
+        """
+        games = []
+        for batch in batches(game_ids, batch_size):
+            games += self.post('games', f'fields {fields}, updated_at; '
+                                        f'where id = {id_list(batch)} & updated_at > {int(since)}; '
+                                        f'sort updated_at asc; limit {len(batch)};', fresh=True)
+        return games
+
+    def get_franchises(self, franchise_ids):
+        franchises = []
+        for batch in batches(franchise_ids):
+            franchises += self.post('franchises', f'fields id, name; where id = {id_list(batch)}; '
+                                                  f'limit {len(batch)};')
+        return franchises
+
+    def multiquery(self, queries):
+        """
+        Run (endpoint, name, query) triples through the /multiquery endpoint,
+        MULTIQUERY_SIZE per request. Returns a dict name -> result.
+        """
+        results = {}
+        for batch in batches(queries, MULTIQUERY_SIZE):
+            body = ''.join(f'query {endpoint} "{name}" {{ {query} }};' for endpoint, name, query in batch)
+            for result in self.post('multiquery', body):
+                results[result['name']] = result['result']
+        return results
+
+    def get_games_lookups(self, game_ids, with_franchise=True):
+        """
+        Batch variant of get_game_data: games, covers and franchises of up to BATCH_SIZE games
+        are fetched by a single multiquery request. Unknown games are skipped.
+        """
+        queries = []
+        for number, batch in enumerate(batches(game_ids)):
+            ids, limit = id_list(batch), len(batch)
+            queries += [('games', f'games-{number}', f'fields {GAME_FIELDS}; where id = {ids}; limit {limit};'),
+                        ('covers', f'covers-{number}', f'fields game, url; where game = {ids}; limit {limit};')]
+            if with_franchise:
+                queries.append(('franchises', f'franchises-{number}',
+                                f'fields id, name; where games = {ids}; limit {BATCH_SIZE};'))
+        results = self.multiquery(queries)
+
+        games, cover_urls, franchise_names = {}, {}, {}
+        for name, result in results.items():
+            for row in result:
+                if name.startswith('games'):
+                    games[row['id']] = row
+                elif name.startswith('covers'):
+                    cover_urls.setdefault(row['game'], row.get('url'))
+                else:
+                    franchise_names[row['id']] = row.get('name')
+
+        lookups = []
+        for game_id in game_ids:
+            game = games.get(int(game_id))
+            if game is None:
+                continue
+            franchises = game.get('franchises')
+            lookups.append({'game': game,
+                            'cover_url': cover_urls.get(game['id']),
+                            'franchise_name': franchise_names.get(franchises[0]) if franchises else None})
+        return lookups
@@ -0,0 +1,102 @@
+"""
+Background jobs
+Catalogue operations talking to IGDB run in the run_jobs worker, so web workers never wait for IGDB.
+A view enqueues a Job and redirects to its progress page, which polls the job status until it finishes.
+A failing job is retried with exponential backoff (JOB_RETRY_BACKOFF, doubled per attempt) up to max_attempts times.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from games_app import api_utils
+from games_app.models import Job
+
+JOB_KINDS = {}
+
+
+class UnknownJobKind(Exception):
+    pass
+
+
+def job_kind(kind):
+    """
+    Register a job function under `kind`, it is called with the job and the job's arguments
+    """
+    def register(function):
+        JOB_KINDS[kind] = function
+        return function
+    return register
+
+
+@job_kind('find_games')
+def find_games(job, title):
+    job.report(f"Searching IGDB for '{title}'...")
+    return {'title': title, 'games': api_utils.find_game_id(title)}
+
+
+@job_kind('import_games')
+def import_games(job, games):
+    """
+    Import the games selected from search results, `games` being a list of {'id', 'title'}
+    """
+    imported = set(api_utils.import_selected_games([game['id'] for game in games], report=job.report))
+    return {'imported': [game for game in games if game['id'] in imported],
+            'skipped': [game for game in games if game['id'] not in imported]}
+
+
+@job_kind('refresh_ratings')
+def refresh_ratings(job):
+    job.report('Fetching ratings of all games...')
+    return {'updated': api_utils.update_ratings()}
+
+
+@job_kind('resolve_franchises')
+def resolve_franchises(job):
+    job.report('Resolving franchises of games without one...')
+    return {'resolved': api_utils.find_and_save_games_franchises()}
+
+
+def get_backoff(attempts):
+    return timedelta(seconds=settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1))
+
+
+def run_job(job):
+    """
+    Run a claimed job and store its result, or schedule its retry, or mark it failed
+    """
+    try:
+        function = JOB_KINDS.get(job.kind)
+        if function is None:
+            raise UnknownJobKind(f"Unknown job kind '{job.kind}'.")
+        result = function(job, **job.arguments)
+    except Exception as error:
+        job.error = f'{type(error).__name__}: {error}'
+        if job.attempts < job.max_attempts and not isinstance(error, UnknownJobKind):
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + get_backoff(job.attempts)
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.DONE
+        job.result = result
+        job.error = ''
+        job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'run_after', 'finished_at'])
+    return job
+
+
+def run_due_jobs(limit=None):
+    """
+    Run due jobs one by one until none is due (or `limit` jobs ran). Returns the finished or rescheduled jobs.
+    """
+    Job.objects.requeue_stale()
+    jobs = []
+    while limit is None or len(jobs) < limit:
+        job = Job.objects.claim()
+        if job is None:
+            break
+        jobs.append(run_job(job))
+    return jobs
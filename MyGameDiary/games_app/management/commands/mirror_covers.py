@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from games_app.covers import Image, mirror_covers
+from games_app.models import Game
+
+
+class Command(BaseCommand):
+    help = ('Download the covers of games not mirrored yet (or changed since) and store their resized '
+            'WebP/JPEG variants in MEDIA_ROOT/covers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Mirror the covers of all games again.')
+        parser.add_argument('--limit', type=int, help='Look at no more than this many games.')
+
+    def handle(self, *args, **options):
+        if Image is None:
+            self.stderr.write('Pillow is not installed, covers are stored unchanged without resized variants.')
+        games = Game.objects.only('pk', 'name', 'year', 'cover_url', 'cover_variants').order_by('pk')
+        if options['limit']:
+            games = games[:options['limit']]
+        mirrored, failed = mirror_covers(games.iterator(), force=options['force'])
+        message = f"Mirrored {mirrored} cover{'s' if mirrored != 1 else ''}."
+        if failed:
+            raise CommandError(f"{message} {failed} failed.")
+        self.stdout.write(self.style.SUCCESS(message))
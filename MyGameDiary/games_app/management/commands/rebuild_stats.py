@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from games_app.models import GameStats, SiteStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized game and site statistics from scratch, or check them for drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report differences between stored and live statistics.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            differences = GameStats.objects.drift() + SiteStats.objects.drift()
+            for difference in differences:
+                self.stdout.write(difference)
+            if differences:
+                raise CommandError(f"Found {len(differences)} statistics difference"
+                                   f"{'s' if len(differences) != 1 else ''}.")
+            self.stdout.write(self.style.SUCCESS('Statistics are consistent.'))
+            return
+        count = GameStats.objects.rebuild()
+        SiteStats.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt statistics of {count} game"
+                                             f"{'s' if count != 1 else ''} and site statistics."))
@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from games_app.jobs import run_due_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued catalogue jobs (IGDB searches, game imports, rating and franchise refreshes).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the jobs due now and exit.')
+        parser.add_argument('--poll', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds to sleep when no job is due.')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                for job in run_due_jobs():
+                    message = f"{job}: {job.error or job.result}"
+                    self.stdout.write(self.style.SUCCESS(message) if job.status == job.DONE else message)
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker stopped.')
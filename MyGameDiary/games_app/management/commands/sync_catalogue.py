@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from games_app.api_utils import sync_catalogue
+
+
+class Command(BaseCommand):
+    help = 'Update games changed on IGDB since the last sync.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Ignore the stored watermark and check every game.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report changes without saving them.')
+
+    def handle(self, *args, **options):
+        changes = sync_catalogue(full=options['full'], dry_run=options['dry_run'])
+        for game, field, old_value, new_value in changes:
+            self.stdout.write(f"{game}: {field} {old_value!r} -> {new_value!r}")
+        games_count = len({game.pk for game, *values in changes})
+        message = (f"{'Found' if options['dry_run'] else 'Successfully saved'} {len(changes)} change"
+                   f"{'s' if len(changes) != 1 else ''} in {games_count} game{'s' if games_count != 1 else ''}.")
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,78 @@
+# Generated by Django 4.2 on 2026-10-18 07:51
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def build_stats(apps, schema_editor):
+    Game = apps.get_model('games_app', 'Game')
+    GameStats = apps.get_model('games_app', 'GameStats')
+    SiteStats = apps.get_model('games_app', 'SiteStats')
+    GameCard = apps.get_model('players_app', 'GameCard')
+    Profile = apps.get_model('players_app', 'Profile')
+
+    games = Game.objects.order_by().annotate(
+        live_total_gamecards=Count('gamecard'),
+        live_public_gamecards=Count('gamecard', filter=Q(gamecard__profile__is_private=False)),
+        live_total_finished=Count('gamecard', filter=Q(gamecard__is_finished=True)),
+        live_total_hours=Coalesce(Sum('gamecard__hours_played'), 0),
+    )
+    GameStats.objects.bulk_create([
+        GameStats(game_id=game.pk,
+                  total_gamecards=game.live_total_gamecards,
+                  public_gamecards=game.live_public_gamecards,
+                  total_finished=game.live_total_finished,
+                  total_hours=game.live_total_hours)
+        for game in games
+    ])
+    SiteStats.objects.create(
+        pk=1,
+        total_games=Game.objects.count(),
+        total_profiles=Profile.objects.count(),
+        total_private=Profile.objects.filter(is_private=True).count(),
+        total_gamecards=GameCard.objects.count(),
+        total_finished=GameCard.objects.filter(is_finished=True).count(),
+        total_hours=GameCard.objects.aggregate(hours=Coalesce(Sum('hours_played'), 0))['hours'],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games_app', '0012_alter_game_options'),
+        ('players_app', '0017_alter_gamecard_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameStats',
+            fields=[
+                ('game', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='games_app.game')),
+                ('total_gamecards', models.PositiveIntegerField(default=0)),
+                ('public_gamecards', models.PositiveIntegerField(default=0)),
+                ('total_finished', models.PositiveIntegerField(default=0)),
+                ('total_hours', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'game stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='SiteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_games', models.PositiveIntegerField(default=0)),
+                ('total_profiles', models.PositiveIntegerField(default=0)),
+                ('total_private', models.PositiveIntegerField(default=0)),
+                ('total_gamecards', models.PositiveIntegerField(default=0)),
+                ('total_finished', models.PositiveIntegerField(default=0)),
+                ('total_hours', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'site stats',
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 4.2 on 2026-10-18 07:59
+
+from django.db import migrations, models
+
+# The FTS5 indexes of game, ordering and franchise names as of this migration, kept in sync by triggers.
+# games_app.search recreates them after every migrate (even one that unapplied this migration),
+# so the statements do not fail on existing objects.
+CREATE_FTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS games_app_game_fts USING fts5(name, ordering_name, prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS games_app_game_fts_insert AFTER INSERT ON games_app_game BEGIN "
+    "INSERT INTO games_app_game_fts (rowid, name, ordering_name) VALUES (new.id, new.name, new.ordering_name); END",
+    "CREATE TRIGGER IF NOT EXISTS games_app_game_fts_update AFTER UPDATE ON games_app_game BEGIN "
+    "DELETE FROM games_app_game_fts WHERE rowid = old.id; "
+    "INSERT INTO games_app_game_fts (rowid, name, ordering_name) VALUES (new.id, new.name, new.ordering_name); END",
+    "CREATE TRIGGER IF NOT EXISTS games_app_game_fts_delete AFTER DELETE ON games_app_game BEGIN "
+    "DELETE FROM games_app_game_fts WHERE rowid = old.id; END",
+    "DELETE FROM games_app_game_fts",
+    "INSERT INTO games_app_game_fts (rowid, name, ordering_name) SELECT id, name, ordering_name FROM games_app_game",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS games_app_franchise_fts USING fts5(name, prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS games_app_franchise_fts_insert AFTER INSERT ON games_app_franchise BEGIN "
+    "INSERT INTO games_app_franchise_fts (rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS games_app_franchise_fts_update AFTER UPDATE ON games_app_franchise BEGIN "
+    "DELETE FROM games_app_franchise_fts WHERE rowid = old.id; "
+    "INSERT INTO games_app_franchise_fts (rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS games_app_franchise_fts_delete AFTER DELETE ON games_app_franchise BEGIN "
+    "DELETE FROM games_app_franchise_fts WHERE rowid = old.id; END",
+    "DELETE FROM games_app_franchise_fts",
+    "INSERT INTO games_app_franchise_fts (rowid, name) SELECT id, name FROM games_app_franchise",
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS games_app_game_fts_insert",
+    "DROP TRIGGER IF EXISTS games_app_game_fts_update",
+    "DROP TRIGGER IF EXISTS games_app_game_fts_delete",
+    "DROP TABLE IF EXISTS games_app_game_fts",
+    "DROP TRIGGER IF EXISTS games_app_franchise_fts_insert",
+    "DROP TRIGGER IF EXISTS games_app_franchise_fts_update",
+    "DROP TRIGGER IF EXISTS games_app_franchise_fts_delete",
+    "DROP TABLE IF EXISTS games_app_franchise_fts",
+]
+
+
+def has_fts5(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return ('ENABLE_FTS5',) in cursor.fetchall()
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    """
+    RunSQL applied only on SQLite with FTS5, other databases search with LIKE queries
+    """
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if has_fts5(schema_editor.connection):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if has_fts5(schema_editor.connection):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games_app', '0014_syncwatermark'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='franchise',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        SQLiteRunSQL(CREATE_FTS, DROP_FTS),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 08:05
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games_app', '0015_game_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['ordering_name', 'year', 'name'], name='game_ordering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(django.db.models.functions.text.Lower('ordering_name'), models.F('year'), models.F('name'), name='game_folded_ordering_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games_app', '0016_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='cover_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,5 +1,12 @@
-from django.db import models
-from django.db.models import Sum
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Sum, Count, Q, F
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
 
 
 class Genre(models.Model):
@@ -23,7 +30,7 @@ class Perspective(models.Model):
 
 
 class Franchise(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
 
     class Meta:
         ordering = ['name', ]
@@ -40,13 +47,65 @@ class Franchise(models.Model):
 # ************************************* Game Model and Manager *************************************
 
 
+def get_prefix_range(prefix):
+    """
+    Bounds [lower, upper) of the case-folded strings starting with prefix
+    """
+    prefix = prefix.lower()
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
 class GameQuerySet(models.QuerySet):
-    def starts_with(self, query):
-        return self.filter(ordering_name__istartswith=query)
+    def update(self, **kwargs):
+        """
+        Queryset updates bypass save(), so the modification stamp read by conditional GETs is set here
+        """
+        kwargs.setdefault('updated_at', timezone.now())
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs, now = list(objs), timezone.now()
+        for obj in objs:
+            obj.updated_at = now
+        return super().bulk_update(objs, [*fields, 'updated_at'], batch_size=batch_size)
+
+    def starts_with(self, letter):
+        """
+        Case-insensitive prefix match as a range over the case-folded ordering name,
+        which can use the game_folded_ordering_idx index (istartswith/LIKE cannot)
+        """
+        if not letter:
+            return self.none()
+        lower, upper = get_prefix_range(letter)
+        return self.alias(folded_ordering_name=Lower('ordering_name')).filter(
+            folded_ordering_name__gte=lower, folded_ordering_name__lt=upper)
 
     def of_franchise(self, franchise):
         return self.filter(franchise=franchise)
 
+    def with_stats(self):
+        """
+        Join the materialized game statistics in the same query
+        """
+        return self.select_related('franchise', 'stats')
+
+    def for_detail(self):
+        """
+        Game detail: franchise and statistics joined, genres and perspectives prefetched
+        """
+        return self.with_stats().prefetch_related('genres', 'perspectives')
+
+    def with_live_stats(self):
+        """
+        Annotate every game with its game card statistics computed from GameCard in a single query
+        """
+        return self.annotate(
+            live_total_gamecards=Count('gamecard'),
+            live_public_gamecards=Count('gamecard', filter=Q(gamecard__profile__is_private=False)),
+            live_total_finished=Count('gamecard', filter=Q(gamecard__is_finished=True)),
+            live_total_hours=Coalesce(Sum('gamecard__hours_played'), 0),
+        )
+
 
 class GameManager(models.Manager):
     def get_queryset(self):
@@ -58,22 +117,37 @@ class GameManager(models.Manager):
     def of_franchise(self, franchise):
         return self.get_queryset().of_franchise(franchise)
 
+    def with_stats(self):
+        return self.get_queryset().with_stats()
+
+    def for_detail(self):
+        return self.get_queryset().for_detail()
+
+    def with_live_stats(self):
+        return self.get_queryset().with_live_stats()
+
 
 class Game(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     ordering_name = models.CharField(max_length=100, null=True, blank=True)
     cover_url = models.URLField()
+    cover_variants = models.JSONField(default=dict, blank=True)  # mirrored cover files, see games_app.covers
     year = models.IntegerField()
     rating = models.PositiveIntegerField(null=True, blank=True)
     summary = models.TextField(null=True, blank=True)
     franchise = models.ForeignKey(Franchise, on_delete=models.SET_NULL, null=True, blank=True)
     genres = models.ManyToManyField(Genre)
     perspectives = models.ManyToManyField(Perspective)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     objects = GameManager()
 
     class Meta:
         ordering = ['ordering_name', 'year', 'name']
+        indexes = [
+            models.Index(fields=['ordering_name', 'year', 'name'], name='game_ordering_idx'),
+            models.Index(Lower('ordering_name'), F('year'), F('name'), name='game_folded_ordering_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.year})"
@@ -114,27 +188,368 @@ class Game(models.Model):
             return '---'
         return f"{self.rating} / 100"
 
+    def get_stats(self):
+        """
+        The materialized statistics, computed and stored if the game was inserted without signals
+        """
+        try:
+            return self.stats
+        except GameStats.DoesNotExist:
+            self.stats = GameStats.objects.create_missing(self)
+            return self.stats
+
     @property
     def total_gamecards(self):
-        from players_app.models import GameCard
-        return GameCard.objects.about_game(game=self).count()
+        return self.get_stats().total_gamecards
 
     @property
     def public_gamecards(self):
-        from players_app.models import GameCard
-        return GameCard.objects.on_public_profiles(game=self).count()
+        return self.get_stats().public_gamecards
 
     @property
     def private_gamecards(self):
         return self.total_gamecards - self.public_gamecards
 
     def total_finished(self):
-        from players_app.models import GameCard
-        return GameCard.objects.about_game(game=self).filter(is_finished=True).count()
+        return self.get_stats().total_finished
 
     def total_hours(self):
-        from players_app.models import GameCard
-        hours = GameCard.objects.about_game(game=self).aggregate(Sum('hours_played'))['hours_played__sum']
-        if hours is None:
-            hours = 0
-        return hours
+        return self.get_stats().total_hours
+
+
+class SyncWatermark(models.Model):
+    """
+    SyncWatermark Model
+    remembers the IGDB updated_at timestamp up to which a catalogue sync has been done
+    """
+    name = models.CharField(max_length=31, unique=True)
+    value = models.BigIntegerField(default=0)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class DataVersionManager(models.Manager):
+    CACHE_KEY = 'data-version:{}'
+
+    def current(self, name):
+        """
+        Version of the data called name, read from the database at most once per DATA_VERSION_TIMEOUT seconds
+        """
+        key = self.CACHE_KEY.format(name)
+        value = cache.get(key)
+        if value is None:
+            value = self.get_or_create(name=name, defaults={'value': uuid4().hex})[0].value
+            cache.set(key, value, settings.DATA_VERSION_TIMEOUT)
+        return value
+
+    def replace(self, name):
+        """
+        Replace the version in this process now and in the database once the current transaction commits,
+        other processes see the new version within DATA_VERSION_TIMEOUT seconds
+        """
+        cache.set(self.CACHE_KEY.format(name), uuid4().hex, settings.DATA_VERSION_TIMEOUT)
+        transaction.on_commit(lambda: self.store(name))
+
+    def store(self, name):
+        value = uuid4().hex
+        if not self.filter(name=name).update(value=value):
+            self.get_or_create(name=name, defaults={'value': value})
+        cache.set(self.CACHE_KEY.format(name), value, settings.DATA_VERSION_TIMEOUT)
+
+
+class DataVersion(models.Model):
+    """
+    DataVersion Model
+    version of cached data kept in the database, so that invalidations reach every process
+    """
+    name = models.CharField(max_length=31, unique=True)
+    value = models.CharField(max_length=32)
+
+    objects = DataVersionManager()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+# ************************************* Statistics Models and Managers *************************************
+
+
+STATS_FIELDS = ['total_gamecards', 'public_gamecards', 'total_finished', 'total_hours']
+SITE_STATS_FIELDS = ['total_games', 'total_profiles', 'total_private', 'total_gamecards', 'total_finished',
+                     'total_hours']
+
+
+def get_stats_changes(fields, **deltas):
+    """
+    Translate non-zero deltas into F() expressions usable in QuerySet.update()
+    """
+    return {field: F(field) + deltas[field] for field in fields if deltas.get(field)}
+
+
+class GameStatsManager(models.Manager):
+    def apply(self, game_id, **deltas):
+        """
+        Atomically add deltas (e.g. total_gamecards=1, total_hours=-5) to the statistics of a game
+        """
+        changes = get_stats_changes(STATS_FIELDS, **deltas)
+        if changes:
+            self.filter(game_id=game_id).update(**changes)
+
+    def create_missing(self, game):
+        """
+        Compute the statistics of a game from GameCard and store them
+        """
+        live = Game.objects.with_live_stats().filter(pk=game.pk).values(
+            *[f'live_{field}' for field in STATS_FIELDS]).order_by('pk').first() or {}
+        stats, created = self.get_or_create(
+            game_id=game.pk, defaults={field: live.get(f'live_{field}', 0) for field in STATS_FIELDS})
+        return stats
+
+    def rebuild(self):
+        """
+        Recompute statistics of all games from scratch
+        """
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create([
+                GameStats(game_id=game.pk, **{field: getattr(game, f'live_{field}') for field in STATS_FIELDS})
+                for game in Game.objects.with_live_stats().order_by()
+            ])
+        return self.count()
+
+    def drift(self):
+        """
+        Return a list of differences between stored and live statistics
+        """
+        stored = {stats.game_id: stats for stats in self.all()}
+        differences = []
+        for game in Game.objects.with_live_stats().order_by():
+            stats = stored.pop(game.pk, None)
+            if stats is None:
+                differences.append(f"{game}: statistics are missing")
+                continue
+            for field in STATS_FIELDS:
+                stored_value, live_value = getattr(stats, field), getattr(game, f'live_{field}')
+                if stored_value != live_value:
+                    differences.append(f"{game}: {field} is {stored_value}, should be {live_value}")
+        for game_id in stored:
+            differences.append(f"Game {game_id}: statistics exist for a missing game")
+        return differences
+
+
+class GameStats(models.Model):
+    """
+    GameStats Model
+    materialized game card statistics of a game, kept current by GameCard and Profile signals
+    """
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_gamecards = models.PositiveIntegerField(default=0)
+    public_gamecards = models.PositiveIntegerField(default=0)
+    total_finished = models.PositiveIntegerField(default=0)
+    total_hours = models.PositiveIntegerField(default=0)
+
+    objects = GameStatsManager()
+
+    class Meta:
+        verbose_name_plural = 'game stats'
+
+    def __str__(self):
+        return f"{self.game} - {self.total_gamecards} game cards"
+
+
+class SiteStatsManager(models.Manager):
+    CACHE_KEY = 'site-stats:{}'
+    VERSION_NAME = 'site-stats'
+
+    def current(self):
+        """
+        The statistics row, rebuilt from the source tables if it is missing
+        """
+        return self.filter(pk=SiteStats.SINGLETON_PK).first() or self.rebuild()
+
+    def cached(self):
+        """
+        Site-wide statistics served from the cache, shared by the homepage and the list views
+        """
+        key = self.CACHE_KEY.format(DataVersion.objects.current(self.VERSION_NAME))
+        stats = cache.get(key)
+        if stats is None:
+            stats = self.current()
+            cache.set(key, stats, settings.SITE_STATS_CACHE_TIMEOUT)
+        return stats
+
+    def invalidate(self):
+        """
+        Replace the version the cached statistics are keyed on, in all processes
+        """
+        DataVersion.objects.replace(self.VERSION_NAME)
+
+    def apply(self, **deltas):
+        """
+        Atomically add deltas (e.g. total_games=1) to the site-wide statistics
+        """
+        changes = get_stats_changes(SITE_STATS_FIELDS, **deltas)
+        if changes and not self.filter(pk=SiteStats.SINGLETON_PK).update(**changes):
+            self.rebuild()
+        if changes:
+            self.invalidate()
+
+    def live(self):
+        """
+        Compute site-wide statistics from the source tables
+        """
+        from players_app.models import GameCard, Profile
+        values = {
+            'total_games': Game.objects.count(),
+            'total_profiles': Profile.objects.count(),
+            'total_private': Profile.objects.filter(is_private=True).count(),
+        }
+        values.update(GameCard.objects.totals())
+        return values
+
+    def rebuild(self):
+        with transaction.atomic():
+            stats, created = self.update_or_create(pk=SiteStats.SINGLETON_PK, defaults=self.live())
+        self.invalidate()
+        return stats
+
+    def drift(self):
+        stats = self.filter(pk=SiteStats.SINGLETON_PK).first()
+        if stats is None:
+            return ["Site statistics are missing"]
+        differences = []
+        for field, live_value in self.live().items():
+            if getattr(stats, field) != live_value:
+                differences.append(f"Site: {field} is {getattr(stats, field)}, should be {live_value}")
+        return differences
+
+
+class SiteStats(models.Model):
+    """
+    SiteStats Model
+    a single row holding materialized site-wide statistics
+    """
+    SINGLETON_PK = 1
+
+    total_games = models.PositiveIntegerField(default=0)
+    total_profiles = models.PositiveIntegerField(default=0)
+    total_private = models.PositiveIntegerField(default=0)
+    total_gamecards = models.PositiveIntegerField(default=0)
+    total_finished = models.PositiveIntegerField(default=0)
+    total_hours = models.PositiveIntegerField(default=0)
+
+    objects = SiteStatsManager()
+
+    class Meta:
+        verbose_name_plural = 'site stats'
+
+    def __str__(self):
+        return f"{self.total_games} games, {self.total_gamecards} game cards"
+
+
+# ************************************* Job Queue Models and Managers *************************************
+
+
+class JobQuerySet(models.QuerySet):
+    def due(self, now=None):
+        return self.filter(status=Job.PENDING, run_after__lte=now or timezone.now())
+
+    def unfinished(self):
+        return self.filter(status__in=[Job.PENDING, Job.RUNNING])
+
+    def stale(self, now=None):
+        """
+        Running jobs whose worker most likely died
+        """
+        limit = (now or timezone.now()) - timedelta(seconds=settings.JOB_TIMEOUT)
+        return self.filter(status=Job.RUNNING, started_at__lt=limit)
+
+
+class JobManager(models.Manager):
+    def get_queryset(self):
+        return JobQuerySet(self.model, using=self._db)
+
+    def unfinished(self):
+        return self.get_queryset().unfinished()
+
+    def enqueue(self, kind, **arguments):
+        return self.create(kind=kind, arguments=arguments, max_attempts=settings.JOB_MAX_ATTEMPTS)
+
+    def enqueue_once(self, kind, **arguments):
+        """
+        Return the unfinished job of kind with the same arguments, queue a new one when there is none
+        """
+        job = self.get_queryset().unfinished().filter(kind=kind, arguments=arguments).order_by('pk').first()
+        return job or self.enqueue(kind, **arguments)
+
+    def claim(self):
+        """
+        Mark the oldest due job running and return it, None when no job is due.
+        The conditional update guarantees that concurrent workers never claim the same job.
+        """
+        now = timezone.now()
+        for job in self.get_queryset().due(now).order_by('run_after', 'pk')[:10]:
+            if self.filter(pk=job.pk, status=Job.PENDING).update(status=Job.RUNNING, started_at=now,
+                                                                 attempts=F('attempts') + 1):
+                job.refresh_from_db()
+                return job
+        return None
+
+    def requeue_stale(self):
+        """
+        Queue abandoned jobs again, fail those that used up their attempts (e.g. a job that kills the worker).
+        Returns the number of queued jobs.
+        """
+        now = timezone.now()
+        self.get_queryset().stale(now).filter(attempts__gte=F('max_attempts')).update(
+            status=Job.FAILED, finished_at=now, error='The worker stopped while running the job.')
+        return self.get_queryset().stale(now).update(status=Job.PENDING, run_after=now)
+
+
+class Job(models.Model):
+    """
+    Job Model
+    a catalogue operation talking to IGDB, run by the run_jobs worker instead of the web request (games_app.jobs)
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=31)
+    arguments = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    progress = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    objects = JobManager()
+
+    class Meta:
+        ordering = ['-pk']
+        indexes = [
+            models.Index(fields=['run_after'], condition=Q(status='pending'), name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (Job.DONE, Job.FAILED)
+
+    def report(self, progress):
+        """
+        Store a progress message shown on the job page while the job runs
+        """
+        self.progress = progress[:255]
+        Job.objects.filter(pk=self.pk).update(progress=self.progress)
@@ -0,0 +1,119 @@
+"""
+Server-side game search
+On SQLite, games are matched through FTS5 indexes of game, ordering and franchise names
+kept in sync with their tables by triggers. Other databases fall back to LIKE queries.
+"""
+
+import re
+
+from django.db import connections, DEFAULT_DB_ALIAS, OperationalError
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from games_app.models import Game
+
+GAME_FTS_TABLE = 'games_app_game_fts'
+FRANCHISE_FTS_TABLE = 'games_app_franchise_fts'
+
+# Each trigger only touches its own table and FTS table: SQLite rejects renames of tables
+# while other tables' triggers refer to them, which would break migrations that rebuild a table.
+FTS_TABLES = {
+    GAME_FTS_TABLE: ('games_app_game', ['name', 'ordering_name']),
+    FRANCHISE_FTS_TABLE: ('games_app_franchise', ['name']),
+}
+
+
+def get_fts_triggers(fts_table, table, columns):
+    values = ', '.join(f'new.{column}' for column in columns)
+    insert = f"INSERT INTO {fts_table} (rowid, {', '.join(columns)}) VALUES (new.id, {values});"
+    delete = f"DELETE FROM {fts_table} WHERE rowid = old.id;"
+    return {f'{fts_table}_insert': f"AFTER INSERT ON {table} BEGIN {insert} END",
+            f'{fts_table}_update': f"AFTER UPDATE ON {table} BEGIN {delete} {insert} END",
+            f'{fts_table}_delete': f"AFTER DELETE ON {table} BEGIN {delete} END"}
+
+
+fts_tables = {}  # database alias -> FTS index available
+
+
+def create_fts_index(connection):
+    """
+    Create the FTS indexes and their triggers if they are missing (SQLite drops the triggers whenever
+    a migration rebuilds the table), and refill an index when any of its triggers had to be recreated.
+    Returns False when the database does not support FTS5.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing_triggers = {row[0] for row in cursor.fetchall()}
+        for fts_table, (table, columns) in FTS_TABLES.items():
+            try:
+                cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} "
+                               f"USING fts5({', '.join(columns)}, prefix='2 3')")
+            except OperationalError:  # SQLite compiled without FTS5
+                return False
+            triggers = get_fts_triggers(fts_table, table, columns)
+            missing_triggers = [name for name in triggers if name not in existing_triggers]
+            for name in missing_triggers:
+                cursor.execute(f"CREATE TRIGGER {name} {triggers[name]}")
+            if missing_triggers:
+                cursor.execute(f"DELETE FROM {fts_table}")
+                cursor.execute(f"INSERT INTO {fts_table} (rowid, {', '.join(columns)}) "
+                               f"SELECT id, {', '.join(columns)} FROM {table}")
+    fts_tables[connection.alias] = True
+    return True
+
+
+def drop_fts_index(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for fts_table, (table, columns) in FTS_TABLES.items():
+            for name in get_fts_triggers(fts_table, table, columns):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {fts_table}")
+    fts_tables.pop(connection.alias, None)
+
+
+def ensure_fts_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate receiver
+    """
+    fts_tables.pop(using, None)
+    create_fts_index(connections[using])
+
+
+def fts_enabled(using=DEFAULT_DB_ALIAS):
+    if using not in fts_tables:
+        connection = connections[using]
+        fts_tables[using] = (connection.vendor == 'sqlite'
+                             and set(FTS_TABLES) <= set(connection.introspection.table_names()))
+    return fts_tables[using]
+
+
+def get_search_terms(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def fts_match(fts_table, term):
+    return RawSQL(f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s", [f'"{term}"*'])
+
+
+def search_games(text):
+    """
+    Games whose name, ordering name or franchise name contain a word starting with each term of text
+    (a substring instead of a word prefix on databases without FTS5)
+    """
+    terms = get_search_terms(text)
+    if not terms:
+        return Game.objects.none()
+    games = Game.objects.select_related('franchise')
+    use_fts = fts_enabled()
+    for term in terms:
+        if use_fts:
+            games = games.filter(Q(pk__in=fts_match(GAME_FTS_TABLE, term))
+                                 | Q(franchise__in=fts_match(FRANCHISE_FTS_TABLE, term)))
+        else:
+            games = games.filter(Q(name__icontains=term) | Q(ordering_name__icontains=term)
+                                 | Q(franchise__name__icontains=term))
+    return games
@@ -0,0 +1,45 @@
+"""
+Signal receivers keeping the materialized game statistics and the catalogue cache current
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from games_app.cache import invalidate_catalogue
+from games_app.models import Franchise, Game, GameStats, SiteStats
+
+
+@receiver(post_save, sender=Game)
+def create_game_stats(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    with transaction.atomic():
+        GameStats.objects.get_or_create(game=instance)
+        SiteStats.objects.apply(total_games=1)
+
+
+@receiver(post_delete, sender=Game)
+def remove_game_from_site_stats(sender, instance, **kwargs):
+    SiteStats.objects.apply(total_games=-1)
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+@receiver(post_save, sender=Franchise)
+@receiver(post_delete, sender=Franchise)
+@receiver(m2m_changed, sender=Game.genres.through)
+@receiver(m2m_changed, sender=Game.perspectives.through)
+def invalidate_catalogue_on_change(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_catalogue()
+
+
+@receiver(post_save, sender=Franchise)
+@receiver(pre_delete, sender=Franchise)
+def touch_franchise_games(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Games show the franchise name, so their modification stamp (see ConditionalGetMixin) changes with it
+    """
+    if not created and not raw:
+        Game.objects.filter(franchise=instance).update()
@@ -0,0 +1,25 @@
+from django import template
+
+from games_app.covers import get_cover_sources
+
+register = template.Library()
+
+
+@register.inclusion_tag('snippets/cover-image.html')
+def cover_image(game, size, css_class='border rounded', lazy=True, sizes=None):
+    """
+    Render the cover of game drawn at `size` (pixels, or a width attribute like '90%' together with
+    the `sizes` the browser picks the variant by): the mirrored WebP/JPEG variants with srcset when available,
+    the original cover url otherwise
+    """
+    pixels = size if isinstance(size, int) else None
+    src, srcsets = get_cover_sources(game, pixels)
+    return {
+        'game': game,
+        'src': src,
+        'srcsets': srcsets,
+        'sizes': sizes or (f'{pixels}px' if pixels else '100vw'),
+        'size': size,
+        'css_class': css_class,
+        'lazy': lazy,
+    }
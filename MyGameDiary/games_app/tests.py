@@ -1,3 +1,1331 @@
-from django.test import TestCase
+import gzip
+import json
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command, CommandError
+from django.db import connection, connections
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from MyGameDiary import compression, instrumentation
+from MyGameDiary.db import get_database_config
+from MyGameDiary.pagination import KeysetPaginator
+from games_app import api_utils, covers, jobs
+from games_app.igdb_cache import CacheMiss, ResponseCache
+from games_app.igdb_client import (AccessTokens, CircuitBreaker, IGDBAuthError, IGDBClient, IGDBResponseError,
+                                   IGDBUnavailable, TokenBucket, get_retry_after)
+from games_app import search
+from games_app.cache import invalidate_catalogue
+from games_app.models import (DataVersion, Franchise, Game, GameStats, SiteStats, Genre, Job, Perspective,
+                              SyncWatermark)
+from games_app.views import GameSearchView
+from players_app.models import GameCard, Profile
+
+
+class GameListViewQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='player', password='secret-password')
+        cls.profile = Profile.objects.create(user=cls.user)
+        cls.other_profile = Profile.objects.create(user=User.objects.create_user(username='other'))
+        cls.franchise = Franchise.objects.create(id=1, name='The Elder Scrolls')
+
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def add_games(cls, count):
+        start = Game.objects.count()
+        for number in range(start, start + count):
+            game = Game.objects.create(id=number + 1, name=f'Game {number}', ordering_name=f'Game {number}',
+                                       cover_url='https://example.com/cover.jpg', year=2000 + number % 20,
+                                       franchise=cls.franchise if number % 2 else None)
+            GameCard.objects.create(profile=cls.other_profile, game=game, is_finished=True, hours_played=10)
+            if number % 3 == 0:
+                GameCard.objects.create(profile=cls.profile, game=game, hours_played=5)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('games_app:game_list') + '?display=all')
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_query_count_is_flat_for_anonymous_user(self):
+        self.add_games(3)
+        small_catalogue, _ = self.count_queries()
+        self.add_games(30)
+        large_catalogue, _ = self.count_queries()
+        self.assertEqual(small_catalogue, large_catalogue)
+
+    def test_query_count_is_flat_for_logged_user(self):
+        self.client.force_login(self.user)
+        self.add_games(3)
+        self.count_queries()  # the first request caches the user's groups in the session
+        invalidate_catalogue()
+        SiteStats.objects.invalidate()
+        small_catalogue, _ = self.count_queries()
+        self.add_games(30)
+        large_catalogue, _ = self.count_queries()
+        self.assertEqual(small_catalogue, large_catalogue)
+
+    def test_game_stats_and_gamecard_pks(self):
+        self.client.force_login(self.user)
+        self.add_games(4)
+        _, response = self.count_queries()
+        games_data = {game_data['game'].pk: game_data for game_data in response.context['games_data']}
+        first = games_data[1]
+        self.assertEqual(first['game'].total_gamecards, 2)
+        self.assertEqual(first['game'].total_finished(), 1)
+        self.assertEqual(first['game'].total_hours(), 15)
+        self.assertEqual(first['gamecard_pk'],
+                         GameCard.objects.about_game(game=first['game']).on_profile(profile=self.profile).get().pk)
+        self.assertIsNone(games_data[2]['gamecard_pk'])
+        self.assertEqual(response.context['total_gamecards'], 6)
+        self.assertEqual(response.context['total_finished'], 4)
+        self.assertEqual(response.context['total_hours'], 50)
+
+
+class GameStatsSignalsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = Profile.objects.create(user=User.objects.create_user(username='player'))
+        cls.game = Game.objects.create(id=1, name='Morrowind', cover_url='https://example.com/cover.jpg', year=2002)
+        cls.other_game = Game.objects.create(id=2, name='Oblivion', cover_url='https://example.com/cover.jpg',
+                                             year=2006)
+
+    def assertStats(self, game, **expected):
+        stats = GameStats.objects.get(game=game)
+        self.assertEqual({field: getattr(stats, field) for field in expected}, expected)
+
+    def assertConsistent(self):
+        self.assertEqual(GameStats.objects.drift() + SiteStats.objects.drift(), [])
+
+    def test_gamecard_create_update_delete(self):
+        gamecard = GameCard.objects.create(profile=self.profile, game=self.game, hours_played=10)
+        self.assertStats(self.game, total_gamecards=1, public_gamecards=1, total_finished=0, total_hours=10)
+
+        gamecard = GameCard.objects.get(pk=gamecard.pk)
+        gamecard.is_finished = True
+        gamecard.hours_played = 25
+        gamecard.save()
+        self.assertStats(self.game, total_gamecards=1, total_finished=1, total_hours=25)
+        self.assertConsistent()
+
+        gamecard.game = self.other_game
+        gamecard.save()
+        self.assertStats(self.game, total_gamecards=0, total_finished=0, total_hours=0)
+        self.assertStats(self.other_game, total_gamecards=1, total_finished=1, total_hours=25)
+
+        gamecard.delete()
+        self.assertStats(self.other_game, total_gamecards=0, public_gamecards=0, total_finished=0, total_hours=0)
+        self.assertConsistent()
+
+    def test_profile_privacy_change(self):
+        GameCard.objects.create(profile=self.profile, game=self.game)
+        profile = Profile.objects.get(pk=self.profile.pk)
+        profile.is_private = True
+        profile.save()
+        self.assertStats(self.game, total_gamecards=1, public_gamecards=0)
+        self.assertEqual(SiteStats.objects.current().total_private, 1)
+        self.assertConsistent()
+
+        profile.is_private = False
+        profile.save()
+        self.assertStats(self.game, public_gamecards=1)
+        self.assertConsistent()
+
+    def test_game_and_profile_deletion(self):
+        GameCard.objects.create(profile=self.profile, game=self.game, hours_played=3)
+        GameCard.objects.create(profile=self.profile, game=self.other_game, hours_played=4)
+        self.game.delete()
+        self.assertConsistent()
+        self.profile.user.delete()
+        self.assertConsistent()
+        self.assertEqual(SiteStats.objects.current().total_hours, 0)
+
+    def test_missing_rows_are_computed(self):
+        GameCard.objects.create(profile=self.profile, game=self.game, is_finished=True, hours_played=7)
+        GameStats.objects.filter(game=self.game).delete()  # as if the game was inserted without signals
+        SiteStats.objects.all().delete()
+
+        game = Game.objects.with_stats().get(pk=self.game.pk)
+        self.assertEqual((game.total_gamecards, game.public_gamecards, game.total_finished(), game.total_hours()),
+                         (1, 1, 1, 7))
+        self.assertStats(self.game, total_gamecards=1, total_hours=7)
+        self.assertEqual((SiteStats.objects.current().total_games, SiteStats.objects.current().total_hours), (2, 7))
+        self.assertConsistent()
+
+    def test_rebuild_stats_command(self):
+        GameCard.objects.create(profile=self.profile, game=self.game, hours_played=7)
+        GameStats.objects.filter(game=self.game).update(total_hours=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stats', '--check', stdout=StringIO())
+        call_command('rebuild_stats', stdout=StringIO())
+        self.assertStats(self.game, total_hours=7)
+        call_command('rebuild_stats', '--check', stdout=StringIO())
+
+
+# ************************************* IGDB stand-in server *************************************
+
+
+class CatalogueCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = Profile.objects.create(user=User.objects.create_user(username='owner'))
+        cls.visitor = Profile.objects.create(user=User.objects.create_user(username='visitor'))
+        cls.game = Game.objects.create(id=1, name='Cached Game', ordering_name='Cached Game',
+                                       cover_url='https://example.com/cover.jpg', year=2000)
+        cls.gamecard = GameCard.objects.create(profile=cls.owner, game=cls.game, hours_played=7)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        for url, queries in ((reverse('games_app:game_list') + '?display=all', 0),
+                             (reverse('games_app:game_detail', kwargs={'pk': self.game.pk}), 1)):  # the game's stamp
+            first = self.client.get(url)
+            with self.assertNumQueries(queries):
+                second = self.client.get(url)
+            self.assertEqual(first.content, second.content)
+
+    def test_changes_invalidate_cached_pages(self):
+        url = reverse('games_app:game_list') + '?display=all'
+        self.client.get(url)
+        GameCard.objects.filter(pk=self.gamecard.pk).first().delete()
+        self.assertEqual(self.client.get(url).context['games_data'][0]['game'].total_gamecards, 0)
+
+        detail_url = reverse('games_app:game_detail', kwargs={'pk': self.game.pk})
+        self.client.get(detail_url)
+        game = Game.objects.get(pk=self.game.pk)
+        game.name = 'Renamed Game'
+        game.save()
+        self.assertContains(self.client.get(detail_url), 'Renamed Game')
+
+    def test_changes_made_by_another_process_are_seen(self):
+        url = reverse('games_app:game_list') + '?display=all'
+        self.assertEqual(self.client.get(url).context['total_games'], 1)
+        with mock.patch('games_app.models.cache', LocMemCache('run-jobs', {})):  # e.g. the run_jobs worker
+            with self.captureOnCommitCallbacks(execute=True):
+                Game.objects.create(id=2, name='Imported Game', ordering_name='Imported Game',
+                                    cover_url='https://example.com/cover.jpg', year=2001)
+        self.assertNotContains(self.client.get(url), 'Imported Game')
+
+        for name in ('catalogue', SiteStats.objects.VERSION_NAME):  # this process's copies of the versions expire
+            cache.delete(DataVersion.objects.CACHE_KEY.format(name))
+        response = self.client.get(url)
+        self.assertContains(response, 'Imported Game')
+        self.assertEqual(response.context['total_games'], 2)
+
+    def test_viewer_game_cards_are_not_cached(self):
+        url = reverse('games_app:game_list') + '?display=all'
+        self.client.force_login(self.owner.user)
+        self.assertContains(self.client.get(url), 'My Game Card')
+        self.client.force_login(self.visitor.user)
+        response = self.client.get(url)
+        self.assertContains(response, 'Add to My Profile')
+        self.assertNotContains(response, 'My Game Card')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = Profile.objects.create(user=User.objects.create_user(username='owner'))
+        cls.game = Game.objects.create(id=1, name='Game', ordering_name='Game',
+                                       cover_url='https://example.com/cover.jpg', year=2000)
+        GameCard.objects.create(profile=cls.owner, game=cls.game)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('games_app:game_list') + '?display=all'
+
+    def test_anonymous_revalidation_is_answered_without_rendering(self):
+        response = self.client.get(self.url)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn(f'max-age={settings.PUBLIC_PAGE_MAX_AGE}', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((revalidated.status_code, revalidated['ETag']), (304, response['ETag']))
+
+        Game.objects.filter(pk=self.game.pk).first().save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_validators_depend_on_the_viewer(self):
+        anonymous_etag = self.client.get(self.url)['ETag']
+        self.client.force_login(self.owner.user)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=anonymous_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        profile_url = reverse('players_app:profile', kwargs={'pk': self.owner.pk}) + '?display=all'
+        etag = self.client.get(profile_url)['ETag']
+        self.assertEqual(self.client.get(profile_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        GameCard.objects.filter(profile=self.owner).first().delete()
+        self.assertEqual(self.client.get(profile_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_validators_are_scoped_to_the_rows_a_page_shows(self):
+        other = Profile.objects.create(user=User.objects.create_user(username='other'))
+        other_game = Game.objects.create(id=2, name='Other Game', ordering_name='Other Game',
+                                         cover_url='https://example.com/cover.jpg', year=2001)
+        self.client.force_login(self.owner.user)
+        urls = [reverse('games_app:game_detail', kwargs={'pk': self.game.pk}),
+                reverse('players_app:profile', kwargs={'pk': self.owner.pk}) + '?display=all',
+                reverse('players_app:gamecard_list_by_game', kwargs={'game_pk': self.game.pk})]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        list_etag = self.client.get(self.url)['ETag']
+
+        GameCard.objects.create(profile=other, game=other_game, hours_played=3)
+        for url, etag in zip(urls, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304, url)
+        # the game list shows site-wide totals, its validator is the catalogue version
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+        Game.objects.filter(pk=self.game.pk).update(rating=90)  # bulk updates set updated_at too
+        for url, etag in zip(urls, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200, url)
+
+        search_url = reverse('games_app:game_search') + '?q=game'
+        Game.objects.filter(pk=self.game.pk).update(franchise=Franchise.objects.create(id=1, name='Series'))
+        etag = self.client.get(search_url)['ETag']
+        Franchise.objects.filter(pk=1).first().save()
+        self.assertEqual(self.client.get(search_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_html_and_json_are_compressed(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertEqual(self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip',
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        search = self.client.get(reverse('games_app:game_search') + '?q=' + 'game ' * 60,
+                                 HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(search['Content-Encoding'], 'gzip')
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn(b'Game', compression.brotli.decompress(response.content))
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_pages_with_a_csrf_token_are_not_brotli_compressed(self):
+        response = self.client.get(reverse('players_app:user_login'), HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'csrfmiddlewaretoken', gzip.decompress(response.content))
+
+
+class KeysetPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # duplicate sort keys and NULL ordering names exercise the pk tie-breaker and NULL handling
+        for number in range(1, 24):
+            Game.objects.create(id=number, name=f'Game {number % 5}',
+                                ordering_name=None if number % 7 == 0 else f'game {number % 4}',
+                                cover_url='https://example.com/cover.jpg', year=2000 + number % 3)
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, paginator):
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(after=pages[-1].next_token))
+        return pages
+
+    def test_pages_cover_the_ordering_in_both_directions(self):
+        games = Game.objects.all()
+        expected = [game.pk for game in games.order_by(F('ordering_name').asc(nulls_first=True), 'year', 'name', 'pk')]
+        paginator = KeysetPaginator(games, Game._meta.ordering, per_page=5)
+        pages = self.walk(paginator)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertEqual([game.pk for page in pages for game in page], expected)
+        self.assertFalse(pages[0].has_previous())
+
+        page = pages[-1]
+        backwards = [page]
+        while page.has_previous():
+            page = paginator.page(before=page.previous_token)
+            backwards.insert(0, page)
+        self.assertEqual([[game.pk for game in page] for page in backwards],
+                         [[game.pk for game in page] for page in pages])
+
+    def test_invalid_token_selects_first_page(self):
+        paginator = KeysetPaginator(Game.objects.all(), Game._meta.ordering, per_page=5)
+        self.assertEqual(list(paginator.page(after='forged').object_list), list(paginator.page().object_list))
+
+    def test_game_list_is_paginated(self):
+        url = reverse('games_app:game_list')
+        response = self.client.get(url, {'display': 'all', 'size': 10})
+        self.assertEqual(len(response.context['games']), 10)
+        next_querystring = response.context['page_obj'].next_querystring
+        self.assertIn('display=all', next_querystring)
+        response = self.client.get(f'{url}?{next_querystring}')
+        self.assertEqual(len(response.context['games']), 10)
+        self.assertTrue(response.context['page_obj'].has_previous())
+
+        response = self.client.get(url, {'display': 'g', 'size': 100})
+        self.assertFalse(response.context['is_paginated'])
+        self.assertEqual(len(response.context['games']), Game.objects.starts_with(letter='g').count())
+
+
+class GameSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.franchise = Franchise.objects.create(id=1, name='The Elder Scrolls')
+        Game.objects.create(id=1, name='The Elder Scrolls V: Skyrim', ordering_name='Elder Scrolls V: Skyrim',
+                            cover_url='https://example.com/cover.jpg', year=2011, franchise=cls.franchise)
+        Game.objects.create(id=2, name='The Elder Scrolls IV: Oblivion', ordering_name='Elder Scrolls IV: Oblivion',
+                            cover_url='https://example.com/cover.jpg', year=2006, franchise=cls.franchise)
+        Game.objects.create(id=3, name='Fallout 3', ordering_name='Fallout 3',
+                            cover_url='https://example.com/cover.jpg', year=2008)
+
+    def found(self, text):
+        return sorted(search.search_games(text).values_list('pk', flat=True))
+
+    def test_fts_index_is_used_on_sqlite(self):
+        self.assertTrue(search.fts_enabled())
+
+    def test_prefix_and_franchise_matching(self):
+        self.assertEqual(self.found('sky'), [1])
+        self.assertEqual(self.found('elder obl'), [2])
+        self.assertEqual(self.found('scrolls'), [1, 2])
+        self.assertEqual(self.found('FALL'), [3])
+        self.assertEqual(self.found('"*'), [])
+
+    def test_index_follows_game_and_franchise_changes(self):
+        Game.objects.filter(pk=3).update(name='Fallout: New Vegas', ordering_name='Fallout: New Vegas')
+        Game.objects.create(id=4, name='Morrowind', ordering_name='Morrowind',
+                            cover_url='https://example.com/cover.jpg', year=2002, franchise=self.franchise)
+        self.assertEqual(self.found('vegas'), [3])
+        self.assertEqual(self.found('scrolls'), [1, 2, 4])
+
+        Franchise.objects.filter(pk=1).update(name='Tamriel')
+        self.assertEqual(self.found('tamriel'), [1, 2, 4])
+        Game.objects.filter(pk=1).delete()
+        self.assertEqual(self.found('tamriel'), [2, 4])
+
+    def test_like_fallback(self):
+        search.fts_tables['default'] = False
+        try:
+            self.assertEqual(self.found('scrolls sky'), [1])
+        finally:
+            search.fts_tables.pop('default')
+
+    def test_search_view_returns_paginated_json(self):
+        url = reverse('games_app:game_search')
+        data = self.client.get(url, {'q': 'elder'}).json()
+        self.assertEqual((data['count'], data['num_pages'], data['next']), (2, 1, None))
+        self.assertEqual([result['id'] for result in data['results']], [2, 1])
+        self.assertEqual(data['results'][0]['franchise'], 'The Elder Scrolls')
+
+        with mock.patch.object(GameSearchView, 'paginate_by', 1):
+            data = self.client.get(url, {'q': 'elder', 'page': 2}).json()
+        self.assertEqual((data['page'], data['num_pages'], data['next']), (2, 2, None))
+        self.assertEqual([result['id'] for result in data['results']], [1])
+
+
+class FakeIGDBHandler(BaseHTTPRequestHandler):
+    """
+    Answers IGDB-style queries (fields ...; where id = 1; / where id = (1,2);) from the server's data.
+    Queued faults are answered first, /token issues access tokens, and with server.token set
+    requests without that token are refused with 401.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, data, headers=None):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        endpoint = self.path.strip('/').split('/')[-1]
+        self.server.requests.append({'endpoint': endpoint, 'body': body, 'port': self.client_address[1],
+                                     'authorization': self.headers.get('Authorization')})
+        if endpoint == 'token':
+            self.server.issued_tokens += 1
+            self.server.token = f'token-{self.server.issued_tokens}'
+            self.send_json(200, {'access_token': self.server.token, 'expires_in': self.server.token_lifetime,
+                                 'token_type': 'bearer'})
+            return
+        if self.server.faults:
+            fault = self.server.faults.pop(0)
+            time.sleep(fault.get('delay', 0))
+            if fault.get('status'):
+                self.send_json(fault['status'], {'message': 'fault'}, fault.get('headers'))
+                return
+        if self.server.token and self.headers.get('Authorization') != f'Bearer {self.server.token}':
+            self.send_json(401, {'message': 'Authorization Failure'})
+            return
+        self.send_json(200, self.server.answer(endpoint, body))
+
+
+class FakeIGDBServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, data, faults=None, token=None, token_lifetime=3600):
+        super().__init__(('127.0.0.1', 0), FakeIGDBHandler)
+        self.data = data
+        self.requests = []
+        self.faults = list(faults or [])  # dicts of status, headers and delay (seconds) answered in turn
+        self.token = token
+        self.token_lifetime = token_lifetime
+        self.issued_tokens = 0
+
+    def handle_error(self, request, client_address):
+        pass  # clients that timed out leave broken connections behind
+
+    def get_requests(self, endpoint):
+        return [request for request in self.requests if request['endpoint'] == endpoint]
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/'
+
+    @staticmethod
+    def parse_where(body):
+        """
+        Parse 'where id = (1,2) & updated_at > 5;' into [('id', '=', [1, 2]), ('updated_at', '>', [5])]
+        """
+        match = re.search(r'where ([^;]+);', body)
+        if not match:
+            return []
+        conditions = []
+        for condition in match.group(1).split('&'):
+            key, operator, values = re.match(r'\s*(\w+) ([=>]) \(?([\d, ]+)\)?', condition).groups()
+            conditions.append((key, operator, [int(value) for value in values.split(',') if value.strip()]))
+        return conditions
+
+    def answer(self, endpoint, body):
+        if endpoint == 'multiquery':
+            return [{'name': name, 'result': self.answer(query_endpoint, query)}
+                    for query_endpoint, name, query in re.findall(r'query (\w+) "([^"]+)" \{ ([^}]*) \};', body)]
+        conditions = self.parse_where(body)
+        rows = self.data.get(endpoint, [])
+        return [row for row in rows if all(self.matches(row.get(key), operator, values)
+                                           for key, operator, values in conditions)]
+
+    @staticmethod
+    def matches(value, operator, values):
+        if operator == '>':
+            return value is not None and value > values[0]
+        if isinstance(value, list):
+            return bool(set(value) & set(values))
+        return value in values
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeImageHandler(BaseHTTPRequestHandler):
+    """
+    Serves the server's images by path, 404 for unknown paths
+    """
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        content = self.server.images.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class FakeImageServer(FakeIGDBServer):
+    def __init__(self, images):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), FakeImageHandler)
+        self.images = images
+        self.requests = []
+
+
+def fake_igdb_data(games_count=3):
+    games = [{'id': number, 'name': f'Game {number}', 'cover': number, 'first_release_date': 946684800,
+              'total_rating': 80.4, 'summary': 'Summary', 'genres': [12], 'player_perspectives': [1],
+              'franchises': [100 + number % 2], 'updated_at': 1000 + number}
+             for number in range(1, games_count + 1)]
+    return {'games': games,
+            'covers': [{'id': number, 'game': number, 'url': f'//images.igdb.com/{number}.jpg'}
+                       for number in range(1, games_count + 1)],
+            'franchises': [{'id': 100, 'name': 'Even', 'games': [game['id'] for game in games if game['id'] % 2 == 0]},
+                           {'id': 101, 'name': 'The Odd', 'games': [game['id'] for game in games if game['id'] % 2]}]}
+
+
+class DatabaseConfigTest(SimpleTestCase):
+    databases = {'default'}
+
+    def test_postgresql_config_from_environment(self):
+        config = get_database_config(Path('/app'), {'DATABASE_ENGINE': 'postgresql', 'POSTGRES_HOST': 'db',
+                                                    'CONN_MAX_AGE': '300'})
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((config['HOST'], config['CONN_MAX_AGE'], config['CONN_HEALTH_CHECKS']), ('db', 300, True))
+
+    def test_sqlite_config_from_environment(self):
+        config = get_database_config(Path('/app'), {})
+        self.assertEqual((config['ENGINE'], config['NAME']), ('django.db.backends.sqlite3', Path('/app/db.sqlite3')))
+        self.assertEqual(get_database_config(Path('/app'), {'SQLITE_PATH': '/data/db.sqlite3'})['NAME'],
+                         '/data/db.sqlite3')
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_sqlite_connections_use_wal_and_busy_timeout(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {**connection.settings_dict, 'NAME': Path(directory) / 'wal.sqlite3'}
+            wrapper = type(connections['default'])(settings_dict, alias='wal-test')
+            try:
+                with wrapper.cursor() as cursor:
+                    values = {}
+                    for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                        cursor.execute(f'PRAGMA {pragma}')
+                        values[pragma] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        self.assertEqual(values, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000})
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only, set DATABASE_ENGINE=postgresql')
+    def test_postgresql_connections_are_persistent(self):
+        self.assertTrue(connection.settings_dict['CONN_HEALTH_CHECKS'])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertTrue(connection.is_usable())
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True, INSTRUMENTATION_SAMPLE_RATE=1.0)
+class InstrumentationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        franchise = Franchise.objects.create(name='Franchise')
+        for number in range(1, 4):
+            Game.objects.create(id=number, name=f'Game {number}', ordering_name=f'Game {number}',
+                                cover_url='https://example.com/cover.jpg', year=2000, franchise=franchise)
+        cls.admin = User.objects.create_user(username='admin')
+        Profile.objects.create(user=cls.admin)
+        cls.admin.groups.add(Group.objects.create(name='Admin'))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_requests_get_headers_log_records_and_summary(self):
+        with self.assertLogs('MyGameDiary.instrumentation', level='INFO') as logs:
+            response = self.client.get(reverse('games_app:game_list') + '?display=all')
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['view_name'], record['status']), ('games_app:game_list', 200))
+        self.assertEqual(record['queries'], int(response['X-Query-Count']))
+
+        summary = {row['view_name']: row for row in instrumentation.get_summary()}
+        self.assertEqual(summary['games_app:game_list']['requests'], 1)
+
+    def test_concurrent_requests_are_all_counted(self):
+        measurement = {'queries': 2, 'duplicates': 1, 'db_ms': 1.5, 'total_ms': 10.0}
+
+        def record_requests():
+            for _ in range(50):
+                instrumentation.record('view', measurement)
+
+        threads = [threading.Thread(target=record_requests) for _ in range(8)]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # interleave the threads as often as possible
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        [row] = instrumentation.get_summary()
+        self.assertEqual((row['requests'], row['avg_queries'], row['avg_db_ms'], row['max_total_ms']),
+                         (400, 2, 1.5, 10.0))
+
+    def test_repeated_queries_are_detected(self):
+        recorder = instrumentation.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for game in Game.objects.order_by('pk'):
+                game.franchise.name
+        self.assertEqual((recorder.count, recorder.duplicates), (4, 2))
+        self.assertEqual(recorder.most_repeated()['count'], 3)
+
+    def test_unsampled_requests_are_not_recorded(self):
+        with self.settings(INSTRUMENTATION_SAMPLE_RATE=0.0):
+            response = self.client.get(reverse('homepage'))
+        self.assertNotIn('X-Query-Count', response)
+        self.assertEqual(instrumentation.get_summary(), [])
+
+    def test_summary_page_is_admin_only(self):
+        with self.assertLogs('MyGameDiary.instrumentation'):
+            self.client.get(reverse('homepage'))
+            player = User.objects.create_user(username='player')
+            Profile.objects.create(user=player)
+            self.client.force_login(player)
+            self.assertNotIn('slowest_views', self.client.get(reverse('instrumentation')).context)
+
+            self.client.force_login(self.admin)
+            response = self.client.get(reverse('instrumentation'))
+            self.assertIn('homepage', [row['view_name'] for row in response.context['slowest_views']])
+            self.client.post(reverse('instrumentation'))
+            self.assertNotIn('homepage', [row['view_name'] for row in instrumentation.get_summary()])
+
+
+class TokenBucketTest(SimpleTestCase):
+    def test_waits_once_the_burst_is_spent(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=4, clock=lambda: now[0])
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0, 0, 0, 0])
+        self.assertAlmostEqual(bucket.reserve(), 0.25)
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+        now[0] = 10.0
+        self.assertEqual(bucket.reserve(), 0)
+
+
+class IGDBClientTest(SimpleTestCase):
+    def test_game_lookup_includes_cover_and_franchise(self):
+        with FakeIGDBServer(fake_igdb_data()) as server:
+            client = IGDBClient('id', 'token', base_url=server.url, rate=100)
+            lookup = client.get_game_data(1)
+            client.close()
+        self.assertEqual(lookup['game']['name'], 'Game 1')
+        self.assertEqual(lookup['cover_url'], '//images.igdb.com/1.jpg')
+        self.assertEqual(lookup['franchise_name'], 'The Odd')
+        self.assertEqual(sorted(request['endpoint'] for request in server.requests),
+                         ['covers', 'franchises', 'games'])
+
+    def test_many_games_share_pooled_connections(self):
+        with FakeIGDBServer(fake_igdb_data(games_count=10)) as server:
+            client = IGDBClient('id', 'token', base_url=server.url, rate=1000, pool_size=4)
+            lookups = client.get_games_data(range(1, 11))
+            client.close()
+        self.assertEqual([lookup['game']['id'] for lookup in lookups], list(range(1, 11)))
+        self.assertEqual(len(server.requests), 30)
+        self.assertLess(len({request['port'] for request in server.requests}), len(server.requests))
+
+    def test_batch_lookups_use_one_multiquery(self):
+        with FakeIGDBServer(fake_igdb_data(games_count=20)) as server:
+            client = IGDBClient('id', 'token', base_url=server.url, rate=100)
+            lookups = client.get_games_lookups([*range(1, 21), 999])
+            client.close()
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(server.requests[0]['endpoint'], 'multiquery')
+        self.assertEqual(len(lookups), 20)
+        self.assertEqual((lookups[2]['cover_url'], lookups[2]['franchise_name']),
+                         ('//images.igdb.com/3.jpg', 'The Odd'))
+        self.assertEqual(lookups[3]['franchise_name'], 'Even')
+
+    def test_get_games_splits_ids_into_batches(self):
+        with FakeIGDBServer(fake_igdb_data(games_count=5)) as server:
+            client = IGDBClient('id', 'token', base_url=server.url, rate=100)
+            games = client.get_games(range(1, 6), fields='id, total_rating', batch_size=2)
+            client.close()
+        self.assertEqual(len(games), 5)
+        self.assertEqual(len(server.requests), 3)
+        self.assertIn('where id = (5);', server.requests[2]['body'])
+
+    def test_unknown_game_returns_none(self):
+        with FakeIGDBServer(fake_igdb_data()) as server:
+            client = IGDBClient('id', 'token', base_url=server.url, rate=100)
+            self.assertIsNone(client.get_game_data(999))
+            client.close()
+
+
+class IGDBTransportTest(SimpleTestCase):
+    data = {'genres': [{'id': 1, 'name': 'Adventure'}]}
+
+    def setUp(self):
+        self.delays = []
+        self.now = [1000.0]
+
+    def get_client(self, server, **kwargs):
+        client = IGDBClient('id', kwargs.pop('access_token', 'token'), base_url=server.url, rate=1000,
+                            sleep=self.delays.append, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_server_errors_are_retried_with_backoff(self):
+        with FakeIGDBServer(self.data, faults=[{'status': 503}, {'status': 502}]) as server:
+            client = self.get_client(server, retry_backoff=0.5)
+            self.assertEqual(client.get_genres(), [{'id': 1, 'name': 'Adventure'}])
+        self.assertEqual(len(server.get_requests('genres')), 3)
+        self.assertTrue(0.25 <= self.delays[0] <= 0.5 and 0.5 <= self.delays[1] <= 1)
+        self.assertEqual(client.breaker.failures, 0)
+
+    def test_rate_limit_honours_retry_after(self):
+        faults = [{'status': 429, 'headers': {'Retry-After': '2'}}]
+        with FakeIGDBServer(self.data, faults=faults) as server:
+            client = self.get_client(server, retry_backoff=0.5, breaker=CircuitBreaker(threshold=1))
+            client.get_genres()
+        self.assertTrue(2 <= self.delays[0] <= 2.5)
+        self.assertFalse(client.breaker.is_open)
+
+    def test_retry_after_http_date(self):
+        response = mock.Mock(headers={'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        self.assertEqual(get_retry_after(response, now=lambda: 1445412480 - 5), 5)
+        self.assertIsNone(get_retry_after(mock.Mock(headers={'Retry-After': 'soon'})))
+
+    def test_too_long_retry_after_fails_without_waiting(self):
+        faults = [{'status': 429, 'headers': {'Retry-After': '3600'}}]
+        with FakeIGDBServer(self.data, faults=faults) as server:
+            client = self.get_client(server)
+            with self.assertRaises(IGDBResponseError) as raised:
+                client.get_genres()
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertEqual((len(server.requests), self.delays), (1, []))
+
+    def test_read_timeout_is_retried(self):
+        with FakeIGDBServer(self.data, faults=[{'delay': 0.5}]) as server:
+            client = self.get_client(server, timeout=(1, 0.1))
+            self.assertEqual(client.get_genres(), [{'id': 1, 'name': 'Adventure'}])
+        self.assertEqual((len(server.requests), len(self.delays)), (2, 1))
+
+    def test_client_errors_are_not_retried(self):
+        with FakeIGDBServer(self.data, faults=[{'status': 400}]) as server:
+            client = self.get_client(server, breaker=CircuitBreaker(threshold=1))
+            with self.assertRaises(IGDBResponseError) as raised:
+                client.get_genres()
+        self.assertEqual(raised.exception.status_code, 400)
+        self.assertEqual(len(server.requests), 1)
+        self.assertFalse(client.breaker.is_open)
+
+    def test_circuit_opens_fails_fast_and_recovers(self):
+        breaker = CircuitBreaker(threshold=2, reset_timeout=30, clock=lambda: self.now[0])
+        with FakeIGDBServer(self.data, faults=[{'status': 503}] * 3) as server:
+            client = self.get_client(server, max_retries=0, breaker=breaker)
+            for _ in range(2):
+                self.assertRaises(IGDBResponseError, client.get_genres)
+            self.assertTrue(breaker.is_open)
+            self.assertRaises(IGDBUnavailable, client.get_genres)
+            self.assertEqual(len(server.requests), 2)
+
+            self.now[0] += 31  # a single trial call fails and opens the circuit again
+            self.assertRaises(IGDBResponseError, client.get_genres)
+            self.assertRaises(IGDBUnavailable, client.get_genres)
+            self.now[0] += 31
+            client.get_genres()
+            self.assertFalse(breaker.is_open)
+            client.get_genres()
+        self.assertEqual(len(server.requests), 5)
+
+    def test_rate_limited_trial_call_does_not_keep_the_circuit_open(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=30, clock=lambda: self.now[0])
+        faults = [{'status': 503}, {'status': 429, 'headers': {'Retry-After': '3600'}}]
+        with FakeIGDBServer(self.data, faults=faults) as server:
+            client = self.get_client(server, max_retries=0, breaker=breaker)
+            self.assertRaises(IGDBResponseError, client.get_genres)
+            self.now[0] += 31
+            with self.assertRaises(IGDBResponseError) as raised:
+                client.get_genres()
+            self.assertEqual(raised.exception.status_code, 429)
+            self.assertEqual(client.get_genres(), [{'id': 1, 'name': 'Adventure'}])  # the next call is a new trial
+        self.assertFalse(breaker.is_open)
+
+    def test_trial_call_failing_before_the_request_opens_the_circuit_again(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=30, clock=lambda: self.now[0])
+        with FakeIGDBServer(self.data, faults=[{'status': 503}]) as server:
+            client = self.get_client(server, max_retries=0, breaker=breaker)
+            self.assertRaises(IGDBResponseError, client.get_genres)
+            self.now[0] += 31
+            with mock.patch.object(client.tokens, 'get', side_effect=IGDBAuthError('token endpoint is down')):
+                self.assertRaises(IGDBAuthError, client.get_genres)
+            self.assertEqual(breaker.opened_at, self.now[0])
+            self.now[0] += 31
+            self.assertEqual(client.get_genres(), [{'id': 1, 'name': 'Adventure'}])
+        self.assertFalse(breaker.is_open)
+
+    def test_unreachable_server_opens_circuit(self):
+        with FakeIGDBServer({}) as server:
+            url = server.url
+        client = IGDBClient('id', 'token', base_url=url, rate=1000, max_retries=1, sleep=self.delays.append,
+                            breaker=CircuitBreaker(threshold=1))
+        self.addCleanup(client.close)
+        self.assertRaises(IGDBUnavailable, client.get_genres)
+        self.assertEqual(len(self.delays), 1)
+        with self.assertRaisesMessage(IGDBUnavailable, 'IGDB is unavailable'):
+            client.get_genres()
+
+    def test_token_is_fetched_once_and_shared(self):
+        store = {}
+        store_backend = mock.Mock(get=store.get, set=lambda key, value, timeout: store.update({key: value}))
+        with FakeIGDBServer(self.data, token='unknown') as server:
+            for _ in range(2):
+                client = self.get_client(server, access_token=None, client_secret='secret',
+                                         token_url=server.url + 'token', token_store=store_backend)
+                client.get_genres()
+                client.get_perspectives()
+        self.assertEqual(server.issued_tokens, 1)
+        self.assertEqual({request['authorization'] for request in server.requests if request['endpoint'] != 'token'},
+                         {'Bearer token-1'})
+
+    def test_rejected_token_is_refreshed(self):
+        with FakeIGDBServer(self.data, token='unknown') as server:
+            client = self.get_client(server, access_token='stale', client_secret='secret',
+                                     token_url=server.url + 'token')
+            self.assertEqual(client.get_genres(), [{'id': 1, 'name': 'Adventure'}])
+        self.assertEqual([request['authorization'] for request in server.get_requests('genres')],
+                         ['Bearer stale', 'Bearer token-1'])
+
+    def test_rejected_token_without_secret_fails(self):
+        with FakeIGDBServer(self.data, token='unknown') as server:
+            client = self.get_client(server, access_token='stale')
+            with self.assertRaises(IGDBResponseError) as raised:
+                client.get_genres()
+        self.assertEqual(raised.exception.status_code, 401)
+
+    def test_expired_token_is_refreshed(self):
+        with FakeIGDBServer({}, token_lifetime=120) as server:
+            tokens = AccessTokens('id', 'secret', token_url=server.url + 'token', clock=lambda: self.now[0])
+            self.assertEqual(tokens.get(), 'token-1')
+            self.now[0] += 59
+            self.assertEqual(tokens.get(), 'token-1')
+            self.now[0] += 2  # expires a minute early
+            self.assertEqual(tokens.get(), 'token-2')
+
+
+class ResponseCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/cache.sqlite3'
+        self.now = [0.0]
+
+    def get_cache(self, **kwargs):
+        cache = ResponseCache(self.path, clock=lambda: self.now[0], **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_responses_expire_after_endpoint_ttl(self):
+        cache = self.get_cache(ttls={'games': 10})
+        cache.set('games', 'fields name;', [{'id': 1}])
+        cache.set('genres', 'fields name;', [{'id': 2}])
+        self.now[0] = 11
+        self.assertEqual(cache.get('games', 'fields name;'), (False, None))
+        self.assertEqual(cache.get('genres', 'fields name;'), (True, [{'id': 2}]))
+        self.assertEqual(cache.get('games', 'fields name;', allow_stale=True), (True, [{'id': 1}]))
+
+    def test_least_recently_used_responses_are_evicted(self):
+        cache = self.get_cache()
+        for number in range(3):
+            self.now[0] = number
+            cache.set('games', f'where id = {number};', [{'id': number, 'summary': 'x' * 100}])
+        self.now[0] = 3
+        cache.get('games', 'where id = 0;')
+        cache.max_bytes = cache.connection.execute('SELECT SUM(size) FROM responses').fetchone()[0] - 1
+        self.now[0] = 4
+        cache.set('games', 'where id = 3;', [{'id': 3}])
+        self.assertFalse(cache.get('games', 'where id = 1;')[0])
+        self.assertTrue(cache.get('games', 'where id = 0;')[0])
+        self.assertTrue(cache.get('games', 'where id = 3;')[0])
+
+    def test_stale_response_is_served_when_refresh_fails(self):
+        cache = self.get_cache(ttls={'games': 10})
+        cache.set('games', 'fields name;', [{'id': 1}])
+        self.now[0] = 11
+
+        def failing_request():
+            raise ConnectionError('IGDB is down')
+        self.assertEqual(cache.fetch('games', 'fields name;', failing_request), [{'id': 1}])
+
+    def test_offline_mode_uses_only_the_cache(self):
+        self.get_cache().set('games', 'fields name;', [{'id': 1}])
+        self.now[0] = 365 * 24 * 60 * 60
+        cache = self.get_cache(offline=True)
+        self.assertEqual(cache.fetch('games', 'fields name;', lambda: self.fail('network used')), [{'id': 1}])
+        with self.assertRaises(CacheMiss):
+            cache.fetch('covers', 'fields url;', lambda: self.fail('network used'))
+
+    def test_lookups_of_current_data_bypass_the_cache(self):
+        with FakeIGDBServer(fake_igdb_data()) as server:
+            client = IGDBClient('id', 'token', base_url=server.url, rate=100, cache=self.get_cache())
+            for _ in range(2):
+                client.search_games('Odd')
+                updated_games = client.get_updated_games([1, 2], since=0)
+                client.get_games([1, 2], fields='id, total_rating', fresh=True)
+                client.get_games([1, 2], fields='id, name')
+            self.assertEqual(len(server.get_requests('games')), 7)
+        self.assertEqual(len(updated_games), 2)
+        offline_client = IGDBClient('id', 'token', base_url=server.url, cache=self.get_cache(offline=True))
+        self.assertEqual(offline_client.get_updated_games([1, 2], since=0), updated_games)
+
+    def test_repeat_lookups_are_served_from_cache(self):
+        with FakeIGDBServer(fake_igdb_data()) as server:
+            client = IGDBClient('id', 'token', base_url=server.url, rate=100, cache=self.get_cache())
+            first = client.get_games_lookups([1, 2, 3])
+            self.assertEqual(client.get_game_data(1)['cover_url'], '//images.igdb.com/1.jpg')
+            requests_count = len(server.requests)
+            self.assertEqual(client.get_games_lookups([1, 2, 3]), first)
+            client.get_game_data(1)
+            self.assertEqual(len(server.requests), requests_count)
+        offline_client = IGDBClient('id', 'token', base_url=server.url, cache=self.get_cache(offline=True))
+        self.assertEqual(offline_client.get_games_lookups([1, 2, 3]), first)
+
+
+class SaveGamesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Genre.objects.create(id=12, name='Role-playing (RPG)')
+        Perspective.objects.create(id=1, name='First person')
+
+    def setUp(self):
+        output = redirect_stdout(StringIO())
+        output.__enter__()
+        self.addCleanup(output.__exit__, None, None, None)
+        self.server = FakeIGDBServer(fake_igdb_data()).__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.addCleanup(setattr, api_utils, 'igdb_client', api_utils.igdb_client)
+        api_utils.igdb_client = IGDBClient('id', 'token', base_url=self.server.url, rate=100)
+        api_utils.franchise_names.clear()
+        self.addCleanup(api_utils.franchise_names.clear)
+
+    def test_save_game(self):
+        self.assertTrue(api_utils.save_game(1))
+        game = Game.objects.get(pk=1)
+        self.assertEqual((game.year, game.rating, game.franchise.name, game.ordering_name),
+                         (2000, 80, 'The Odd', 'Odd'))
+        self.assertEqual(game.get_genres_names(), 'Role-playing (RPG)')
+        self.assertFalse(api_utils.save_game(1))
+
+    def test_import_games_runs_constant_number_of_queries(self):
+        self.server.data = fake_igdb_data(games_count=60)
+        with CaptureQueriesContext(connection) as few_games:
+            self.assertEqual(api_utils.import_games(api_utils.get_games_data(range(1, 4))), 3)
+        with CaptureQueriesContext(connection) as many_games:
+            self.assertEqual(api_utils.import_games(api_utils.get_games_data(range(4, 61))), 57)
+        # the second import finds both franchises in the database and skips their insert
+        self.assertEqual(len(few_games.captured_queries), len(many_games.captured_queries) + 1)
+        self.assertEqual(api_utils.import_games(api_utils.get_games_data(range(1, 61))), 0)
+        self.assertEqual(Game.objects.count(), 60)
+        self.assertEqual(Game.objects.get(pk=60).get_perspectives_names(), 'First person')
+        self.assertEqual(Game.objects.get(pk=60).ordering_name, 'Even')
+        self.assertEqual(GameStats.objects.drift() + SiteStats.objects.drift(), [])
+
+    def test_franchises_are_resolved_locally_first(self):
+        Franchise.objects.create(id=100, name='Even')
+        api_utils.import_games(api_utils.get_games_data([1, 2, 3, 4]))
+        franchise_requests = [request for request in self.server.requests if request['endpoint'] == 'franchises']
+        self.assertEqual(len(franchise_requests), 1)
+        self.assertIn('where id = (101)', franchise_requests[0]['body'])
+
+        Franchise.objects.filter(pk=101).delete()
+        self.assertEqual(api_utils.get_franchise_name(101), 'The Odd')
+        api_utils.FranchiseResolver().resolve([100, 101])
+        self.assertEqual(len([request for request in self.server.requests if request['endpoint'] == 'franchises']), 1)
+        self.assertTrue(Franchise.objects.filter(pk=101).exists())
+
+    def test_sync_catalogue_fetches_only_games_updated_after_watermark(self):
+        api_utils.import_games(api_utils.get_games_data([1, 2, 3]))
+        SyncWatermark.objects.create(name='catalogue', value=1002)
+        self.server.data['games'][2].update({'total_rating': 91.2, 'name': 'The Game 3 Remastered'})
+        self.server.requests.clear()
+
+        output = StringIO()
+        call_command('sync_catalogue', stdout=output)
+        self.assertIn('updated_at > 1002', self.server.requests[0]['body'])
+        game = Game.objects.get(pk=3)
+        self.assertEqual((game.rating, game.name, game.ordering_name), (91, 'The Game 3 Remastered', 'Odd'))
+        self.assertIn("rating 80 -> 91", output.getvalue())
+        self.assertEqual(SyncWatermark.objects.get(name='catalogue').value, 1003)
+
+        call_command('sync_catalogue', stdout=output)
+        self.assertIn('Successfully saved 0 changes in 0 games.', output.getvalue())
+
+    def test_sync_catalogue_dry_run_saves_nothing(self):
+        api_utils.import_games(api_utils.get_games_data([1]))
+        self.server.data['games'][0]['total_rating'] = 10
+        changes = api_utils.sync_catalogue(dry_run=True)
+        self.assertEqual([(field, old, new) for game, field, old, new in changes], [('rating', 80, 10)])
+        self.assertEqual(Game.objects.get(pk=1).rating, 80)
+        self.assertFalse(SyncWatermark.objects.filter(name='catalogue', value__gt=0).exists())
+
+    def test_refreshes_take_one_request_per_batch(self):
+        for number in range(1, 4):
+            Game.objects.create(id=number, name=f'Game {number}', cover_url='https://example.com/cover.jpg',
+                                year=2000, rating=50)
+        api_utils.update_ratings()
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(set(Game.objects.values_list('rating', flat=True)), {80})
+
+        api_utils.find_and_save_games_franchises()
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(Game.objects.get(pk=2).franchise.name, 'Even')
+        self.assertEqual(Game.objects.get(pk=3).ordering_name, 'Odd')
+
+
+def make_cover(width=528, height=748):
+    output = BytesIO()
+    covers.Image.new('RGB', (width, height), (200, 40, 40)).save(output, 'JPEG')
+    return output.getvalue()
+
+
+class CoverMirrorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = self.settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        output = redirect_stdout(StringIO())
+        output.__enter__()
+        self.addCleanup(output.__exit__, None, None, None)
+
+        content = make_cover() if covers.Image else b'cover image bytes'
+        self.server = FakeImageServer({'/cover.jpg': content}).__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.game = Game.objects.create(id=1, name='Game', ordering_name='Game', year=2000,
+                                        cover_url=f'{self.server.url}cover.jpg')
+
+    def test_igdb_covers_are_downloaded_at_the_largest_needed_size(self):
+        self.assertEqual(covers.get_source_url('//images.igdb.com/igdb/image/upload/t_thumb/co1.jpg'),
+                         'https://images.igdb.com/igdb/image/upload/t_cover_big_2x/co1.jpg')
+        self.assertEqual(covers.get_source_url('https://example.com/t_thumb/cover.jpg'),
+                         'https://example.com/t_thumb/cover.jpg')
+
+    def test_covers_are_downloaded_once_and_served_locally(self):
+        self.assertEqual(covers.mirror_covers(Game.objects.all()), (1, 0))
+        self.assertEqual(covers.mirror_covers(Game.objects.all()), (0, 0))
+        self.assertEqual(self.server.requests, ['/cover.jpg'])
+
+        game = Game.objects.get(pk=1)
+        self.assertTrue(covers.is_mirrored(game))
+        for variant in game.cover_variants['files']:
+            self.assertTrue(variant['name'].startswith(f"covers/{game.cover_variants['digest']}"))
+            self.assertTrue((Path(settings.MEDIA_ROOT) / variant['name']).exists())
+
+        content = self.client.get(reverse('games_app:game_list') + '?display=all').content.decode()
+        self.assertIn(f"/media/covers/{game.cover_variants['digest']}", content)
+        self.assertIn('loading="lazy"', content)
+        self.assertNotIn(self.server.url, content)
+
+        response = self.client.get(f"/media/{game.cover_variants['files'][0]['name']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(f'max-age={settings.MEDIA_MAX_AGE}', response['Cache-Control'])
+
+    def test_changed_cover_url_is_mirrored_again(self):
+        covers.mirror_covers(Game.objects.all())
+        self.server.images['/new-cover.jpg'] = self.server.images['/cover.jpg']
+        Game.objects.filter(pk=1).update(cover_url=f'{self.server.url}new-cover.jpg')
+        self.assertEqual(covers.mirror_covers(Game.objects.all()), (1, 0))
+
+    def test_failed_download_keeps_the_original_cover(self):
+        Game.objects.filter(pk=1).update(cover_url=f'{self.server.url}missing.jpg')
+        with self.assertRaises(CommandError):
+            call_command('mirror_covers', stdout=StringIO(), stderr=StringIO())
+        game = Game.objects.get(pk=1)
+        self.assertEqual(game.cover_variants, {})
+        self.assertEqual(covers.get_cover_sources(game), (game.cover_url, {}))
+
+    @skipUnless(covers.Image, 'Pillow is not installed')
+    def test_resized_webp_and_jpeg_variants(self):
+        call_command('mirror_covers', stdout=StringIO(), stderr=StringIO())
+        game = Game.objects.get(pk=1)
+        self.assertEqual(sorted((variant['format'], variant['width']) for variant in game.cover_variants['files']),
+                         [('jpeg', 100), ('jpeg', 200), ('jpeg', 400), ('webp', 100), ('webp', 200), ('webp', 400)])
+        src, srcsets = covers.get_cover_sources(game, 200)
+        self.assertTrue(src.endswith('-200.jpeg'))
+        self.assertEqual(srcsets['webp'].count('w, '), 2)
+        with covers.Image.open(Path(settings.MEDIA_ROOT) / game.cover_variants['files'][0]['name']) as image:
+            self.assertEqual(image.size[0], 400)
+
+
+class JobQueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Genre.objects.create(id=12, name='Role-playing (RPG)')
+        Perspective.objects.create(id=1, name='First person')
+        cls.admin = User.objects.create_user(username='admin')
+        Profile.objects.create(user=cls.admin)
+        cls.admin.groups.add(Group.objects.create(name='Admin'))
+
+    def setUp(self):
+        cache.clear()
+        output = redirect_stdout(StringIO())
+        output.__enter__()
+        self.addCleanup(output.__exit__, None, None, None)
+        data = fake_igdb_data()
+        data['games'][0]['name'] = 'Game 1'
+        self.server = FakeIGDBServer(data).__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.addCleanup(setattr, api_utils, 'igdb_client', api_utils.igdb_client)
+        api_utils.igdb_client = IGDBClient('id', 'token', base_url=self.server.url, rate=100)
+        api_utils.franchise_names.clear()
+        self.addCleanup(api_utils.franchise_names.clear)
+        self.client.force_login(self.admin)
+
+    def test_views_queue_jobs_and_the_worker_runs_them(self):
+        response = self.client.post(reverse('games_app:game_add'), {'name': 'Game'})
+        job = Job.objects.get()
+        self.assertRedirects(response, reverse('games_app:job_detail', kwargs={'pk': job.pk}))
+        self.assertEqual(self.server.requests, [])
+        self.assertFalse(self.client.get(reverse('games_app:job_status', kwargs={'pk': job.pk})).json()['finished'])
+
+        with mock.patch.object(api_utils.igdb_client, 'search_games', return_value=[
+                {'id': 1, 'name': 'Game 1', 'first_release_date': 946684800}]):
+            call_command('run_jobs', '--once', stdout=StringIO())
+        status = self.client.get(reverse('games_app:job_status', kwargs={'pk': job.pk})).json()
+        self.assertEqual((status['status'], status['finished']), (Job.DONE, True))
+        self.assertContains(self.client.get(reverse('games_app:job_detail', kwargs={'pk': job.pk})), 'Game 1')
+
+        with mock.patch.object(api_utils, 'save_to_file') as save_to_file:
+            response = self.client.post(reverse('games_app:game_save', kwargs={'game_title': 'Game'}),
+                                        {'games_to_save': '1,Game 1'})
+            self.assertFalse(Game.objects.exists())
+            call_command('run_jobs', '--once', stdout=StringIO())
+        save_to_file.assert_called_once_with('1,Game 1')
+        self.assertTrue(Game.objects.filter(pk=1).exists())
+        self.assertContains(self.client.get(response.url), '1 game successfully imported')
+
+    def test_selected_games_are_imported_in_one_batch(self):
+        import_games = api_utils.import_games
+        api_utils.import_games([api_utils.get_game_data(1)])
+        self.server.requests.clear()
+        search = Job.objects.enqueue('find_games', title='Game')
+        Job.objects.filter(pk=search.pk).update(status=Job.DONE, result={'title': 'Game', 'games': [
+            {'id': number, 'name': f'Game {number}', 'year': 2000} for number in (1, 2, 3)]})
+        page = self.client.get(reverse('games_app:job_detail', kwargs={'pk': search.pk}))
+        self.assertRegex(page.content.decode(), r'value="1,Game 1"\s+disabled')
+        self.assertContains(page, 'type="checkbox"', count=4)
+
+        with (mock.patch.object(api_utils, 'save_to_file') as save_to_file,
+              mock.patch.object(api_utils, 'import_games', side_effect=import_games) as bulk_import):
+            response = self.client.post(reverse('games_app:game_save', kwargs={'game_title': 'Game'}),
+                                        {'games_to_save': ['1,Game 1', '2,Game 2', '3,Game 3']})
+            job = Job.objects.get(kind='import_games')
+            self.assertRedirects(response, reverse('games_app:job_detail', kwargs={'pk': job.pk}))
+            jobs.run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.result, {'imported': [{'id': 2, 'title': 'Game 2'}, {'id': 3, 'title': 'Game 3'}],
+                                      'skipped': [{'id': 1, 'title': 'Game 1'}]})
+        self.assertEqual(job.progress, 'Saving 2 games...')
+        self.assertEqual([request['endpoint'] for request in self.server.requests], ['multiquery', 'franchises'])
+        bulk_import.assert_called_once()
+        save_to_file.assert_called_once_with('2,Game 2', '3,Game 3')
+        self.assertEqual(Game.objects.count(), 3)
+        self.assertContains(self.client.get(response.url), '2 games successfully imported')
+
+    def test_a_failed_manifest_write_is_retried(self):
+        job = Job.objects.enqueue('import_games', games=[{'id': 2, 'title': 'Game 2'}])
+        with mock.patch.object(api_utils, 'save_to_file', side_effect=[OSError('No space left on device'), None]) \
+                as save_to_file:
+            jobs.run_due_jobs()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.error), (Job.PENDING, 'OSError: No space left on device'))
+            self.assertFalse(Game.objects.filter(pk=2).exists())  # rolled back with the failed write
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            jobs.run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.result, {'imported': [{'id': 2, 'title': 'Game 2'}], 'skipped': []})
+        self.assertEqual(save_to_file.call_args_list, [mock.call('2,Game 2')] * 2)
+        self.assertEqual(SiteStats.objects.drift(), [])
+
+    @override_settings(COVER_MIRROR_ON_IMPORT=True)
+    def test_covers_are_mirrored_after_the_import_commits(self):
+        with (mock.patch.object(api_utils, 'save_to_file'),
+              mock.patch.object(api_utils, 'mirror_covers', return_value=(1, 0)) as mirror_covers,
+              redirect_stdout(StringIO())):
+            with self.captureOnCommitCallbacks() as callbacks:
+                api_utils.import_selected_games([2], report=lambda message: None)
+                mirror_covers.assert_not_called()
+            for callback in callbacks:
+                callback()
+        self.assertEqual(list(mirror_covers.call_args.args[0].values_list('pk', flat=True)), [2])
+
+    def test_a_search_is_queued_once(self):
+        response = self.client.post(reverse('games_app:game_add'), {'name': 'Game'})
+        job = Job.objects.get()
+        self.assertRedirects(response, reverse('games_app:job_detail', kwargs={'pk': job.pk}))
+        self.client.post(reverse('games_app:game_add'), {'name': 'Game'})
+        for _ in range(2):  # reloads, back navigation and prefetching only read
+            response = self.client.get(reverse('games_app:game_save', kwargs={'game_title': 'Game'}))
+            self.assertRedirects(response, reverse('games_app:job_detail', kwargs={'pk': job.pk}))
+        response = self.client.get(reverse('games_app:game_save', kwargs={'game_title': 'Other Game'}))
+        self.assertContains(response, 'value="Other Game"')
+        self.assertEqual(Job.objects.count(), 1)
+
+        Job.objects.filter(pk=job.pk).update(status=Job.DONE)
+        self.client.post(reverse('games_app:game_add'), {'name': 'Game'})
+        self.assertEqual(Job.objects.count(), 2)
+        response = self.client.get(reverse('games_app:game_save', kwargs={'game_title': 'Game'}))
+        self.assertRedirects(response, reverse('games_app:job_detail', kwargs={'pk': Job.objects.latest('pk').pk}))
+
+    def test_import_without_selection_is_refused(self):
+        response = self.client.post(reverse('games_app:game_save', kwargs={'game_title': 'Game'}))
+        self.assertRedirects(response, reverse('games_app:game_list') + '?display=all', fetch_redirect_response=False)
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        job = Job.objects.enqueue('refresh_ratings')
+        with mock.patch.dict(jobs.JOB_KINDS, refresh_ratings=mock.Mock(side_effect=ConnectionError('timeout'))):
+            jobs.run_due_jobs()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+            self.assertGreater(job.run_after, timezone.now() + jobs.get_backoff(1) - timedelta(seconds=5))
+            self.assertEqual(jobs.run_due_jobs(), [])
+
+            for attempt in range(2, job.max_attempts + 1):
+                Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+                jobs.run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (Job.FAILED, 3, 'ConnectionError: timeout'))
+        self.assertEqual(jobs.get_backoff(3), 4 * jobs.get_backoff(1))
+
+    def test_a_job_is_claimed_once_and_abandoned_jobs_are_queued_again(self):
+        job = Job.objects.enqueue('refresh_ratings')
+        self.assertEqual(Job.objects.claim(), job)
+        self.assertIsNone(Job.objects.claim())
+
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT + 1))
+        self.assertEqual(Job.objects.requeue_stale(), 1)
+        self.assertEqual(Job.objects.claim().attempts, 2)
+
+        Job.objects.filter(pk=job.pk).update(attempts=job.max_attempts,  # a job that keeps killing the worker
+                                             started_at=timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT + 1))
+        self.assertEqual(Job.objects.requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_job_pages_are_admin_only(self):
+        job = Job.objects.enqueue('resolve_franchises')
+        player = User.objects.create_user(username='player')
+        Profile.objects.create(user=player)
+        self.client.force_login(player)
+        self.assertEqual(self.client.get(reverse('games_app:job_status', kwargs={'pk': job.pk})).status_code, 403)
+        self.assertEqual(self.client.get(reverse('games_app:job_detail', kwargs={'pk': job.pk})).status_code, 404)
+        self.client.post(reverse('games_app:job_list'), {'kind': 'refresh_ratings'})
+        self.assertEqual(Job.objects.count(), 1)
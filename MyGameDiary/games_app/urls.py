@@ -9,5 +9,11 @@ urlpatterns = [
     path('game-add/<str:game_title>', GameSaveView.as_view(), name='game_save'),
     path('game-detail/<int:pk>/', GameDetailView.as_view(), name='game_detail'),
     path('game-list/', GameListView.as_view(), name='game_list'),
+    path('game-search/', GameSearchView.as_view(), name='game_search'),
+
+    # Job views
+    path('jobs/', JobListView.as_view(), name='job_list'),
+    path('jobs/<int:pk>/', JobDetailView.as_view(), name='job_detail'),
+    path('jobs/<int:pk>/status/', JobStatusView.as_view(), name='job_status'),
 
     ]
@@ -1,16 +1,24 @@
 from django.contrib import messages
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Max, Q
+from django.http import JsonResponse
 from players_app.mixins import UserRightsMixin
 from django.shortcuts import render, redirect
-from django.urls import reverse_lazy
-from django.views.generic import TemplateView, DetailView, ListView
-from django.utils.datastructures import MultiValueDictKeyError
+from django.urls import reverse, reverse_lazy
+from django.views.generic import TemplateView, DetailView, ListView, View
 
+from MyGameDiary.pagination import KeysetPaginationMixin
+
+from games_app.cache import (AnonymousPageCacheMixin, ConditionalGetMixin, get_catalogue_key,
+                             get_catalogue_version, get_stamps)
+from games_app.covers import COVER_WIDTHS, get_cover_sources
 from games_app.forms import GameSearchApiForm
-from games_app.api_utils import find_game_id, save_game, save_to_file
-from games_app.models import Game
+from games_app.models import Game, Job, SiteStats
+from games_app.search import search_games
 from players_app.models import GameCard
-from django.db.models import Sum
 
 from string import ascii_lowercase
 
@@ -38,13 +46,19 @@ class GameAddView(LoginRequiredMixin, UserRightsMixin, TemplateView):
     def post(self, *args, **kwargs):
         form = GameSearchApiForm(self.request.POST)
         if form.is_valid():
-            game_title = form.cleaned_data['name']
-            return redirect(reverse_lazy('games_app:game_save', kwargs={'game_title': game_title}))
+            if not self.is_member_of(self.request.user, self.allowed_groups):
+                return redirect(reverse_lazy('homepage'))
+            job = Job.objects.enqueue_once('find_games', title=form.cleaned_data['name'])
+            return redirect(reverse_lazy('games_app:job_detail', kwargs={'pk': job.pk}))
 
 
 class GameSaveView(LoginRequiredMixin, UserRightsMixin, TemplateView):
+    """
+    GET only reads: it redirects to the latest search of game_title or shows the search form filled with it.
+    POST queues one import of all selected games and redirects to its progress page.
+    IGDB is only contacted by the run_jobs worker.
+    """
     template_name = 'game-add.html'
-    context_object_name = 'games'
     login_url = reverse_lazy('players_app:user_login')
     allowed_groups = ['Admin']
 
@@ -54,35 +68,33 @@ class GameSaveView(LoginRequiredMixin, UserRightsMixin, TemplateView):
         return context
 
     def get(self, *args, **kwargs):
-        game_title = kwargs['game_title']
         context = self.get_context_data()
-        if context['user_has_rights']:
-            games = find_game_id(game_title)
-            context.update({
-                'game_title': game_title,
-                'games': games,
-                'total_games': len(games)
-            })
-        return render(self.request,
-                      template_name=self.template_name,
-                      context=context)
+        if not context['user_has_rights']:
+            return render(self.request, template_name=self.template_name, context=context)
+        job = Job.objects.filter(kind='find_games', arguments={'title': kwargs['game_title']}).order_by('-pk').first()
+        if job is None:
+            context['form'] = GameSearchApiForm(initial={'name': kwargs['game_title']})
+            return render(self.request, template_name=self.template_name, context=context)
+        return redirect(reverse_lazy('games_app:job_detail', kwargs={'pk': job.pk}))
 
     def post(self, *args, **kwargs):
+        if not self.is_member_of(self.request.user, self.allowed_groups):
+            return redirect(reverse_lazy('homepage'))
+        games = []
         try:
-            game_to_save = self.request.POST['game_to_save']
-            game_id, game_title = game_to_save.split(',')
-            if save_game(game_id):
-                save_to_file(game_to_save)
-                messages.success(self.request, f"{game_title} successfully saved.")
-            else:
-                messages.error(self.request, f"{game_title} is already in the database.")
-            return redirect(reverse_lazy('games_app:game_list') + '?display=all')
-        except MultiValueDictKeyError:
+            for game_to_save in self.request.POST.getlist('games_to_save'):
+                game_id, game_title = game_to_save.split(',', 1)
+                games.append({'id': int(game_id), 'title': game_title})
+        except ValueError:
+            games = []
+        if not games:
             messages.error(self.request, "No game was selected.")
             return redirect(reverse_lazy('games_app:game_list') + '?display=all')
+        job = Job.objects.enqueue('import_games', games=games)
+        return redirect(reverse_lazy('games_app:job_detail', kwargs={'pk': job.pk}))
 
 
-class GameListView(ListView):
+class GameListView(ConditionalGetMixin, AnonymousPageCacheMixin, KeysetPaginationMixin, ListView):
     model = Game
     template_name = 'game-list.html'
     context_object_name = 'games'
@@ -90,39 +102,110 @@ class GameListView(ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         games = context['games']
+        if self.request.user.is_authenticated:
+            gamecards_pk = (GameCard.objects.on_profile(profile=self.request.user.profile)
+                            .filter(game__in=[game.pk for game in games]).pks_by_game())
+        else:
+            gamecards_pk = {}
         games_data = []
         for game in games:
             game_dict = {}
             game_dict['game'] = game
-            if self.request.user.is_authenticated:
-                query = GameCard.objects.about_game(game=game).on_profile(profile=self.request.user.profile).first()
-                game_dict['gamecard_pk'] = query.pk if query is not None else None
-            else:
-                game_dict['gamecard_pk'] = None
+            game_dict['gamecard_pk'] = gamecards_pk.get(game.pk)
             games_data.append(game_dict)
 
-        context['total_games'] = Game.objects.count()
-        context['total_gamecards'] = GameCard.objects.count()
-        context['total_finished'] = GameCard.objects.filter(is_finished=True).count()
-        context['total_hours'] = GameCard.objects.aggregate(Sum('hours_played'))['hours_played__sum']
+        site_stats = SiteStats.objects.cached()
+        context['total_games'] = site_stats.total_games
+        context['total_gamecards'] = site_stats.total_gamecards
+        context['total_finished'] = site_stats.total_finished
+        context['total_hours'] = site_stats.total_hours
         context['games_data'] = games_data
 
         context['letters'] = ascii_lowercase
         context['display'] = self.request.GET.get('display')
+        context['catalogue_version'] = get_catalogue_version()
+        context['catalogue_cache_timeout'] = settings.CATALOGUE_CACHE_TIMEOUT
         return context
 
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Pages of games are shared by all users, the viewer's game cards are looked up separately
+        """
+        key = get_catalogue_key('game-list', self.request.GET.urlencode(), page_size)
+        page = cache.get(key)
+        if page is None:
+            paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+            cache.set(key, page, settings.CATALOGUE_CACHE_TIMEOUT)
+        return None, page, page.object_list, page.has_other_pages()
+
     def get_queryset(self):
         display = self.request.GET.get('display')
         if display == 'all':
-            return Game.objects.all()
-        return Game.objects.starts_with(letter=display)
+            return Game.objects.with_stats()
+        return Game.objects.with_stats().starts_with(letter=display)
+
+
+class GameSearchView(ConditionalGetMixin, View):
+    """
+    Paginated JSON search of games by name, ordering name and franchise name: ?q=<text>&page=<number>
+    """
+    paginate_by = 20
+
+    def get_etag_parts(self):
+        return list(get_stamps(Game.objects.all(), updated=Max('updated_at')).values())
+
+    def get(self, *args, **kwargs):
+        query = self.request.GET.get('q', '').strip()
+        page = Paginator(search_games(query), self.paginate_by).get_page(self.request.GET.get('page'))
+        results = []
+        for game in page:
+            results.append({'id': game.pk,
+                            'name': game.name,
+                            'year': game.year,
+                            'franchise': game.franchise.name if game.franchise else None,
+                            'cover_url': get_cover_sources(game, COVER_WIDTHS[0])[0],
+                            'url': reverse('games_app:game_detail', args=[game.pk])})
+        return JsonResponse({'q': query,
+                             'page': page.number,
+                             'num_pages': page.paginator.num_pages,
+                             'count': page.paginator.count,
+                             'next': page.next_page_number() if page.has_next() else None,
+                             'results': results})
 
 
-class GameDetailView(DetailView):
+class GameDetailView(ConditionalGetMixin, AnonymousPageCacheMixin, DetailView):
     model = Game
     template_name = 'game-detail.html'
     context_object_name = 'game'
 
+    stamps = None
+
+    def get_stamps(self):
+        """
+        The game and the viewer's game card of it
+        """
+        if self.stamps is None:
+            aggregates = {'updated': Max('updated_at')}
+            if self.request.user.is_authenticated:
+                aggregates['gamecard'] = Max('gamecard__pk', filter=Q(gamecard__profile=self.request.user.pk))
+            self.stamps = get_stamps(Game.objects.filter(pk=self.kwargs['pk']), **aggregates)
+        return self.stamps
+
+    def get_etag_parts(self):
+        return list(self.get_stamps().values())
+
+    def get_queryset(self):
+        return Game.objects.for_detail()
+
+    def get_object(self, queryset=None):
+        updated = self.get_stamps()['updated']
+        key = f"game:{self.kwargs['pk']}:{updated.isoformat() if updated else None}"
+        game = cache.get(key)
+        if game is None:
+            game = super().get_object(queryset)
+            cache.set(key, game, settings.CATALOGUE_CACHE_TIMEOUT)
+        return game
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         if self.request.user.is_authenticated:
@@ -132,4 +215,78 @@ class GameDetailView(DetailView):
         else:
             gamecard_pk = None
         context['gamecard_pk'] = gamecard_pk
+        context['game_version'] = self.get_stamps()['updated']
+        context['catalogue_cache_timeout'] = settings.CATALOGUE_CACHE_TIMEOUT
+        return context
+
+
+class JobListView(LoginRequiredMixin, UserRightsMixin, ListView):
+    """
+    Recent background jobs; POST queues a catalogue-wide refresh (kind = refresh_ratings or resolve_franchises)
+    """
+    model = Job
+    template_name = 'job-list.html'
+    context_object_name = 'jobs'
+    login_url = reverse_lazy('players_app:user_login')
+    allowed_groups = ['Admin']
+    refresh_kinds = ['refresh_ratings', 'resolve_franchises']
+    jobs_shown = 50
+
+    def get_queryset(self):
+        if not self.is_member_of(self.request.user, self.allowed_groups):
+            return Job.objects.none()
+        return Job.objects.defer('result')[:self.jobs_shown]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_context_rights())
+        context['has_unfinished_jobs'] = any(not job.is_finished for job in context['jobs'])
+        return context
+
+    def post(self, *args, **kwargs):
+        kind = self.request.POST.get('kind')
+        if self.is_member_of(self.request.user, self.allowed_groups) and kind in self.refresh_kinds:
+            job = Job.objects.enqueue(kind)
+            messages.success(self.request, f"Job {job} was queued.")
+        return redirect(reverse_lazy('games_app:job_list'))
+
+
+class JobDetailView(LoginRequiredMixin, UserRightsMixin, DetailView):
+    model = Job
+    template_name = 'job-detail.html'
+    context_object_name = 'job'
+    login_url = reverse_lazy('players_app:user_login')
+    allowed_groups = ['Admin']
+
+    def get_queryset(self):
+        if not self.is_member_of(self.request.user, self.allowed_groups):
+            return Job.objects.none()
+        return Job.objects.all()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_context_rights())
+        job = context['job']
+        if job.kind == 'find_games' and job.status == Job.DONE:
+            # search results already in the database cannot be selected for import
+            found_ids = [game['id'] for game in job.result['games']]
+            context['existing_game_ids'] = set(Game.objects.filter(pk__in=found_ids).values_list('pk', flat=True))
         return context
+
+
+class JobStatusView(LoginRequiredMixin, UserRightsMixin, View):
+    """
+    JSON status of a job, polled by the job pages
+    """
+    login_url = reverse_lazy('players_app:user_login')
+    allowed_groups = ['Admin']
+
+    def get(self, *args, **kwargs):
+        if not self.is_member_of(self.request.user, self.allowed_groups):
+            return JsonResponse({'error': "You don't have permission to view jobs."}, status=403)
+        job = Job.objects.filter(pk=kwargs['pk']).values(
+            'pk', 'kind', 'status', 'progress', 'attempts', 'max_attempts', 'error', 'run_after').first()
+        if job is None:
+            return JsonResponse({'error': "Job was not found."}, status=404)
+        job['finished'] = job['status'] in (Job.DONE, Job.FAILED)
+        return JsonResponse(job)
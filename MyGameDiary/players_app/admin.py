@@ -1,12 +1,13 @@
 from django.contrib import admin
 from django.contrib.auth.models import Group
-from players_app.models import Profile, GameCard, PlayerRequest, Version
+from players_app.models import Profile, ProfileStats, GameCard, PlayerRequest, Version
 
 
 @admin.register(GameCard)
 class GameCardAdmin(admin.ModelAdmin):
     list_display = ['get_profile_username', 'get_game_name', 'finished', 'hours_played',
                     'avatar_names', 'review_link', 'notes']
+    list_select_related = ['profile__user', 'game']
 
     @admin.display(description='Player')
     def get_profile_username(self, obj):
@@ -24,6 +25,10 @@ class GameCardAdmin(admin.ModelAdmin):
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ['get_username', 'get_groups', 'register_date', 'is_private']
+    list_select_related = ['user']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('user__groups')
 
     @admin.display(description='Player')
     def get_username(self, obj):
@@ -31,12 +36,19 @@ class ProfileAdmin(admin.ModelAdmin):
 
     @admin.display(description='Groups')
     def get_groups(self, obj):
-        return list(obj.user.groups.all().values_list('name', flat=True))
+        return [group.name for group in obj.user.groups.all()]
+
+
+@admin.register(ProfileStats)
+class ProfileStatsAdmin(admin.ModelAdmin):
+    list_display = ['profile', 'total_gamecards', 'total_finished_games', 'total_hours']
+    list_select_related = ['profile__user']
 
 
 @admin.register(PlayerRequest)
 class PlayerRequestAdmin(admin.ModelAdmin):
     list_display = ['get_status', 'timestamp', 'get_player_name', 'text']
+    list_select_related = ['profile__user']
 
     @admin.display(description='Status')
     def get_status(self, obj):
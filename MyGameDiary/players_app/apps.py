@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PortfoliosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'players_app'
+
+    def ready(self):
+        import players_app.signals  # noqa: F401
@@ -0,0 +1,211 @@
+"""
+Load test of the site's pages
+Every named URL of the project, games_app and players_app is requested through the Django test client
+against the current database, anonymously or as a sample player who is made an admin for the run.
+Latency, number of queries and response size are recorded per request. The whole run happens in a transaction
+that is rolled back, and requests of state-changing URLs are rolled back one by one as well.
+"""
+
+import json
+import math
+import time
+
+from django.contrib.auth.models import Group
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+
+from games_app.cache import invalidate_catalogue
+from games_app.models import Game, Job, SiteStats
+from players_app import roles
+from players_app.models import GameCard, PlayerRequest, Profile
+
+NAMESPACES = ['games_app', 'players_app']
+SKIPPED = {}  # url name: reason why the load test does not request it
+
+
+class LoadTestCase:
+    def __init__(self, label, url_name, kwargs=None, query='', as_player=True, mutates=False):
+        self.label = label
+        self.url_name = url_name
+        self.url = reverse(url_name, kwargs=kwargs) + (f'?{query}' if query else '')
+        self.as_player = as_player
+        self.mutates = mutates
+
+
+class NoSampleData(Exception):
+    pass
+
+
+def get_url_names():
+    """
+    Return the names of all project, games_app and players_app URLs, namespaced ones with their namespace
+    """
+    resolver = get_resolver()
+    names = [pattern.name for pattern in resolver.url_patterns if getattr(pattern, 'name', None)]
+    for namespace in NAMESPACES:
+        names += [f'{namespace}:{pattern.name}' for pattern in resolver.namespace_dict[namespace][1].url_patterns
+                  if pattern.name]
+    return names
+
+
+def get_sample():
+    """
+    Pick the objects the pages are requested for: the public profile and the game with most game cards,
+    one of the profile's game cards, a game missing on the profile and a pending request
+    """
+    profile = (Profile.objects.filter(is_private=False).select_related('user')
+               .annotate(cards=Count('gamecard')).order_by('-cards', 'pk').first())
+    game = Game.objects.annotate(cards=Count('gamecard')).order_by('-cards', 'pk').first()
+    if profile is None or game is None:
+        raise NoSampleData("The database has no public profile or no game.")
+    return {
+        'profile': profile,
+        'game': game,
+        'gamecard': GameCard.objects.on_profile(profile=profile).order_by('pk').first(),
+        'new_game': Game.objects.exclude(gamecard__profile=profile).order_by('pk').first(),
+        'request': PlayerRequest.objects.pending().order_by('pk').first(),
+    }
+
+
+def get_cases(sample):
+    profile, game = sample['profile'], sample['game']
+    cases = [
+        LoadTestCase('homepage (anonymous)', 'homepage', as_player=False),
+        LoadTestCase('homepage', 'homepage'),
+        LoadTestCase('history', 'history', as_player=False),
+        LoadTestCase('instrumentation', 'instrumentation'),
+        LoadTestCase('game add', 'games_app:game_add'),
+        LoadTestCase('game save', 'games_app:game_save', {'game_title': 'game'}),
+        LoadTestCase('game detail (anonymous)', 'games_app:game_detail', {'pk': game.pk}, as_player=False),
+        LoadTestCase('game detail', 'games_app:game_detail', {'pk': game.pk}),
+        LoadTestCase('game list (anonymous)', 'games_app:game_list', query='display=all', as_player=False),
+        LoadTestCase('game list by letter (anonymous)', 'games_app:game_list', query='display=m', as_player=False),
+        LoadTestCase('game list', 'games_app:game_list', query='display=all'),
+        LoadTestCase('game search', 'games_app:game_search', query='q=game', as_player=False),
+        LoadTestCase('job list', 'games_app:job_list'),
+        LoadTestCase('job detail', 'games_app:job_detail', {'pk': sample['job'].pk}),
+        LoadTestCase('job status', 'games_app:job_status', {'pk': sample['job'].pk}),
+        LoadTestCase('register', 'players_app:user_register', as_player=False),
+        LoadTestCase('login', 'players_app:user_login', as_player=False),
+        LoadTestCase('logout', 'players_app:user_logout', mutates=True),
+        LoadTestCase('request create', 'players_app:request_create'),
+        LoadTestCase('request list', 'players_app:request_list'),
+        LoadTestCase('profile', 'players_app:profile', {'pk': profile.pk}, query='display=all'),
+        LoadTestCase('profile by letter', 'players_app:profile', {'pk': profile.pk}, query='display=m'),
+        LoadTestCase('profile change privacy', 'players_app:profile_change_privacy',
+                     query=f'profile_pk={profile.pk}', mutates=True),
+        LoadTestCase('profile list', 'players_app:profile_list'),
+        LoadTestCase('gamecard list by game', 'players_app:gamecard_list_by_game', {'game_pk': game.pk}),
+    ]
+    if sample['request'] is not None:
+        cases.append(LoadTestCase('request switch', 'players_app:request_switch', {'pk': sample['request'].pk},
+                                  mutates=True))
+    if sample['new_game'] is not None:
+        cases.append(LoadTestCase('gamecard create', 'players_app:gamecard_create',
+                                  query=f'profile_pk={profile.pk}&game_pk={sample["new_game"].pk}', mutates=True))
+    if sample['gamecard'] is not None:
+        gamecard_kwargs = {'pk': sample['gamecard'].pk}
+        cases += [
+            LoadTestCase('gamecard detail', 'players_app:gamecard_detail', gamecard_kwargs),
+            LoadTestCase('gamecard update', 'players_app:gamecard_update', gamecard_kwargs),
+            LoadTestCase('gamecard delete', 'players_app:gamecard_delete', gamecard_kwargs),
+        ]
+    return cases
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a non-empty list
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+class LoadTestResult:
+    def __init__(self, case):
+        self.case = case
+        self.timings = []
+        self.queries = []
+        self.sizes = []
+        self.status_codes = set()
+
+    def add(self, response, elapsed, queries):
+        self.timings.append(elapsed * 1000)
+        self.queries.append(queries)
+        self.sizes.append(len(response.content))
+        self.status_codes.add(response.status_code)
+
+    def as_dict(self):
+        return {
+            'label': self.case.label,
+            'url': self.case.url,
+            'status': sorted(self.status_codes),
+            'requests': len(self.timings),
+            'p50_ms': round(percentile(self.timings, 50), 2),
+            'p95_ms': round(percentile(self.timings, 95), 2),
+            'queries': max(self.queries),
+            'bytes': max(self.sizes),
+        }
+
+
+class LoadTest:
+    """
+    Request every case `requests` times after `warmup` unmeasured requests.
+    run() returns the list of LoadTestResult.as_dict() summaries.
+    """
+    def __init__(self, requests=20, warmup=1):
+        self.requests = requests
+        self.warmup = warmup
+        self.uncovered = []
+
+    def get_client(self, case, player):
+        client = Client(SERVER_NAME='localhost')
+        if case.as_player:
+            client.force_login(player)
+        return client
+
+    def request(self, client, case):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(case.url)
+            elapsed = time.perf_counter() - start
+        return response, elapsed, len(queries)
+
+    def run_case(self, case, player):
+        result = LoadTestResult(case)
+        client = self.get_client(case, player)
+        for number in range(self.warmup + self.requests):
+            if case.mutates:
+                client = self.get_client(case, player)  # logout ends the session
+                with transaction.atomic():
+                    measured = self.request(client, case)
+                    transaction.set_rollback(True)
+            else:
+                measured = self.request(client, case)
+            if number >= self.warmup:
+                result.add(*measured)
+        return result
+
+    def run(self):
+        with transaction.atomic():
+            sample = get_sample()
+            player = sample['profile'].user
+            player.groups.add(Group.objects.get_or_create(name=roles.ADMIN_GROUP)[0])
+            sample['job'] = Job.objects.enqueue('find_games', title='game')
+            cases = get_cases(sample)
+            covered = {case.url_name for case in cases} | set(SKIPPED)
+            self.uncovered = [name for name in get_url_names() if name not in covered]
+            results = [self.run_case(case, player).as_dict() for case in cases]
+            transaction.set_rollback(True)
+        # cached values may have been computed from the rolled back data
+        invalidate_catalogue()
+        SiteStats.objects.invalidate()
+        roles.invalidate([player.pk])
+        return results
+
+    @staticmethod
+    def to_json(results):
+        return json.dumps({'results': results, 'skipped': SKIPPED}, indent=2)
@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+
+from games_app.models import Game
+from players_app.models import GameCard, PlayerRequest, Profile
+from players_app.synthetic import generate
+
+PAGE = 50
+
+
+class Command(BaseCommand):
+    help = ('Compare query plans and timings of the hot list queries with and without the query indexes '
+            'on a synthetic database. All data is generated inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=100000, help='Number of synthetic game cards.')
+        parser.add_argument('--games', type=int, default=5000, help='Number of synthetic games.')
+        parser.add_argument('--profiles', type=int, default=1000, help='Number of synthetic profiles.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query, the best one is reported.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    @staticmethod
+    def get_indexes():
+        return [(model, index) for model in (Game, GameCard, Profile, PlayerRequest) for index in model._meta.indexes]
+
+    @staticmethod
+    def get_query_shapes():
+        profile = Profile.objects.filter(is_private=False).annotate(cards=Count('gamecard')).order_by('-cards').first()
+        game = Game.objects.annotate(cards=Count('gamecard')).order_by('-cards').first()
+        return {
+            'game list page': Game.objects.all()[:PAGE],
+            'game list by letter': Game.objects.starts_with(letter='m')[:PAGE],
+            'profile game cards page': GameCard.objects.on_profile(profile=profile).select_related('game')[:PAGE],
+            'profile game cards by letter': GameCard.objects.on_profile(profile=profile).starts_with(letter='m')[:PAGE],
+            'public game cards of a game': (GameCard.objects.on_public_profiles(game=game)
+                                            .order_by('profile__user__username')[:PAGE]),
+            'finished count of a game': GameCard.objects.about_game(game=game).filter(is_finished=True),
+            'private profiles count': Profile.objects.filter(is_private=True),
+            'pending requests of a profile': PlayerRequest.objects.by_profile(profile=profile).pending(),
+            'pending requests page': PlayerRequest.objects.pending().order_by('-timestamp')[:PAGE],
+        }
+
+    def measure(self, repeat):
+        results = {}
+        for name, queryset in self.get_query_shapes().items():
+            count_only = name.endswith('count') or name.startswith('pending requests of')
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                queryset.count() if count_only else list(queryset.all())
+                timings.append(time.perf_counter() - start)
+            plan = queryset.order_by().values('pk').explain() if count_only else queryset.explain()
+            results[name] = (min(timings) * 1000, plan)
+        return results
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = generate(games=options['games'], profiles=options['profiles'], cards=options['cards'],
+                              seed=options['seed'])
+            self.stdout.write(', '.join(f'{count} {name}' for name, count in counts.items()) + ' generated.')
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+                after = self.measure(options['repeat'])
+                for model, index in self.get_indexes():
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+                cursor.execute('ANALYZE')
+                before = self.measure(options['repeat'])
+            transaction.set_rollback(True)
+
+        for name in after:
+            before_time, before_plan = before[name]
+            after_time, after_plan = after[name]
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {before_time:.2f} ms -> {after_time:.2f} ms'))
+            self.stdout.write(f'  before:\n    {before_plan.replace(chr(10), chr(10) + "    ")}')
+            self.stdout.write(f'  after:\n    {after_plan.replace(chr(10), chr(10) + "    ")}')
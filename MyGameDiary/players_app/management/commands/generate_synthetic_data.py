@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from players_app.synthetic import generate, rebuild_stats
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a synthetic dataset of games, franchises, genres, perspectives, profiles, '
+            'game cards and player requests, and rebuild the statistics.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=5000, help='Number of synthetic games.')
+        parser.add_argument('--profiles', type=int, default=1000, help='Number of synthetic profiles.')
+        parser.add_argument('--cards', type=int, default=100000, help='Number of synthetic game cards.')
+        parser.add_argument('--requests', type=int, default=2000, help='Number of synthetic player requests.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = generate(games=options['games'], profiles=options['profiles'], cards=options['cards'],
+                              requests=options['requests'], seed=options['seed'])
+            rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully generated ' + ', '.join(f'{count} {name}' for name, count in counts.items()) + '.'))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from players_app.loadtest import LoadTest, NoSampleData, SKIPPED
+
+
+class Command(BaseCommand):
+    help = ('Request every page of the site through the test client against the current database and report '
+            'p50/p95 latency, queries per request and bytes per response. '
+            'Fill an empty database with generate_synthetic_data first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help='Measured requests per page.')
+        parser.add_argument('--warmup', type=int, default=1, help='Unmeasured requests per page before measuring.')
+        parser.add_argument('--max-p95', type=float, help='Fail when a page has a higher p95 latency in ms.')
+        parser.add_argument('--max-queries', type=int, help='Fail when a page makes more queries per request.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        load_test = LoadTest(requests=max(1, options['requests']), warmup=max(0, options['warmup']))
+        try:
+            results = load_test.run()
+        except NoSampleData as error:
+            raise CommandError(f"{error} Run generate_synthetic_data first.")
+
+        if options['json']:
+            self.stdout.write(load_test.to_json(results))
+        else:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{'page':34} {'status':>8} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'bytes':>9}"))
+            for result in results:
+                status = ','.join(map(str, result['status']))
+                self.stdout.write(f"{result['label']:34} {status:>8} {result['p50_ms']:>9.2f} "
+                                  f"{result['p95_ms']:>9.2f} {result['queries']:>8} {result['bytes']:>9}")
+            for name, reason in SKIPPED.items():
+                self.stdout.write(f"Skipped {name}: {reason}.")
+        for name in load_test.uncovered:
+            self.stderr.write(f"No load test case for {name}.")
+
+        failures = []
+        for result in results:
+            if options['max_p95'] is not None and result['p95_ms'] > options['max_p95']:
+                failures.append(f"{result['label']}: p95 {result['p95_ms']} ms > {options['max_p95']} ms")
+            if options['max_queries'] is not None and result['queries'] > options['max_queries']:
+                failures.append(f"{result['label']}: {result['queries']} queries > {options['max_queries']}")
+        if failures:
+            raise CommandError('Load test budget exceeded:\n' + '\n'.join(failures))
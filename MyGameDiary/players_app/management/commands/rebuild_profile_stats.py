@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from players_app.models import ProfileStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized profile counters from scratch, or check them for drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report differences between stored and live counters.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            differences = ProfileStats.objects.drift()
+            for difference in differences:
+                self.stdout.write(difference)
+            if differences:
+                raise CommandError(f"Found {len(differences)} profile counter difference"
+                                   f"{'s' if len(differences) != 1 else ''}.")
+            self.stdout.write(self.style.SUCCESS('Profile counters are consistent.'))
+            return
+        count = ProfileStats.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt counters of {count} profile"
+                                             f"{'s' if count != 1 else ''}."))
@@ -0,0 +1,47 @@
+# Generated by Django 4.2 on 2026-10-18 07:52
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def build_profile_stats(apps, schema_editor):
+    Profile = apps.get_model('players_app', 'Profile')
+    ProfileStats = apps.get_model('players_app', 'ProfileStats')
+
+    profiles = Profile.objects.order_by().annotate(
+        live_total_gamecards=Count('gamecard'),
+        live_total_finished_games=Count('gamecard', filter=Q(gamecard__is_finished=True)),
+        live_total_hours=Coalesce(Sum('gamecard__hours_played'), 0),
+    )
+    ProfileStats.objects.bulk_create([
+        ProfileStats(profile_id=profile.pk,
+                     total_gamecards=profile.live_total_gamecards,
+                     total_finished_games=profile.live_total_finished_games,
+                     total_hours=profile.live_total_hours)
+        for profile in profiles
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('players_app', '0017_alter_gamecard_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileStats',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='players_app.profile')),
+                ('total_gamecards', models.PositiveIntegerField(default=0)),
+                ('total_finished_games', models.PositiveIntegerField(default=0)),
+                ('total_hours', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'profile stats',
+            },
+        ),
+        migrations.RunPython(build_profile_stats, migrations.RunPython.noop),
+    ]
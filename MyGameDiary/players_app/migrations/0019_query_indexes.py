@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('players_app', '0018_profilestats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gamecard',
+            index=models.Index(condition=models.Q(('is_finished', True)), fields=['game'], name='gamecard_game_finished_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gamecard',
+            index=models.Index(condition=models.Q(('is_finished', True)), fields=['profile'], name='gamecard_profile_finished_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerrequest',
+            index=models.Index(condition=models.Q(('active', True)), fields=['profile', '-timestamp'], name='request_profile_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerrequest',
+            index=models.Index(condition=models.Q(('active', True)), fields=['-timestamp'], name='request_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(condition=models.Q(('is_private', True)), fields=['user'], name='profile_private_idx'),
+        ),
+    ]
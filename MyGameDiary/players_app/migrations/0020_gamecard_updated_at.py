@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('players_app', '0019_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamecard',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
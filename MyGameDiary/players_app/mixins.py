@@ -2,11 +2,13 @@
 Mixins for managing authenticated access
 """
 
+from django.http import Http404
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.contrib.auth.mixins import UserPassesTestMixin
 from players_app.models import Profile, GameCard, PlayerRequest
+from players_app.roles import is_member_of
 
 
 class UserRightsMixin:
@@ -14,9 +16,7 @@ class UserRightsMixin:
 
     @staticmethod
     def is_member_of(user, group_names):
-        if 'All' in group_names:
-            return True
-        return user.groups.filter(name__in=group_names).exists()
+        return is_member_of(user, group_names)
 
     def get_context_rights(self, *args, **kwargs):
         context = {'user_has_rights': self.is_member_of(self.request.user, self.allowed_groups)}
@@ -42,13 +42,33 @@ class ProfileOwnershipRequiredMixin(UserPassesTestMixin):
         return redirect(reverse_lazy('homepage'))
 
 
-class GameCardOwnershipRequiredMixin(UserPassesTestMixin):
+class GameCardObjectMixin:
+    """
+    Fetch the game card of gamecard_pk once, together with its profile, user, game and franchise.
+    The permission check and the generic view's get_object() share the same instance.
+    """
+    gamecard = None
+
+    def get_gamecard(self):
+        if self.gamecard is None:
+            self.gamecard = (GameCard.objects.select_related('profile__user', 'game__franchise')
+                             .filter(pk=self.gamecard_pk).first())
+        return self.gamecard
+
+    def get_object(self, queryset=None):
+        gamecard = self.get_gamecard()
+        if gamecard is None:
+            raise Http404("Gamecard was not found in our database.")
+        return gamecard
+
+
+class GameCardOwnershipRequiredMixin(GameCardObjectMixin, UserPassesTestMixin):
     def test_func(self):
         user_profile = self.request.user.profile
         try:
-            gamecard = GameCard.objects.filter(pk=self.gamecard_pk).first()
+            gamecard = self.get_gamecard()
             if gamecard:
-                return user_profile.is_admin or gamecard in GameCard.objects.on_profile(profile=user_profile)
+                return gamecard.profile_id == user_profile.pk or user_profile.is_admin
             else:
                 messages.error(self.request, f"Gamecard was not found in our database.")
         except ValueError:
@@ -78,14 +98,14 @@ class ProfileNotPrivateRequiredMixin(UserPassesTestMixin):
         return redirect(reverse_lazy('homepage'))
 
 
-class GameCardNotPrivateRequiredMixin(UserPassesTestMixin):
+class GameCardNotPrivateRequiredMixin(GameCardObjectMixin, UserPassesTestMixin):
     def test_func(self):
         user_profile = self.request.user.profile
         try:
-            self.gamecard = GameCard.objects.filter(pk=self.gamecard_pk).first()
-            if self.gamecard:
-                return (user_profile.is_admin or self.gamecard.profile == user_profile
-                        or not self.gamecard.profile.is_private)
+            gamecard = self.get_gamecard()
+            if gamecard:
+                return (not gamecard.profile.is_private or gamecard.profile_id == user_profile.pk
+                        or user_profile.is_admin)
             else:
                 messages.error(self.request, f"Gamecard was not found in our database.")
         except ValueError:
@@ -1,10 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from datetime import datetime
 
-from django.db.models import Sum
+from django.db.models import Sum, Count, Q, F
+from django.db.models.functions import Coalesce, Lower
 
-from games_app.models import Game
+from games_app.models import Game, get_prefix_range
+from games_app.search import search_games
 
 
 class Profile(models.Model):
@@ -18,32 +20,49 @@ class Profile(models.Model):
 
     class Meta:
         ordering = ['user__username']
+        indexes = [
+            models.Index(fields=['user'], condition=Q(is_private=True), name='profile_private_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))  # used by statistics signals
+        return instance
+
     @property
     def first_letter(self):
         return self.user.username[0]
 
     @property
     def is_admin(self):
-        return self.user.groups.filter(name='Admin').exists()
+        from players_app.roles import is_admin
+        return is_admin(self.user)
+
+    def get_stats(self):
+        """
+        The materialized counters, computed and stored if the profile was inserted without signals
+        """
+        try:
+            return self.stats
+        except ProfileStats.DoesNotExist:
+            self.stats = ProfileStats.objects.create_missing(self)
+            return self.stats
 
     @property
     def total_gamecards(self):
-        return GameCard.objects.on_profile(profile=self).count()
+        return self.get_stats().total_gamecards
 
     @property
     def total_finished_games(self):
-        return GameCard.objects.on_profile(profile=self).filter(is_finished=True).count()
+        return self.get_stats().total_finished_games
 
     @property
     def total_hours(self):
-        hours = GameCard.objects.on_profile(profile=self).aggregate(Sum('hours_played'))['hours_played__sum']
-        if hours is None:
-            hours = 0
-        return hours
+        return self.get_stats().total_hours
 
     @property
     def associated_games(self):
@@ -55,6 +74,89 @@ class Profile(models.Model):
         return game_info
 
 
+"""
+ProfileStats Model
+materialized game card counters of a profile, kept current by GameCard signals
+"""
+
+PROFILE_STATS_FIELDS = ['total_gamecards', 'total_finished_games', 'total_hours']
+
+
+class ProfileStatsManager(models.Manager):
+    def apply(self, profile_id, **deltas):
+        """
+        Atomically add deltas (e.g. total_gamecards=1, total_hours=-5) to the counters of a profile
+        """
+        changes = {field: F(field) + deltas[field] for field in PROFILE_STATS_FIELDS if deltas.get(field)}
+        if changes:
+            self.filter(profile_id=profile_id).update(**changes)
+
+    def create_missing(self, profile):
+        """
+        Compute the counters of a profile from GameCard and store them
+        """
+        live = self.live_profiles().filter(pk=profile.pk).values(
+            *[f'live_{field}' for field in PROFILE_STATS_FIELDS]).order_by('pk').first() or {}
+        stats, created = self.get_or_create(
+            profile_id=profile.pk, defaults={field: live.get(f'live_{field}', 0) for field in PROFILE_STATS_FIELDS})
+        return stats
+
+    @staticmethod
+    def live_profiles():
+        return Profile.objects.order_by().annotate(
+            live_total_gamecards=Count('gamecard'),
+            live_total_finished_games=Count('gamecard', filter=Q(gamecard__is_finished=True)),
+            live_total_hours=Coalesce(Sum('gamecard__hours_played'), 0),
+        )
+
+    def rebuild(self):
+        """
+        Recompute counters of all profiles from scratch
+        """
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create([
+                ProfileStats(profile_id=profile.pk,
+                             **{field: getattr(profile, f'live_{field}') for field in PROFILE_STATS_FIELDS})
+                for profile in self.live_profiles()
+            ], batch_size=1000)
+        return self.count()
+
+    def drift(self):
+        """
+        Return a list of differences between stored and live counters
+        """
+        stored = {stats.profile_id: stats for stats in self.all()}
+        differences = []
+        for profile in self.live_profiles().select_related('user'):
+            stats = stored.pop(profile.pk, None)
+            if stats is None:
+                differences.append(f"{profile}: counters are missing")
+                continue
+            for field in PROFILE_STATS_FIELDS:
+                stored_value, live_value = getattr(stats, field), getattr(profile, f'live_{field}')
+                if stored_value != live_value:
+                    differences.append(f"{profile}: {field} is {stored_value}, should be {live_value}")
+        for profile_id in stored:
+            differences.append(f"Profile {profile_id}: counters exist for a missing profile")
+        return differences
+
+
+class ProfileStats(models.Model):
+    profile = models.OneToOneField(Profile, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_gamecards = models.PositiveIntegerField(default=0)
+    total_finished_games = models.PositiveIntegerField(default=0)
+    total_hours = models.PositiveIntegerField(default=0)
+
+    objects = ProfileStatsManager()
+
+    class Meta:
+        verbose_name_plural = 'profile stats'
+
+    def __str__(self):
+        return f"{self.profile} - {self.total_gamecards} game cards"
+
+
 """
 GameCard Model
 using GameCardManager for querying game cards
@@ -78,7 +180,39 @@ class GameCardQuerySet(models.QuerySet):
         return GameCard.objects.none()
 
     def starts_with(self, letter):
-        return self.filter(game__ordering_name__istartswith=letter)
+        if not letter:
+            return self.none()
+        lower, upper = get_prefix_range(letter)
+        return self.alias(folded_ordering_name=Lower('game__ordering_name')).filter(
+            folded_ordering_name__gte=lower, folded_ordering_name__lt=upper)
+
+    def matching(self, text):
+        """
+        Game cards of the games found by search_games(text)
+        """
+        return self.filter(game__in=search_games(text).values('pk'))
+
+    def for_display(self):
+        """
+        Join the game, its franchise and the owner read by game card lists and GameCard.__str__
+        """
+        return self.select_related('game__franchise', 'profile__user')
+
+    def pks_by_game(self):
+        """
+        Map game pk -> game card pk in a single query
+        """
+        return dict(self.values_list('game_id', 'pk'))
+
+    def totals(self):
+        """
+        Count game cards, finished games and played hours in a single query
+        """
+        return self.aggregate(
+            total_gamecards=Count('pk'),
+            total_finished=Count('pk', filter=Q(is_finished=True)),
+            total_hours=Coalesce(Sum('hours_played'), 0),
+        )
 
 
 class GameCardManager(models.Manager):
@@ -97,6 +231,15 @@ class GameCardManager(models.Manager):
     def starts_with(self, letter):
         return self.get_queryset().starts_with(letter)
 
+    def matching(self, text):
+        return self.get_queryset().matching(text)
+
+    def for_display(self):
+        return self.get_queryset().for_display()
+
+    def totals(self):
+        return self.get_queryset().totals()
+
 
 class GameCard(models.Model):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
@@ -106,16 +249,27 @@ class GameCard(models.Model):
     avatar_names = models.CharField(max_length=100, null=True, blank=True)
     review_link = models.URLField(null=True, blank=True)
     notes = models.TextField(max_length=1023, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = GameCardManager()
 
     class Meta:
         ordering = ['game__ordering_name', 'game__year', 'game__name']
         unique_together = (('profile', 'game'),)
+        indexes = [
+            models.Index(fields=['game'], condition=Q(is_finished=True), name='gamecard_game_finished_idx'),
+            models.Index(fields=['profile'], condition=Q(is_finished=True), name='gamecard_profile_finished_idx'),
+        ]
 
     def __str__(self):
         return f"{self.profile.user.username} - {self.game.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))  # used by statistics signals
+        return instance
+
     @property
     def associated_game_name(self):
         return self.game.name
@@ -149,6 +303,9 @@ class PlayerRequestQuerySet(models.QuerySet):
     def solved(self):
         return self.filter(active=False)
 
+    def for_display(self):
+        return self.select_related('profile__user')
+
 
 class PlayerRequestManager(models.Manager):
     def get_queryset(self):
@@ -163,6 +320,9 @@ class PlayerRequestManager(models.Manager):
     def solved(self):
         return self.get_queryset().solved()
 
+    def for_display(self):
+        return self.get_queryset().for_display()
+
 
 class PlayerRequest(models.Model):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
@@ -172,6 +332,12 @@ class PlayerRequest(models.Model):
 
     objects = PlayerRequestManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['profile', '-timestamp'], condition=Q(active=True), name='request_profile_active_idx'),
+            models.Index(fields=['-timestamp'], condition=Q(active=True), name='request_active_idx'),
+        ]
+
     def __str__(self):
         return f"{self.profile.user.username} - ({self.timestamp})"
 
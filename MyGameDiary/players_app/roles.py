@@ -0,0 +1,97 @@
+"""
+Role resolution
+A user's group names are loaded at most once per request and memoized on the user object.
+RoleCacheMiddleware keeps them in the session as well, stamped with a version stored in the cache
+that is replaced whenever the user's groups change, so later requests need no group query at all.
+The invalidation reaches other processes (web workers, run_jobs, shell) only through a shared cache
+(see CACHES), so with a per-process cache like locmem the session entry is never trusted.
+"""
+
+from uuid import uuid4
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+ADMIN_GROUP = 'Admin'
+SESSION_KEY = '_group_names'
+GLOBAL_VERSION_KEY = 'roles-version'  # replaced when a group is renamed or deleted
+USER_VERSION_KEY = 'roles-version:{}'
+
+
+def is_cache_shared():
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_version(user_id):
+    keys = [GLOBAL_VERSION_KEY, USER_VERSION_KEY.format(user_id)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid4().hex, timeout=None)
+            versions[key] = cache.get(key)
+    return ':'.join(str(versions[key]) for key in keys)
+
+
+def invalidate(user_ids=None):
+    """
+    Invalidate the cached group names of user_ids, or of all users
+    """
+    if user_ids is None:
+        cache.set(GLOBAL_VERSION_KEY, uuid4().hex, timeout=None)
+        return
+    cache.set_many({USER_VERSION_KEY.format(user_id): uuid4().hex for user_id in user_ids}, timeout=None)
+
+
+def set_group_names(user, group_names, version):
+    user._group_names = frozenset(group_names)
+    user._group_names_version = version
+
+
+def get_group_names(user):
+    if not user.is_authenticated:
+        return frozenset()
+    if getattr(user, '_group_names', None) is None:
+        version = get_version(user.pk)  # read before the query, so a concurrent change makes it stale
+        set_group_names(user, user.groups.values_list('name', flat=True), version)
+    return user._group_names
+
+
+def is_member_of(user, group_names):
+    if 'All' in group_names:
+        return True
+    return not get_group_names(user).isdisjoint(group_names)
+
+
+def is_admin(user):
+    return ADMIN_GROUP in get_group_names(user)
+
+
+class RoleCacheMiddleware:
+    """
+    Restore the group names of the logged user from the session and store them there once loaded.
+    Does nothing unless the cache is shared by all processes.
+    Has to follow SessionMiddleware and AuthenticationMiddleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_cache_shared():
+            return self.get_response(request)
+
+        user = request.user
+        if user.is_authenticated:
+            cached = request.session.get(SESSION_KEY)
+            version = get_version(user.pk)
+            if cached and cached[0] == version:
+                set_group_names(user, cached[1], version)
+
+        response = self.get_response(request)
+
+        user = request.user  # login() and logout() replace the user
+        if user.is_authenticated and getattr(user, '_group_names', None) is not None:
+            cached = [user._group_names_version, sorted(user._group_names)]
+            if request.session.get(SESSION_KEY) != cached:
+                request.session[SESSION_KEY] = cached
+        return response
@@ -0,0 +1,140 @@
+"""
+Signal receivers keeping the materialized game, profile and site statistics current
+and invalidating cached user roles
+"""
+
+from django.db import transaction
+from django.db.models import F
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from games_app.cache import invalidate_catalogue
+from games_app.models import GameStats, SiteStats
+from players_app import roles
+from players_app.models import Profile, ProfileStats, GameCard
+
+GAMECARD_STATS_FIELDS = ['game_id', 'profile_id', 'is_finished', 'hours_played']
+
+
+def get_profile_is_private(profile_id, gamecard=None):
+    if gamecard is not None and GameCard.profile.is_cached(gamecard):
+        return gamecard.profile.is_private
+    return Profile.objects.filter(pk=profile_id).values_list('is_private', flat=True).first()
+
+
+def get_gamecard_deltas(is_private, is_finished, hours_played, sign=1):
+    """
+    Contribution of a single game card to the statistics (sign=-1 to remove it)
+    """
+    return {'total_gamecards': sign,
+            'public_gamecards': 0 if is_private else sign,
+            'total_finished': sign if is_finished else 0,
+            'total_hours': sign * hours_played}
+
+
+def merge_deltas(first, second):
+    return {field: first.get(field, 0) + second.get(field, 0) for field in first.keys() | second.keys()}
+
+
+def apply_gamecard_deltas(game_id, profile_id, deltas):
+    GameStats.objects.apply(game_id, **deltas)
+    ProfileStats.objects.apply(profile_id,
+                               total_gamecards=deltas['total_gamecards'],
+                               total_finished_games=deltas['total_finished'],
+                               total_hours=deltas['total_hours'])
+    SiteStats.objects.apply(**deltas)
+
+
+@receiver(pre_save, sender=GameCard)
+def remember_previous_gamecard(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding or hasattr(instance, '_loaded_values'):
+        return
+    instance._loaded_values = GameCard.objects.filter(pk=instance.pk).values(*GAMECARD_STATS_FIELDS).first()
+
+
+@receiver(post_save, sender=GameCard)
+def update_stats_on_gamecard_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_values', None)
+    is_private = get_profile_is_private(instance.profile_id, instance)
+    new_deltas = get_gamecard_deltas(is_private, instance.is_finished, instance.hours_played)
+    with transaction.atomic():
+        if created or previous is None:
+            apply_gamecard_deltas(instance.game_id, instance.profile_id, new_deltas)
+        else:
+            previous_is_private = (is_private if previous['profile_id'] == instance.profile_id
+                                   else get_profile_is_private(previous['profile_id']))
+            old_deltas = get_gamecard_deltas(previous_is_private, previous['is_finished'],
+                                             previous['hours_played'], sign=-1)
+            if previous['game_id'] == instance.game_id and previous['profile_id'] == instance.profile_id:
+                apply_gamecard_deltas(instance.game_id, instance.profile_id, merge_deltas(old_deltas, new_deltas))
+            else:
+                apply_gamecard_deltas(previous['game_id'], previous['profile_id'], old_deltas)
+                apply_gamecard_deltas(instance.game_id, instance.profile_id, new_deltas)
+    instance._loaded_values = {field: getattr(instance, field) for field in GAMECARD_STATS_FIELDS}
+
+
+@receiver(post_delete, sender=GameCard)
+def update_stats_on_gamecard_delete(sender, instance, **kwargs):
+    is_private = get_profile_is_private(instance.profile_id, instance)
+    with transaction.atomic():
+        apply_gamecard_deltas(instance.game_id, instance.profile_id,
+                              get_gamecard_deltas(is_private, instance.is_finished, instance.hours_played, sign=-1))
+
+
+@receiver(post_save, sender=Profile)
+def update_stats_on_profile_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_values', None)
+    with transaction.atomic():
+        if created:
+            ProfileStats.objects.get_or_create(profile=instance)
+            SiteStats.objects.apply(total_profiles=1, total_private=1 if instance.is_private else 0)
+        elif previous is not None and 'is_private' in previous and previous['is_private'] != instance.is_private:
+            sign = -1 if instance.is_private else 1
+            games_pk = GameCard.objects.on_profile(profile=instance).values('game_id')
+            GameStats.objects.filter(game_id__in=games_pk).update(public_gamecards=F('public_gamecards') + sign)
+            SiteStats.objects.apply(total_private=-sign)
+            invalidate_catalogue()  # public game card counts changed
+    instance._loaded_values = {'is_private': instance.is_private}
+
+
+@receiver(post_delete, sender=Profile)
+def update_stats_on_profile_delete(sender, instance, **kwargs):
+    SiteStats.objects.apply(total_profiles=-1, total_private=-1 if instance.is_private else 0)
+
+
+# ************************************* Catalogue cache *************************************
+
+
+@receiver(post_save, sender=GameCard)
+@receiver(post_delete, sender=GameCard)
+@receiver(post_delete, sender=Profile)
+def invalidate_catalogue_on_gamecard_change(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_catalogue()
+
+
+# ************************************* Roles *************************************
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        roles.invalidate([instance.pk])
+    elif pk_set:
+        roles.invalidate(pk_set)
+    else:  # all users removed from the group
+        roles.invalidate()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_roles(sender, instance, created=False, **kwargs):
+    if not created:
+        roles.invalidate()
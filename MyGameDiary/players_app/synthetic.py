@@ -0,0 +1,109 @@
+"""
+Synthetic catalogue and player data for benchmarks
+Rows are written with bulk_create, so no signals run and the materialized statistics are not updated
+until rebuild_stats() is called.
+"""
+
+import random
+from string import ascii_lowercase
+
+from django.contrib.auth.models import User
+from django.db.models import Max
+
+from games_app.cache import invalidate_catalogue
+from games_app.models import Franchise, Game, GameStats, Genre, Perspective, SiteStats
+from players_app.models import GameCard, PlayerRequest, Profile, ProfileStats
+
+BATCH_SIZE = 1000
+SYNTHETIC_PREFIX = 'synthetic'
+GENRES = 10
+PERSPECTIVES = 3
+
+
+def get_next_id(model):
+    return (model.objects.aggregate(max_id=Max('pk'))['max_id'] or 0) + 1
+
+
+def get_or_create_names(model, count):
+    """
+    Return the existing genres or perspectives, creating `count` synthetic ones in an empty table
+    """
+    objects = list(model.objects.all())
+    if not objects:
+        name = model._meta.verbose_name
+        objects = model.objects.bulk_create([model(name=f'{SYNTHETIC_PREFIX} {name} {number}')
+                                             for number in range(count)])
+    return objects
+
+
+def assign_many(related, games, choices, most, generator):
+    """
+    Link every game to 1 to `most` random choices through the m2m table of the `related` descriptor
+    """
+    through = related.through
+    links = [through(**{'game_id': game.pk, related.field.m2m_reverse_name(): choice.pk})
+             for game in games
+             for choice in generator.sample(choices, generator.randint(1, min(most, len(choices))))]
+    through.objects.bulk_create(links, batch_size=BATCH_SIZE)
+    return len(links)
+
+
+def generate(games=5000, profiles=1000, cards=100000, requests=2000, seed=0):
+    """
+    Create games (a tenth of them in franchises, each with genres and perspectives), profiles (a tenth private),
+    about `cards` game cards spread over the profiles, and player requests. Returns a dict of created row counts.
+    """
+    generator = random.Random(seed)
+
+    franchise_id = get_next_id(Franchise)
+    franchises = [Franchise(id=franchise_id + number, name=f'{SYNTHETIC_PREFIX} franchise {number}')
+                  for number in range(max(1, games // 100))]
+    Franchise.objects.bulk_create(franchises, batch_size=BATCH_SIZE)
+
+    game_id = get_next_id(Game)
+    game_objects = []
+    for number in range(games):
+        name = f'{generator.choice(ascii_lowercase)}{SYNTHETIC_PREFIX} game {number}'
+        franchise = generator.choice(franchises) if number % 10 == 0 else None
+        game_objects.append(Game(id=game_id + number, name=name,
+                                 ordering_name=franchise.name if franchise else name,
+                                 cover_url='https://example.com/cover.jpg', year=generator.randint(1980, 2024),
+                                 franchise=franchise))
+    Game.objects.bulk_create(game_objects, batch_size=BATCH_SIZE)
+    if game_objects:
+        assign_many(Game.genres, game_objects, get_or_create_names(Genre, GENRES), 3, generator)
+        assign_many(Game.perspectives, game_objects, get_or_create_names(Perspective, PERSPECTIVES), 2,
+                    generator)
+
+    user_id = get_next_id(User)
+    users = [User(id=user_id + number, username=f'{SYNTHETIC_PREFIX}-{user_id + number}', password='!')
+             for number in range(profiles)]
+    User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+    profile_objects = [Profile(user=user, is_private=number % 10 == 0) for number, user in enumerate(users)]
+    Profile.objects.bulk_create(profile_objects, batch_size=BATCH_SIZE)
+
+    per_profile = min(games, cards // max(1, profiles))
+    gamecards = []
+    for profile in profile_objects:
+        for game in generator.sample(game_objects, per_profile):
+            gamecards.append(GameCard(profile=profile, game=game, is_finished=generator.random() < 0.4,
+                                      hours_played=generator.randint(0, 200)))
+    GameCard.objects.bulk_create(gamecards, batch_size=BATCH_SIZE)
+
+    player_requests = [PlayerRequest(profile=generator.choice(profile_objects), text='Please add a game.',
+                                     active=generator.random() < 0.3)
+                       for _ in range(requests if profile_objects else 0)]
+    PlayerRequest.objects.bulk_create(player_requests, batch_size=BATCH_SIZE)
+
+    return {'franchises': len(franchises), 'games': len(game_objects), 'profiles': len(profile_objects),
+            'gamecards': len(gamecards), 'requests': len(player_requests)}
+
+
+def rebuild_stats():
+    """
+    Bring the materialized statistics and the catalogue cache up to date after generate()
+    """
+    GameStats.objects.rebuild()
+    ProfileStats.objects.rebuild()
+    SiteStats.objects.rebuild()
+    invalidate_catalogue()
@@ -1,3 +1,317 @@
-from django.test import TestCase
+import json
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from games_app.models import Franchise, Game, Genre, SiteStats
+from players_app import roles
+from players_app.models import GameCard, PlayerRequest, Profile, ProfileStats
+
+
+class ProfileStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='player')
+        cls.profile = Profile.objects.create(user=cls.user)
+        cls.games = [Game.objects.create(id=number, name=f'Game {number}', cover_url='https://example.com/cover.jpg',
+                                         year=2000) for number in range(1, 4)]
+
+    @classmethod
+    def add_profiles(cls, count):
+        start = Profile.objects.count()
+        for number in range(start, start + count):
+            profile = Profile.objects.create(user=User.objects.create_user(username=f'player{number}'),
+                                             is_private=number % 4 == 0)
+            for game in cls.games[:number % 3 + 1]:
+                GameCard.objects.create(profile=profile, game=game, is_finished=bool(number % 2), hours_played=2)
+
+    def test_counters_follow_gamecard_changes(self):
+        gamecard = GameCard.objects.create(profile=self.profile, game=self.games[0], hours_played=4)
+        GameCard.objects.create(profile=self.profile, game=self.games[1], is_finished=True, hours_played=6)
+        profile = Profile.objects.get(pk=self.profile.pk)
+        self.assertEqual((profile.total_gamecards, profile.total_finished_games, profile.total_hours), (2, 1, 10))
+
+        gamecard.delete()
+        profile = Profile.objects.get(pk=self.profile.pk)
+        self.assertEqual((profile.total_gamecards, profile.total_finished_games, profile.total_hours), (1, 1, 6))
+        self.assertEqual(ProfileStats.objects.drift(), [])
+
+    def test_missing_counters_are_computed(self):
+        GameCard.objects.create(profile=self.profile, game=self.games[0], is_finished=True, hours_played=4)
+        ProfileStats.objects.filter(profile=self.profile).delete()  # as if the profile was inserted without signals
+        profile = Profile.objects.select_related('stats').get(pk=self.profile.pk)
+        self.assertEqual((profile.total_gamecards, profile.total_finished_games, profile.total_hours), (1, 1, 4))
+        self.assertEqual(ProfileStats.objects.drift(), [])
+
+    def test_profile_list_query_count_is_flat(self):
+        self.client.force_login(self.user)
+        self.add_profiles(3)
+        self.client.get(reverse('players_app:profile_list'))  # the first request caches the user's groups
+        SiteStats.objects.invalidate()
+        with CaptureQueriesContext(connection) as few_profiles:
+            self.client.get(reverse('players_app:profile_list'))
+        self.add_profiles(30)
+        with CaptureQueriesContext(connection) as many_profiles:
+            response = self.client.get(reverse('players_app:profile_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(few_profiles.captured_queries), len(many_profiles.captured_queries))
+
+    def test_rebuild_profile_stats_command(self):
+        GameCard.objects.create(profile=self.profile, game=self.games[0], hours_played=4)
+        ProfileStats.objects.filter(profile=self.profile).update(total_hours=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_profile_stats', '--check', stdout=StringIO())
+        call_command('rebuild_profile_stats', stdout=StringIO())
+        self.assertEqual(Profile.objects.get(pk=self.profile.pk).total_hours, 4)
+        call_command('rebuild_profile_stats', '--check', stdout=StringIO())
+
+
+class QueryIndexesTest(TestCase):
+    def test_starts_with_is_case_insensitive(self):
+        profile = Profile.objects.create(user=User.objects.create_user(username='player'))
+        for number, name in enumerate(['Mass Effect', 'mafia', 'Zelda', 'Max Payne'], start=1):
+            game = Game.objects.create(id=number, name=name, ordering_name=name,
+                                       cover_url='https://example.com/cover.jpg', year=2000)
+            GameCard.objects.create(profile=profile, game=game)
+        self.assertEqual(sorted(Game.objects.starts_with(letter='M').values_list('name', flat=True)),
+                         ['Mass Effect', 'Max Payne', 'mafia'])
+        self.assertEqual(GameCard.objects.on_profile(profile=profile).starts_with(letter='ma').count(), 3)
+        self.assertEqual(GameCard.objects.on_profile(profile=profile).starts_with(letter='MAX').count(), 1)
+
+    def test_benchmark_indexes_command_rolls_back(self):
+        output = StringIO()
+        call_command('benchmark_indexes', '--cards', '200', '--games', '50', '--profiles', '20', '--repeat', '1',
+                     stdout=output)
+        self.assertIn('game list by letter', output.getvalue())
+        self.assertFalse(Game.objects.exists())
+        self.assertFalse(Profile.objects.exists())
+
+
+class RolesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_group = Group.objects.create(name='Admin')
+        cls.user = User.objects.create_user(username='admin')
+        cls.user.groups.add(cls.admin_group)
+        cls.profile = Profile.objects.create(user=cls.user)
+
+    def get_with_group_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, len([query for query in queries.captured_queries if 'auth_user_groups' in query['sql']])
+
+    def use_shared_cache(self):
+        """
+        A file based cache in a temporary directory, shared by all its instances like by all processes
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name}})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return directory.name
+
+    def test_groups_are_loaded_once_and_cached_in_session(self):
+        self.use_shared_cache()
+        self.client.force_login(self.user)
+        url = reverse('games_app:game_add')
+        response, group_queries = self.get_with_group_queries(url)
+        self.assertTrue(response.context['user_has_rights'])
+        self.assertEqual(group_queries, 1)
+
+        response, group_queries = self.get_with_group_queries(url)
+        self.assertTrue(response.context['user_has_rights'])
+        self.assertEqual(group_queries, 0)
+
+    def test_groups_are_not_cached_in_session_with_a_per_process_cache(self):
+        self.client.force_login(self.user)
+        url = reverse('games_app:game_add')
+        for _ in range(2):
+            response, group_queries = self.get_with_group_queries(url)
+            self.assertTrue(response.context['user_has_rights'])
+            self.assertEqual(group_queries, 1)
+
+    def assertRevocationIsSeen(self, other_process_cache):
+        self.client.force_login(self.user)
+        url = reverse('games_app:game_add')
+        self.client.get(url)
+        self.assertTrue(self.client.get(url).context['user_has_rights'])
+        with mock.patch.object(roles, 'cache', other_process_cache):
+            self.user.groups.remove(self.admin_group)
+        self.assertFalse(self.client.get(url).context['user_has_rights'])
+
+    def test_revocation_in_another_process_is_seen_through_a_shared_cache(self):
+        self.assertRevocationIsSeen(FileBasedCache(self.use_shared_cache(), {}))
+
+    def test_revocation_in_another_process_is_seen_with_a_per_process_cache(self):
+        self.assertRevocationIsSeen(LocMemCache('other-process', {}))
+
+    def test_membership_change_invalidates_cached_groups(self):
+        self.use_shared_cache()
+        self.client.force_login(self.user)
+        url = reverse('games_app:game_add')
+        self.client.get(url)
+        self.user.groups.remove(self.admin_group)
+        response, group_queries = self.get_with_group_queries(url)
+        self.assertFalse(response.context['user_has_rights'])
+        self.assertEqual(group_queries, 1)
+
+        self.admin_group.user_set.add(self.user)
+        response, group_queries = self.get_with_group_queries(url)
+        self.assertTrue(response.context['user_has_rights'])
+
+
+class GameCardAccessTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='player')
+        cls.profile = Profile.objects.create(user=cls.user)
+        cls.owner = Profile.objects.create(user=User.objects.create_user(username='owner'), is_private=True)
+        game = Game.objects.create(id=1, name='Game', cover_url='https://example.com/cover.jpg', year=2000)
+        cls.gamecard = GameCard.objects.create(profile=cls.owner, game=game, hours_played=3)
+
+    def get_gamecard_queries(self, url_name, user):
+        self.client.force_login(user)
+        self.client.get(reverse('homepage'))  # caches the user's groups in the session
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name, kwargs={'pk': self.gamecard.pk}))
+        return response, [query['sql'] for query in queries.captured_queries
+                          if 'players_app_gamecard' in query['sql'] or 'games_app_game' in query['sql']]
+
+    def test_owner_pages_fetch_the_game_card_once(self):
+        for url_name in ('players_app:gamecard_detail', 'players_app:gamecard_update', 'players_app:gamecard_delete'):
+            response, queries = self.get_gamecard_queries(url_name, self.owner.user)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['gamecard'], self.gamecard)
+            self.assertEqual(len(queries), 1, url_name)
+
+    def test_private_game_card_is_refused_to_other_players(self):
+        for url_name in ('players_app:gamecard_detail', 'players_app:gamecard_update', 'players_app:gamecard_delete'):
+            response, queries = self.get_gamecard_queries(url_name, self.user)
+            self.assertRedirects(response, reverse('homepage'), fetch_redirect_response=False)
+            self.assertEqual(len(queries), 1, url_name)
+
+    def test_delete_removes_the_game_card(self):
+        self.client.force_login(self.owner.user)
+        response = self.client.post(reverse('players_app:gamecard_delete', kwargs={'pk': self.gamecard.pk}))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(GameCard.objects.filter(pk=self.gamecard.pk).exists())
+
+
+class DisplayQuerysetsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin')
+        cls.admin.groups.add(Group.objects.create(name='Admin'))
+        cls.profile = Profile.objects.create(user=cls.admin)
+        cls.franchise = Franchise.objects.create(id=1, name='Franchise')
+
+    def add_rows(self, count):
+        start = Game.objects.count()
+        for number in range(start, start + count):
+            game = Game.objects.create(id=number + 1, name=f'Game {number}', ordering_name=f'game {number}',
+                                       cover_url='https://example.com/cover.jpg', year=2000,
+                                       franchise=self.franchise if number % 2 else None)
+            GameCard.objects.create(profile=self.profile, game=game)
+            player = Profile.objects.create(user=User.objects.create_user(username=f'player{number}'))
+            PlayerRequest.objects.create(profile=player, text=f'Please add game {number}.')
+
+    def assertFlatQueryCount(self, url):
+        self.client.force_login(self.admin)
+        self.add_rows(2)
+        self.client.get(url)  # caches the user's groups in the session
+        with CaptureQueriesContext(connection) as few_rows:
+            self.client.get(url)
+        self.add_rows(10)
+        with CaptureQueriesContext(connection) as many_rows:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(few_rows.captured_queries), len(many_rows.captured_queries))
+
+    def test_profile_page(self):
+        self.assertFlatQueryCount(reverse('players_app:profile', kwargs={'pk': self.profile.pk}) + '?display=all')
+
+    def test_profile_search_covers_every_page(self):
+        self.client.force_login(self.admin)
+        self.add_rows(12)
+        url = reverse('players_app:profile', kwargs={'pk': self.profile.pk})
+        first_page = self.client.get(url, {'display': 'all', 'size': 5})
+        self.assertNotIn('Game 9', [gamecard.game.name for gamecard in first_page.context['gamecards']])
+
+        response = self.client.get(url, {'display': 'all', 'size': 5, 'q': '9'})
+        self.assertEqual([gamecard.game.name for gamecard in response.context['gamecards']], ['Game 9'])
+        self.assertContains(response, 'value="9"')
+
+        response = self.client.get(url, {'display': 'all', 'size': 5, 'q': 'franchise'})
+        self.assertEqual(len(response.context['gamecards']), 5)
+        next_page = self.client.get(url + '?' + response.context['page_obj'].next_querystring)
+        self.assertEqual([gamecard.game.name for gamecard in next_page.context['gamecards']], ['Game 9'])
+
+    def test_request_list(self):
+        self.assertFlatQueryCount(reverse('players_app:request_list'))
+
+    def test_game_detail_prefetches_genres_and_perspectives(self):
+        game = Game.objects.create(id=100, name='Game', cover_url='https://example.com/cover.jpg', year=2000)
+        game.genres.add(Genre.objects.create(name='RPG'), Genre.objects.create(name='Shooter'))
+        game = Game.objects.for_detail().get(pk=game.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(game.get_genres_names(), 'RPG, Shooter')
+            self.assertEqual(game.get_perspectives_names(), '---')
+
+
+class HomePageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_homepage_counters_come_from_the_cache(self):
+        profile = Profile.objects.create(user=User.objects.create_user(username='player'))
+        game = Game.objects.create(id=1, name='Game', cover_url='https://example.com/cover.jpg', year=2000)
+        GameCard.objects.create(profile=profile, game=game)
+        response = self.client.get(reverse('homepage'))
+        self.assertEqual((response.context['total_games'], response.context['total_players'],
+                          response.context['total_gamecards']), (1, 1, 1))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('homepage'))
+
+        GameCard.objects.all().delete()
+        self.assertEqual(self.client.get(reverse('homepage')).context['total_gamecards'], 0)
+
+
+class LoadTestTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_load_test_without_data_fails(self):
+        with self.assertRaises(CommandError):
+            call_command('load_test', stdout=StringIO())
+
+    def test_load_test_covers_every_page_and_rolls_back(self):
+        call_command('generate_synthetic_data', '--games', '30', '--profiles', '10', '--cards', '100',
+                     '--requests', '5', stdout=StringIO())
+        self.assertTrue(Game.objects.filter(genres__isnull=False).exists())
+        self.assertEqual(SiteStats.objects.get().total_gamecards, GameCard.objects.count())
+        counts = (GameCard.objects.count(), PlayerRequest.objects.pending().count(), Group.objects.count())
+
+        output = StringIO()
+        errors = StringIO()
+        call_command('load_test', '--requests', '2', '--json', stdout=output, stderr=errors)
+        results = json.loads(output.getvalue())['results']
+        self.assertEqual(errors.getvalue(), '')
+        self.assertIn('gamecard update', [result['label'] for result in results])
+        self.assertTrue(all(result['status'][0] < 400 for result in results))
+        self.assertEqual((GameCard.objects.count(), PlayerRequest.objects.pending().count(), Group.objects.count()),
+                         counts)
+
+        with self.assertRaises(CommandError):
+            call_command('load_test', '--requests', '1', '--max-queries', '0', stdout=StringIO())
@@ -1,4 +1,5 @@
 from django.db import IntegrityError
+from django.db.models import Count, Max, Q
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
 from django.views.generic import FormView, RedirectView, CreateView, ListView, DetailView, UpdateView, DeleteView
@@ -9,11 +10,12 @@ from players_app.mixins import (AnonymousRequiredMixin, ProfileOwnershipRequired
                                 GameCardOwnershipRequiredMixin, GameCardNotPrivateRequiredMixin, UserRightsMixin,
                                 LimitPendingRequestsMixin)
 
+from MyGameDiary.pagination import KeysetPaginationMixin
+from games_app.cache import ConditionalGetMixin, get_stamps
 from players_app.forms import PlayerRegistrationForm, PlayerAuthenticationForm, GameCardForm, RequestForm
 from players_app.models import GameCard, Profile, PlayerRequest
-from games_app.models import Game
+from games_app.models import Game, SiteStats
 
-from django.db.models import Sum
 from string import ascii_lowercase
 
 
@@ -111,11 +113,11 @@ class PlayerRequestListView(LoginRequiredMixin, UserRightsMixin, ListView):
     def get_queryset(self):
         display = self.request.GET.get('display')
         if display == 'active':
-            return PlayerRequest.objects.pending().order_by('-timestamp')
+            return PlayerRequest.objects.for_display().pending().order_by('-timestamp')
         elif display == 'solved':
-            return PlayerRequest.objects.solved().order_by('-timestamp')
+            return PlayerRequest.objects.for_display().solved().order_by('-timestamp')
         else:
-            return PlayerRequest.objects.all().order_by('-timestamp')
+            return PlayerRequest.objects.for_display().order_by('-timestamp')
 
 
 class PlayerRequestSwitchView(LoginRequiredMixin, UserRightsMixin, RedirectView):
@@ -145,7 +147,8 @@ class PlayerRequestSwitchView(LoginRequiredMixin, UserRightsMixin, RedirectView)
         return super().get(*args, **kwargs)
 
 
-class ProfileView(LoginRequiredMixin, ProfileNotPrivateRequiredMixin, ListView):
+class ProfileView(LoginRequiredMixin, ProfileNotPrivateRequiredMixin, ConditionalGetMixin, KeysetPaginationMixin,
+                  ListView):
     model = GameCard
     template_name = 'profile.html'
     login_url = reverse_lazy('players_app:user_login')
@@ -157,23 +160,37 @@ class ProfileView(LoginRequiredMixin, ProfileNotPrivateRequiredMixin, ListView):
         self.profile_pk = self.kwargs['pk']
         return super().dispatch(*args, **kwargs)
 
+    def get_etag_parts(self):
+        """
+        The profile's game cards with their games, and the profile's privacy
+        """
+        stamps = get_stamps(GameCard.objects.filter(profile_id=self.profile_pk), updated=Max('updated_at'),
+                            games_updated=Max('game__updated_at'))
+        is_private = Profile.objects.filter(pk=self.profile_pk).values_list('is_private', flat=True).first()
+        return [*stamps.values(), is_private]
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['profile'] = self.profile
-        context['total_gamecards'] = GameCard.objects.on_profile(self.profile).count()
+        context['total_gamecards'] = self.profile.total_gamecards if self.profile else 0
 
         context['letters'] = ascii_lowercase
         context['display'] = self.request.GET.get('display')
+        context['search_query'] = self.request.GET.get('q', '').strip()
         return context
 
     def get_queryset(self):
         display = self.request.GET.get('display')
+        query = self.request.GET.get('q', '').strip()
         try:
-            self.profile = Profile.objects.filter(pk=self.profile_pk).first()
+            self.profile = Profile.objects.select_related('user', 'stats').filter(pk=self.profile_pk).first()
             if self.profile:
+                gamecards = GameCard.objects.for_display().on_profile(profile=self.profile)
+                if query:  # search all the profile's game cards, not only the current page or letter
+                    return gamecards.matching(query)
                 if display == 'all':
-                    return GameCard.objects.on_profile(profile=self.profile)
-                return GameCard.objects.on_profile(profile=self.profile).starts_with(letter=display)
+                    return gamecards
+                return gamecards.starts_with(letter=display)
             else:
                 messages.error(self.request, f"Profile was not found in our database.")
         except ValueError:
@@ -218,15 +235,17 @@ class ProfileListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_profiles'] = Profile.objects.all().count()
-        context['total_private'] = Profile.objects.filter(is_private=True).count()
-        context['total_gamecards'] = GameCard.objects.count()
-        context['total_finished'] = GameCard.objects.filter(is_finished=True).count()
-        context['total_hours'] = GameCard.objects.aggregate(Sum('hours_played'))['hours_played__sum']
+        site_stats = SiteStats.objects.cached()
+        context['total_profiles'] = site_stats.total_profiles
+        context['total_private'] = site_stats.total_private
+        context['total_gamecards'] = site_stats.total_gamecards
+        context['total_finished'] = site_stats.total_finished
+        context['total_hours'] = site_stats.total_hours
+        context['user_is_admin'] = self.request.user.profile.is_admin
         return context
 
     def get_queryset(self):
-        return Profile.objects.select_related('user')
+        return Profile.objects.select_related('user', 'stats')
 
 
 class GameCardCreateView(LoginRequiredMixin, ProfileOwnershipRequiredMixin, RedirectView):
@@ -259,7 +278,7 @@ class GameCardCreateView(LoginRequiredMixin, ProfileOwnershipRequiredMixin, Redi
         return reverse_lazy('games_app:game_list') + '?display=all'
 
 
-class GameCardDetailView(LoginRequiredMixin, GameCardNotPrivateRequiredMixin, DetailView):
+class GameCardDetailView(LoginRequiredMixin, GameCardNotPrivateRequiredMixin, ConditionalGetMixin, DetailView):
     model = GameCard
     template_name = 'gamecard-detail.html'
     login_url = reverse_lazy('players_app:user_login')
@@ -270,6 +289,13 @@ class GameCardDetailView(LoginRequiredMixin, GameCardNotPrivateRequiredMixin, De
         self.gamecard_pk = kwargs['pk']
         return super().dispatch(*args, **kwargs)
 
+    def get_etag_parts(self):
+        """
+        The game card and its game, fetched already by the access check
+        """
+        gamecard = self.get_gamecard()
+        return [gamecard.updated_at, gamecard.game.updated_at] if gamecard else [None]
+
 
 class GameCardUpdateView(LoginRequiredMixin, GameCardOwnershipRequiredMixin, UpdateView):
     model = GameCard
@@ -298,10 +324,10 @@ class GameCardDeleteView(LoginRequiredMixin, GameCardOwnershipRequiredMixin, Del
 
     def dispatch(self, *args, **kwargs):
         self.gamecard_pk = self.kwargs['pk']
-        self.game_name = GameCard.objects.filter(pk=self.gamecard_pk).first().associated_game_name
         return super().dispatch(*args, **kwargs)
 
     def post(self, *args, **kwargs):
+        self.game_name = self.get_gamecard().associated_game_name
         messages.warning(self.request, f"{self.game_name} was removed from your profile.")
         return super().post(*args, **kwargs)
 
@@ -309,19 +335,31 @@ class GameCardDeleteView(LoginRequiredMixin, GameCardOwnershipRequiredMixin, Del
         return reverse_lazy('players_app:profile', kwargs={'pk': self.request.user.profile.pk}) + '?display=all'
 
 
-class GameCardListByGameView(LoginRequiredMixin, ListView):
+class GameCardListByGameView(LoginRequiredMixin, ConditionalGetMixin, KeysetPaginationMixin, ListView):
     model = GameCard
     template_name = 'gamecard-list-by-game.html'
     login_url = reverse_lazy('players_app:user_login')
     context_object_name = 'gamecards'
+    keyset_ordering = ['profile__user__username']
     game = None
 
+    def get_etag_parts(self):
+        """
+        The game, its game cards on public profiles and the viewer's game card of it
+        """
+        public = Q(gamecard__profile__is_private=False)
+        return list(get_stamps(Game.objects.filter(pk=self.kwargs['game_pk']), updated=Max('updated_at'),
+                               public_gamecards=Count('gamecard', filter=public),
+                               gamecards_updated=Max('gamecard__updated_at', filter=public),
+                               gamecard=Max('gamecard__pk', filter=Q(gamecard__profile=self.request.user.pk))).values())
+
     def get_queryset(self):
         game_pk = self.kwargs['game_pk']
         try:
             self.game = Game.objects.filter(pk=game_pk).first()
             if self.game:
-                return GameCard.objects.on_public_profiles(game=self.game).order_by('profile__user__username')
+                return (GameCard.objects.for_display().on_public_profiles(game=self.game)
+                        .order_by('profile__user__username'))
             else:
                 messages.error(self.request, f"Game was not found in our database.")
         except ValueError: